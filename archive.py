@@ -0,0 +1,161 @@
+"""Append-only archive of every parsed feed item, for backfilling new filters and replaying feeds offline.
+
+Records are JSON lines, one per listing, in gzip segments partitioned by city
+and day: ARCHIVE_DIR/<YYYY-MM-DD>/city-<code>.jsonl.gz. Each flush appends one
+gzip member to a segment (a valid multi-member gzip file), and the
+archive_segments table indexes segments by city and time so a reader opens
+only the files it needs.
+"""
+import os
+import gzip
+import json
+import time
+import threading
+
+from config import ARCHIVE_DIR, ARCHIVE_FLUSH_RECORDS, logger
+from database import record_archive_segments, find_archive_segments, drop_archive_segments, archive_stats
+from listing import Listing
+from utils import search_city
+
+NO_CITY = "none"  # Segment for search URLs without a city parameter
+
+def day_of(timestamp):
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+class ListingArchive:
+    """Buffers parsed feeds and writes them to city/day segments once flush_records are pending."""
+
+    def __init__(self, directory, flush_records=ARCHIVE_FLUSH_RECORDS):
+        self.directory = directory
+        self.flush_records = flush_records
+        self._pending = {}  # (city_code, day) -> [first_seen, last_seen, json lines]
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self.written = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def segment_path(self, city_code, day):
+        """Segment path relative to the archive directory (as stored in the index)."""
+        return os.path.join(day, f"city-{city_code}.jsonl.gz")
+
+    # --- Writing ---
+    def append(self, search_url, found, listings, seen_at=None):
+        """Queues one fetched feed's listings, in feed order."""
+        if not self.enabled:
+            return
+        seen_at = time.time() if seen_at is None else seen_at
+        lines = [
+            json.dumps({"seen": seen_at, "search": search_url, "found": found, "ad": listing.to_row()},
+                       ensure_ascii=False)
+            for listing in listings if listing.ad_id and not listing.error
+        ]
+        if not lines:
+            return
+        key = (search_city(search_url) or NO_CITY, day_of(seen_at))
+        with self._lock:
+            segment = self._pending.get(key)
+            if segment is None:
+                segment = self._pending[key] = [seen_at, seen_at, []]
+            segment[0] = min(segment[0], seen_at)
+            segment[1] = max(segment[1], seen_at)
+            segment[2].extend(lines)
+            self._pending_count += len(lines)
+            full = self._pending_count >= self.flush_records
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered records, one gzip member per segment. Returns records written."""
+        with self._lock:
+            pending, self._pending, self._pending_count = self._pending, {}, 0
+        if not pending:
+            return 0
+
+        index_rows = []
+        written = 0
+        for (city_code, day), (first_seen, last_seen, lines) in pending.items():
+            path = self.segment_path(city_code, day)
+            payload = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+            try:
+                os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+                # A single append write, so concurrent writers never interleave inside a member
+                with open(os.path.join(self.directory, path), "ab") as f:
+                    f.write(payload)
+            except OSError as e:
+                logger.error(f"Error writing archive segment {path}: {e}")
+                continue
+            index_rows.append((path, city_code, day, len(lines), len(payload), first_seen, last_seen))
+            written += len(lines)
+
+        try:
+            record_archive_segments(index_rows)
+        except Exception as e:
+            logger.error(f"Error indexing archive segments: {e}")
+        self.written += written
+        return written
+
+    # --- Reading ---
+    def read(self, city_code=None, since=None, until=None):
+        """Streams (seen_at, search_url, found, Listing) for one city (or all), oldest segment first."""
+        if not self.enabled:
+            return
+        for path in find_archive_segments(city_code, since, until):
+            try:
+                f = gzip.open(os.path.join(self.directory, path), "rt", encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"Archive segment {path} unreadable: {e}")
+                continue
+            with f:
+                try:
+                    for line in f:
+                        record = json.loads(line)
+                        seen_at = record["seen"]
+                        if (since is not None and seen_at < since) or (until is not None and seen_at > until):
+                            continue
+                        yield seen_at, record["search"], record["found"], Listing.from_row(record["ad"])
+                except (OSError, EOFError, ValueError) as e:
+                    # A writer killed mid-flush leaves a truncated last member; everything before it is intact
+                    logger.warning(f"Archive segment {path} ends early: {e}")
+
+    def feeds(self, city_code=None, since=None, until=None):
+        """Streams the archived feeds as (seen_at, search_url, found, listings), segment by segment."""
+        current = None
+        for seen_at, search_url, found, listing in self.read(city_code, since, until):
+            if current is not None and (current[0], current[1]) != (seen_at, search_url):
+                yield current
+                current = None
+            if current is None:
+                current = (seen_at, search_url, found, [])
+            current[3].append(listing)
+        if current is not None:
+            yield current
+
+    # --- Retention ---
+    def prune(self, keep_days):
+        """Deletes whole days older than keep_days. Returns segments removed."""
+        if not self.enabled:
+            return 0
+        paths = drop_archive_segments(day_of(time.time() - keep_days * 86400))
+        days = set()
+        for path in paths:
+            days.add(os.path.dirname(path))
+            try:
+                os.remove(os.path.join(self.directory, path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing archive segment {path}: {e}")
+        for day in days:
+            try:
+                os.rmdir(os.path.join(self.directory, day))
+            except OSError:
+                pass  # Not empty (a segment outside the index) or already gone
+        return len(paths)
+
+    def stats(self):
+        return {**archive_stats(), "pending": self._pending_count, "written": self.written}
+
+archive = ListingArchive(ARCHIVE_DIR)
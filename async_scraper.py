@@ -0,0 +1,136 @@
+import time
+import asyncio
+
+from config import SCRAPE_CONCURRENCY, HOST_CONCURRENCY, HOST_MIN_INTERVAL, PAGE_LOAD_RETRIES, FETCH_MODE, logger
+from database import load_search_state
+from scraper import (
+    MAX_FEED_ITEMS, FEED_EXTRACT_JS, FeedScan, feed_listings, http_listings, checked_status, failed_attempt, blocked,
+    seen_ids_for, deliver_feed, listing_cache, feed_cache, breaker, SKIPPED
+)
+from network_policy import policy as network_policy
+from pacing import HostLimiter
+from browser_manager import AsyncBrowserManager
+from http_fetcher import FetchError, fetch_raw_items, fetch_stats
+from readiness import wait_for_feed_async
+import metrics
+from block_detector import OK, EMPTY, BLOCKED, ERROR, PageBlocked, probe_page_async
+
+# Playwright's async objects are bound to one event loop, which is kept for the process lifetime
+_loop = asyncio.new_event_loop()
+browser_manager = AsyncBrowserManager(SCRAPE_CONCURRENCY)
+host_limiter = HostLimiter(HOST_CONCURRENCY, HOST_MIN_INTERVAL, HOST_MIN_INTERVAL / 2)
+
+# --- Async Scraper Logic ---
+# Only the page I/O lives here; retries, block handling and paging are scraper's, shared with the sync engine
+async def extract_listings(page, limit=MAX_FEED_ITEMS):
+    """Async counterpart of scraper.extract_listings."""
+    with metrics.timer("yad2bot_phase_seconds", phase="extract"):
+        return feed_listings(await page.evaluate(FEED_EXTRACT_JS, limit))
+
+async def load_page(page, url, limiter):
+    """Async counterpart of scraper.load_page, holding a host slot only while the page loads."""
+    sessions = browser_manager.sessions
+    session = browser_manager.session_for(page)
+    status = None
+    for attempt in range(PAGE_LOAD_RETRIES):
+        try:
+            async with limiter.slot(url):
+                start = time.perf_counter()
+                with metrics.timer("yad2bot_phase_seconds", phase="goto"):
+                    response = await page.goto(url, timeout=30000, wait_until="domcontentloaded")
+            status = checked_status(response)
+            break
+        except Exception as e:
+            delay = failed_attempt(sessions, session, url, attempt, e)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+    if await probe_page_async(page, status) == BLOCKED:
+        raise blocked(sessions, session, f"block page at {url} (HTTP {status})")
+    with metrics.timer("yad2bot_phase_seconds", phase="feed_wait"):
+        ready = await wait_for_feed_async(page)
+    if not ready and await probe_page_async(page) == BLOCKED:
+        raise blocked(sessions, session, f"challenge rendered at {url}")
+    sessions.record_load(session, time.perf_counter() - start)
+    return ready
+
+async def scan_feed(search_url, seen_ids, load):
+    """Async counterpart of scraper.scan_feed; load is a coroutine function."""
+    scan = FeedScan(search_url, seen_ids)
+    for url, limit in scan:
+        scan.add(*await load(url, limit))
+    return scan
+
+async def fetch_feed(search_url, limiter, seen_ids=None):
+    """Async counterpart of scraper.fetch_feed."""
+    if FETCH_MODE == "http":
+        async def load_http(url, limit):
+            async with limiter.slot(url):
+                with metrics.timer("yad2bot_phase_seconds", phase="http_fetch"):
+                    found, raw_items = await asyncio.to_thread(fetch_raw_items, url)
+            return http_listings(found, raw_items, limit)
+
+        try:
+            result = await scan_feed(search_url, seen_ids, load_http)
+            fetch_stats.record("http", "ok")
+            return result
+        except FetchError as e:
+            fetch_stats.record("http", type(e).__name__)
+            logger.info(f"HTTP fetch failed for {search_url} ({e}), falling back to browser.")
+
+    async with browser_manager.page() as page:
+        async def load_browser(url, limit):
+            await load_page(page, url, limiter)
+            return await extract_listings(page, limit)
+
+        try:
+            result = await scan_feed(search_url, seen_ids, load_browser)
+        except Exception:
+            fetch_stats.record("browser", "error")
+            raise
+        fetch_stats.record("browser", "ok")
+        return result
+
+async def scrape_search(limiter, search_url, user_ids):
+    """Async counterpart of scraper.scrape_search; returns None on error."""
+    ticket = breaker.acquire()
+    if ticket is None:
+        return SKIPPED
+    logger.info(f"Checking search for {len(user_ids)} user(s): {', '.join(user_ids)}...")
+    try:
+        seen_ids = seen_ids_for(await asyncio.to_thread(load_search_state, search_url), user_ids)
+        with metrics.timer("yad2bot_phase_seconds", phase="scan"):
+            scan = await fetch_feed(search_url, limiter, seen_ids)
+    except Exception as e:
+        breaker.record(BLOCKED if isinstance(e, PageBlocked) else ERROR, ticket)
+        logger.error(f"Error scraping {search_url}: {e}")
+        return None
+    breaker.record(OK if scan.found else EMPTY, ticket)
+    feed_cache.store(search_url, scan.found, scan.first_page)
+
+    # DB lookups and writes are blocking, keep them off the event loop
+    with metrics.timer("yad2bot_phase_seconds", phase="deliver"):
+        await asyncio.to_thread(deliver_feed, search_url, user_ids, scan)
+    return (len(scan.listings) if seen_ids is not None else None), scan.pages
+
+async def scrape_searches_async(searches):
+    """Scans {search_url: user_ids} concurrently on the shared browser. Returns {search_url: result or None}."""
+    logger.info(f"Scanning {len(searches)} searches (concurrency {SCRAPE_CONCURRENCY}).")
+    results = await asyncio.gather(*(
+        scrape_search(host_limiter, search_url, user_ids)
+        for search_url, user_ids in searches.items()
+    ))
+
+    browser_manager.log_stats()
+    fetch_stats.log_stats()
+    listing_cache.log_stats()
+    breaker.log_stats()
+    if network_policy:
+        network_policy.log_stats()
+    metrics.flush_trace(engine="async", searches=len(searches))
+    return dict(zip(searches, results))
+
+def run_searches_async(searches):
+    """Runs scrape_searches_async on a long-lived event loop, so the browser outlives each batch."""
+    return _loop.run_until_complete(scrape_searches_async(searches))
@@ -0,0 +1,134 @@
+"""Micro-benchmark: per-call connections vs. the pooled and batched database paths.
+
+Usage: python benchmarks/bench_db.py [--rows 1000000] [--feeds 300] [--history-days 180]
+
+Preloaded notifications are spread over --history-days; the last section compacts
+them to the retention window and re-times dedup on the smaller table.
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+
+FEED_SIZE = 15
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows preloaded into notifications")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--feeds", type=int, default=300, help="Feeds (user x 15 ads) processed per path")
+    parser.add_argument("--history-days", type=float, default=180, help="Age spread of preloaded notifications")
+    return parser.parse_args()
+
+def populate(db_file, rows, users, history_days):
+    conn = sqlite3.connect(db_file)
+    per_user = max(1, rows // users)
+    now = time.time()
+    # ad{a} with a low a is the oldest, so compaction keeps each user's newest ads
+    with conn:
+        conn.executemany(
+            "INSERT INTO notifications (ad_id, user_id, notified_at) VALUES (?, ?, ?)",
+            ((f"ad{a}", str(u), now - history_days * 86400 * (1 - a / per_user))
+             for u in range(users) for a in range(per_user))
+        )
+    conn.close()
+    return per_user
+
+def make_feeds(count, users, per_user, seed):
+    """Feeds of 15 ads per user: mostly already notified, a few brand new."""
+    rng = random.Random(seed)
+    feeds = []
+    for n in range(count):
+        user_id = str(rng.randrange(users))
+        known = [f"ad{rng.randrange(per_user)}" for _ in range(FEED_SIZE - 3)]
+        fresh = [f"new{seed}-{n}-{i}" for i in range(3)]
+        feeds.append((user_id, known + fresh))
+    return feeds
+
+# --- Paths under test ---
+def legacy_path(db_file, feeds):
+    """The original access pattern: a fresh connection for every lookup and insert."""
+    for user_id, ad_ids in feeds:
+        for ad_id in ad_ids:
+            conn = sqlite3.connect(db_file)
+            exists = conn.execute(
+                "SELECT 1 FROM notifications WHERE ad_id = ? AND user_id = ?", (ad_id, user_id)
+            ).fetchone() is not None
+            conn.close()
+            if not exists:
+                conn = sqlite3.connect(db_file)
+                try:
+                    conn.execute("INSERT INTO notifications (ad_id, user_id) VALUES (?, ?)", (ad_id, user_id))
+                    conn.commit()
+                except sqlite3.IntegrityError:
+                    pass
+                conn.close()
+
+def pooled_path(db, feeds):
+    for user_id, ad_ids in feeds:
+        for ad_id in ad_ids:
+            if not db.is_ad_notified(ad_id, user_id):
+                db.mark_ad_notified(ad_id, user_id)
+
+def batched_path(db, feeds):
+    """What production runs per feed: one dedup query, one enqueue, and the dispatcher's claim and completion."""
+    for user_id, ad_ids in feeds:
+        known = db.known_ad_ids(user_id, ad_ids)
+        new = [ad_id for ad_id in ad_ids if ad_id not in known]
+        if new:
+            db.enqueue_notifications((ad_id, user_id, "bench", None) for ad_id in new)
+            db.complete_outbox_many(db.claim_outbox(len(new)))
+
+def lookup_path(db, feeds):
+    for user_id, ad_ids in feeds:
+        db.known_ad_ids(user_id, ad_ids)
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    feeds = len(args[-1])
+    print(f"{label:<28} {elapsed:8.3f}s total | {elapsed / feeds * 1000:8.3f} ms/feed")
+    return elapsed
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = os.path.join(tmp, "bench.db")
+        import database as db
+
+        db.init_db()
+        start = time.perf_counter()
+        per_user = populate(os.environ["DB_FILE"], args.rows, args.users, args.history_days)
+        print(f"Populated {per_user * args.users:,} notification rows in {time.perf_counter() - start:.1f}s")
+
+        legacy = timed("per-call connections", legacy_path, os.environ["DB_FILE"],
+                       make_feeds(args.feeds, args.users, per_user, 1))
+        pooled = timed("pooled connection", pooled_path, db,
+                       make_feeds(args.feeds, args.users, per_user, 2))
+        batched = timed("pooled + batched (outbox)", batched_path, db,
+                        make_feeds(args.feeds, args.users, per_user, 3))
+
+        print(f"Speedup vs per-call: pooled x{legacy / pooled:.1f}, batched x{legacy / batched:.1f}")
+
+        from retention import compact_once
+        lookup_feeds = make_feeds(args.feeds * 10, args.users, per_user, 4)
+        lookups = timed("dedup lookups", lookup_path, db, lookup_feeds)
+        size_before, _ = db.db_size_stats()
+        compact_once()
+        size_after, _ = db.db_size_stats()
+        rows_left = db.get_connection().execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
+        print(f"\nCompaction: DB {size_before / 1024 / 1024:.1f} -> {size_after / 1024 / 1024:.1f} MB, "
+              f"{rows_left:,} notification rows left")
+        compacted = timed("dedup lookups", lookup_path, db, lookup_feeds)
+        print(f"Dedup lookups after compaction: x{lookups / compacted:.1f} vs before")
+        db.close_connection()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""Offline end-to-end benchmark: scrape cycles and notification delivery against local Yad2 and Telegram stand-ins.
+
+Usage: python benchmarks/bench_e2e.py [--users 10 100 1000] [--cycles 3] [--latency-ms 50]
+                                      [--telegram-latency-ms 5] [--new-per-cycle 3] [--engine sync]
+                                      [--fetch-mode http] [--crawl-mode search] [--digest [--media-group]]
+                                      [--json results.json]
+
+A fake Yad2 serves synthetic feed pages with the live selectors
+(feed-item-list-box items, data-testid fields, report-ad_createdAt dates),
+filtered by the city/price/rooms query and paginated like the real feed, with
+a configurable response latency. A fake Telegram Bot API answers sendMessage
+and sendMediaGroup for TeleBot, pointed at it through TELEGRAM_API_URL, and
+counts the calls.
+
+Each user count runs in a fresh process with its own temporary DB, so peak
+RSS is per scenario: the bot process's own, plus the browser processes it
+starts (Playwright driver and Chromium), sampled while the scenario runs. Every cycle runs scrape_cycle() (the first one cold,
+later ones after the fake feed publishes --new-per-cycle ads per city) and then
+drains the outbox with the dispatcher. Pacing between page loads and
+Telegram's rate limits are lifted unless --pace / --telegram-rate say
+otherwise, so the numbers measure the bot rather than its politeness delays.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from datetime import date
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CITIES = ["5000", "6300", "8600", "7900", "6600", "9000", "4000", "70"]
+PAGE_SIZE = 40
+ADS_PER_CITY = 400
+
+# --- Fake Yad2 ---
+FEED_HEAD = """<!DOCTYPE html>
+<html lang="he" dir="rtl">
+<head><meta charset="utf-8"/><title>דירות להשכרה | יד2</title></head>
+<body><main><ul class="feed-list_feed__sJ2A6">
+"""
+FEED_ITEM = """<li data-nagish="feed-item-list-box" class="feed-item-list-box_box__9kSmL">
+  <div class="item-layout_itemLayout__wKfZr">
+    <a href="/realestate/item/{ad_id}?opened-from=feed&amp;component-type=main_feed" class="item-layout_itemLink__CZZ7w">
+      <div class="item-image_itemImageBox__X9Y4K"><img src="https://img.yad2.co.il/Pic/{pic_date}/2_2/o/{ad_id}.jpeg" alt=""/></div>
+      <div class="item-data-content_itemDataContentBox__gvAC2">
+        <span data-testid="price" class="price_price__xQt90">{price:,} ₪</span>
+        <span data-testid="street-name" class="item-data-content_heading__tphH4">{street}</span>
+        <span data-testid="item-info-line-1st" class="item-data-content_itemInfoLine__AeoPP">דירה, מרכז העיר, {city}</span>
+        <span data-testid="item-info-line-2nd" class="item-data-content_itemInfoLine__AeoPP">{rooms:g} חדרים • קומה 2</span>
+      </div>
+    </a>
+    <span class="report-ad_createdAt__x3kQp">עודכן ב {created}</span>
+  </div>
+</li>
+"""
+FEED_TAIL = "</ul></main></body></html>\n"
+
+class FakeYad2:
+    """Per-city newest-first ad lists; publish() puts new ads at the top of every city's feed."""
+
+    def __init__(self, latency, seed=7):
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.feeds = {city: [] for city in CITIES}
+        self.pages_served = 0
+        for _ in range(ADS_PER_CITY):
+            self.publish(1)
+
+    def publish(self, per_city):
+        with self.lock:
+            for city, ads in self.feeds.items():
+                for _ in range(per_city):
+                    self.next_id += 1
+                    ads.insert(0, {
+                        "ad_id": f"bench{self.next_id:07d}",
+                        "price": self.random.randrange(3000, 9000, 50),
+                        "rooms": self.random.choice((1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5)),
+                        "street": f"הרצל {self.random.randint(1, 200)}",
+                        "city": city,
+                    })
+
+    def render(self, query):
+        params = {k: v[0] for k, v in parse_qs(query).items()}
+        min_price, _, max_price = params.get("price", "0-100000").partition("-")
+        min_rooms, _, max_rooms = params.get("rooms", "0-100").partition("-")
+        page = int(params.get("page", "1"))
+        with self.lock:
+            ads = [ad for ad in self.feeds.get(params.get("city"), [])
+                   if float(min_price) <= ad["price"] <= float(max_price)
+                   and float(min_rooms) <= ad["rooms"] <= float(max_rooms)]
+            self.pages_served += 1
+        today = date.today()
+        created = today.strftime("%d/%m/%y")
+        pic_date = today.strftime("%Y%m/%d")
+        items = "".join(FEED_ITEM.format(created=created, pic_date=pic_date, **ad)
+                        for ad in ads[(page - 1) * PAGE_SIZE:page * PAGE_SIZE])
+        return FEED_HEAD + items + FEED_TAIL
+
+class Yad2Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        fake = self.server.fake
+        parsed = urlparse(self.path)
+        if parsed.path == "/_stats":
+            body = json.dumps({"pages": fake.pages_served}).encode()
+        elif parsed.path.startswith("/realestate/rent"):
+            time.sleep(fake.latency)
+            body = fake.render(parsed.query).encode()
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if parsed.path != "/_publish":
+            self.send_error(404)
+            return
+        self.server.fake.publish(int(parse_qs(parsed.query).get("count", ["1"])[0]))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+# --- Fake Telegram Bot API ---
+class FakeTelegram:
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.messages = 0
+
+    def message(self, chat_id, **fields):
+        with self.lock:
+            self.messages += 1
+            return {"message_id": self.messages, "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"}, **fields}
+
+class TelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        fake = self.server.fake
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode()) if length else {}
+        params = {k: v[0] for k, v in {**parse_qs(parsed.query), **form}.items()}
+        if parsed.path == "/_stats":
+            self._reply({"calls": fake.calls, "messages": fake.messages})
+            return
+
+        method = parsed.path.rsplit("/", 1)[-1]
+        time.sleep(fake.latency)
+        if method == "getMe":
+            self._reply({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}})
+            return
+        if method not in ("sendMessage", "sendMediaGroup"):
+            self._reply({"ok": True, "result": True})
+            return
+        with fake.lock:
+            fake.calls += 1
+        chat_id = int(params.get("chat_id", 0))
+        if method == "sendMessage":
+            self._reply({"ok": True, "result": fake.message(chat_id, text=params.get("text", ""))})
+        else:
+            photos = json.loads(params.get("media", "[]"))
+            self._reply({"ok": True, "result": [
+                fake.message(chat_id, caption=photo.get("caption", ""),
+                             photo=[{"file_id": "x", "file_unique_id": "x", "width": 220, "height": 142}])
+                for photo in photos
+            ]})
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(handler, fake):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.fake = fake
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def get_json(url, method="GET"):
+    with urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=30) as response:
+        body = response.read()
+    return json.loads(body) if body else None
+
+# --- One Scenario (child process) ---
+def make_users(count, digest=False, seed=11):
+    """Users spread over cities, price bands and room ranges; popular filters repeat, as in production."""
+    from utils import construct_url
+    from database import add_user, set_user_digest
+    rng = random.Random(seed)
+    for i in range(count):
+        low = rng.randrange(3000, 7000, 500)
+        min_rooms = rng.choice((1.5, 2, 2.5, 3))
+        filters = {
+            "city_code": rng.choice(CITIES), "min_price": low, "max_price": low + rng.choice((1500, 2500)),
+            "min_rooms": min_rooms, "max_rooms": min_rooms + rng.choice((1, 1.5)),
+        }
+        add_user(100000 + i, construct_url(filters), filters)
+        if digest:
+            set_user_digest(100000 + i, True)
+
+def drain_outbox():
+    from dispatcher import Dispatcher
+    from database import outbox_depth
+    dispatcher = Dispatcher()
+    start = time.perf_counter()
+    while True:
+        if not dispatcher.run_once():
+            if not outbox_depth():
+                break
+            time.sleep(0.05)  # Only entries waiting out a retry delay are left
+    return dispatcher.sent, dispatcher.failed, time.perf_counter() - start
+
+def db_ops(snapshot):
+    return {key: count for key, (count, _) in snapshot["histograms"].items() if key.startswith("yad2bot_db_seconds")}
+
+def page_loads(snapshot):
+    """Browser feed loads so far as {warm/cold: (count, total seconds)}."""
+    return {key.split('"')[1]: value for key, value in snapshot["histograms"].items()
+            if key.startswith("yad2bot_page_load_seconds")}
+
+def sample_browser_rss(peak, stop, interval=0.2):
+    """Keeps peak[0] at the highest RSS seen of the browser processes until stop is set.
+
+    ru_maxrss only covers the bot process itself, and RUSAGE_CHILDREN only
+    children already reaped, so Chromium's share has to be sampled.
+    """
+    from browser_manager import browser_rss_mb
+    while True:
+        peak[0] = max(peak[0], browser_rss_mb())
+        if stop.wait(interval):
+            return
+
+def run_scenario(args):
+    import logging
+    logging.getLogger("yad2bot").setLevel(args.log_level)
+    import metrics
+    from database import init_db
+    from scraper import scrape_cycle
+
+    init_db()
+    make_users(args.scenario, args.digest)
+    yad2, telegram = os.environ["YAD2_ORIGIN"], args.telegram_origin
+    browser_peak, stop_sampling = [0.0], threading.Event()
+    sampler = threading.Thread(target=sample_browser_rss, args=(browser_peak, stop_sampling), daemon=True)
+    sampler.start()
+
+    cycles = []
+    for cycle in range(args.cycles):
+        if cycle:
+            get_json(f"{yad2}/_publish?count={args.new_per_cycle}", method="POST")
+        pages_before = get_json(f"{yad2}/_stats")["pages"]
+        calls_before = get_json(f"{telegram}/_stats")["calls"]
+        ops_before = db_ops(metrics.snapshot())
+
+        start = time.perf_counter()
+        results = scrape_cycle()
+        scrape_time = time.perf_counter() - start
+        pages = get_json(f"{yad2}/_stats")["pages"] - pages_before
+        sent, failed, dispatch_time = drain_outbox()
+        api_calls = get_json(f"{telegram}/_stats")["calls"] - calls_before
+
+        ops_after = db_ops(metrics.snapshot())
+        ops = {key.split('"')[1]: count - ops_before.get(key, 0) for key, count in ops_after.items()}
+        cycles.append({
+            "cycle": cycle + 1,
+            "searches": len(results),
+            "errors": sum(1 for result in results.values() if result is None),
+            "scrape_s": scrape_time,
+            "pages": pages,
+            "pages_per_min": pages / scrape_time * 60 if scrape_time else 0.0,
+            "sent": sent,
+            "failed": failed,
+            "dispatch_s": dispatch_time,
+            "sent_per_s": sent / dispatch_time if dispatch_time and sent else 0.0,
+            "api_calls": api_calls,
+            "db_ops": sum(ops.values()),
+            "db_ops_by_call": {k: v for k, v in sorted(ops.items()) if v},
+        })
+
+    stop_sampling.set()
+    sampler.join()
+    loads = page_loads(metrics.snapshot())
+    print(json.dumps({
+        "users": args.scenario,
+        "cycles": cycles,
+        "page_load_avg_s": {label: (total / count, count) for label, (count, total) in loads.items() if count},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_browser_rss_mb": browser_peak[0],
+    }))
+
+# --- Driver ---
+def scenario_env(args, yad2, telegram, workdir):
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": "0:bench",
+        "DB_FILE": os.path.join(workdir, "bench.db"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "YAD2_ORIGIN": yad2,
+        "TELEGRAM_API_URL": f"{telegram}/bot{{0}}/{{1}}",
+        "FETCH_MODE": args.fetch_mode,
+        "SCRAPER_ENGINE": args.engine,
+        "CRAWL_MODE": args.crawl_mode,
+        "SEARCH_MIN_INTERVAL": str(args.pace),
+        "SEARCH_JITTER": "0",
+        "HOST_MIN_INTERVAL": str(args.pace),
+        "TELEGRAM_GLOBAL_RATE": str(args.telegram_rate),
+        "TELEGRAM_CHAT_INTERVAL": "0" if args.telegram_rate >= 1000 else env.get("TELEGRAM_CHAT_INTERVAL", "1.1"),
+        "DIGEST_MEDIA_GROUP": "1" if args.media_group else "0",
+        "METRICS_ENABLED": "1",
+        "METRICS_PORT": "0",
+        "METRICS_TRACE_FILE": "",
+    })
+    return env
+
+def print_table(result):
+    print(f"\n{result['users']} users | peak RSS {result['peak_rss_mb']:.1f} MB bot + "
+          f"{result.get('peak_browser_rss_mb', 0):.1f} MB browser")
+    print(f"  {'cycle':>5} {'searches':>8} {'errors':>6} {'scrape s':>9} {'pages':>6} {'pages/min':>10} "
+          f"{'sent':>6} {'sent/s':>8} {'api calls':>9} {'db ops':>7}")
+    for c in result["cycles"]:
+        print(f"  {c['cycle']:>5} {c['searches']:>8} {c['errors']:>6} {c['scrape_s']:>9.2f} {c['pages']:>6} "
+              f"{c['pages_per_min']:>10.0f} {c['sent']:>6} {c['sent_per_s']:>8.0f} {c['api_calls']:>9} {c['db_ops']:>7}")
+    busiest = max(result["cycles"], key=lambda c: c["db_ops"])
+    print(f"  DB calls, cycle {busiest['cycle']}: {busiest['db_ops_by_call']}")
+    for label, (average, count) in sorted(result.get("page_load_avg_s", {}).items()):
+        print(f"  Browser page load, {label} sessions: {average:.2f}s avg over {count} loads")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake Yad2 response latency")
+    parser.add_argument("--telegram-latency-ms", type=float, default=5, help="Fake Telegram response latency")
+    parser.add_argument("--new-per-cycle", type=int, default=3, help="Ads published per city between cycles")
+    parser.add_argument("--engine", choices=("sync", "async"), default="sync")
+    parser.add_argument("--fetch-mode", choices=("http", "browser"), default="http")
+    parser.add_argument("--crawl-mode", choices=("search", "city"), default="search")
+    parser.add_argument("--pace", type=float, default=0, help="Seconds between page loads (production: 5 + jitter)")
+    parser.add_argument("--telegram-rate", type=float, default=1000, help="Dispatcher messages/s (production: 25)")
+    parser.add_argument("--digest", action="store_true", help="Put every user in digest mode")
+    parser.add_argument("--media-group", action="store_true", help="Send digests with thumbnails as albums")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--json", help="Also write the results to this file, for comparing runs")
+    parser.add_argument("--scenario", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--telegram-origin", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        sys.path.insert(0, ROOT)
+        run_scenario(args)
+        return
+
+    yad2 = start_server(Yad2Handler, FakeYad2(args.latency_ms / 1000))
+    telegram = start_server(TelegramHandler, FakeTelegram(args.telegram_latency_ms / 1000))
+    print(f"Fake Yad2 at {yad2} ({args.latency_ms:g} ms), fake Telegram at {telegram} ({args.telegram_latency_ms:g} ms) | "
+          f"engine {args.engine}, fetch {args.fetch_mode}, crawl {args.crawl_mode}, {args.cycles} cycles")
+
+    results = []
+    for users in args.users:
+        with tempfile.TemporaryDirectory() as workdir:
+            # The scenario's bot.log lands in workdir; its console log is kept only if it fails
+            command = [sys.executable, os.path.abspath(__file__), "--scenario", str(users), "--telegram-origin", telegram,
+                       "--cycles", str(args.cycles), "--new-per-cycle", str(args.new_per_cycle),
+                       "--log-level", args.log_level] + (["--digest"] if args.digest else [])
+            proc = subprocess.run(command, cwd=workdir, env=scenario_env(args, yad2, telegram, workdir),
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if proc.returncode != 0:
+                print(f"\n{users} users: scenario failed\n{proc.stderr[-4000:]}")
+                sys.exit(1)
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print_table(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
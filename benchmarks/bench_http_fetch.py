@@ -0,0 +1,96 @@
+"""Checks and times the browserless HTTP fetcher against saved fixture pages on a local server.
+
+Usage: python benchmarks/bench_http_fetch.py [--iterations 200]
+
+Serves benchmarks/fixtures over HTTP, verifies each fixture is classified as the
+scraper expects (HTML feed, page-JSON feed, challenge page, HTTP 403), then
+reports fetch + parse throughput over pooled keep-alive connections.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so the pooled session is exercised
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.startswith("/forbidden"):
+            body = b"Forbidden"
+            self.send_response(403)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.path = self.path.split("?", 1)[0]
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(FixtureHandler, directory=FIXTURES))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def check(label, condition):
+    print(f"{'PASS' if condition else 'FAIL'}  {label}")
+    return condition
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    from http_fetcher import fetch_raw_items, FetchBlocked, FetchError
+    import scraper
+    from scraper import build_listings
+    from listing import ListingCache
+
+    server, base = start_server()
+    ok = True
+    try:
+        found, items = fetch_raw_items(f"{base}/feed_page.html?city=5000&page=1")
+        listings = build_listings(items)
+        ok &= check(f"HTML feed: {found} items parsed", found == 20)
+        ok &= check("HTML feed: every item has an ad id", all(l.ad_id for l in listings))
+        ok &= check("HTML feed: createdAt or image-URL date on every item", all(l.date for l in listings))
+        ok &= check("HTML feed: price, street and info lines filled",
+                    all(l.price and l.address and l.city and l.rooms for l in listings))
+        ok &= check(f"HTML feed: rooms line flattened ('{listings[0].rooms_text}')", "\n" not in listings[0].rooms_text)
+
+        found, items = fetch_raw_items(f"{base}/feed_next_data.html")
+        ok &= check(f"Page JSON feed: {found} items parsed", found == 12)
+
+        for path, label in (("/blocked_page.html", "challenge page"), ("/forbidden", "HTTP 403")):
+            try:
+                fetch_raw_items(base + path)
+                ok &= check(f"{label} classified as blocked", False)
+            except FetchBlocked:
+                ok &= check(f"{label} classified as blocked", True)
+            except FetchError as e:
+                ok &= check(f"{label} classified as blocked (got {type(e).__name__})", False)
+
+        scraper.listing_cache = ListingCache(0)  # Time parsing, not cache hits
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            build_listings(fetch_raw_items(f"{base}/feed_page.html")[1])
+        elapsed = time.perf_counter() - start
+        print(f"\nHTTP fetch + parse + build: {elapsed / args.iterations * 1000:.2f} ms/page "
+              f"({args.iterations / elapsed:.0f} pages/s, {args.iterations} iterations)")
+    finally:
+        server.shutdown()
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
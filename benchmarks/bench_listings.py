@@ -0,0 +1,96 @@
+"""Memory and throughput of building listings from a large feed, with and without the parsed-ad cache.
+
+Usage: python benchmarks/bench_listings.py [--items 10000] [--cycles 5]
+
+The fixture feed is the saved feed page's records repeated with distinct ad ids
+and prices. Each path builds the whole feed once per cycle, as consecutive scan
+cycles (or many users sharing ads) would. Memory is what tracemalloc sees
+retained by one cycle's listings, plus the cache itself where there is one.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def make_feed(count):
+    from http_fetcher import parse_feed_html
+    with open(os.path.join(FIXTURES, "feed_page.html"), encoding="utf-8") as f:
+        templates = parse_feed_html(f.read())
+
+    feed = []
+    for i in range(count):
+        raw = dict(templates[i % len(templates)])
+        raw["href"] = f"/realestate/item/bench{i:06d}"
+        raw["price"] = f"{4000 + (i * 37) % 6000:,} ₪"
+        feed.append(raw)
+    return feed
+
+# --- Paths under test ---
+def dict_listings(raw_items):
+    """The previous representation: one dict per item, every field parsed on every build."""
+    from scraper import extract_ad_id, parse_item_date
+    listings = []
+    for i, raw in enumerate(raw_items):
+        full_link = f"https://www.yad2.co.il{raw['href']}"
+        listings.append({
+            "index": i,
+            "ad_id": extract_ad_id(full_link),
+            "link": full_link,
+            "price": raw.get("price") or "N/A",
+            "address": raw.get("address") or "",
+            "city": raw.get("city") or "",
+            "rooms": raw.get("rooms") or "",
+            "date": parse_item_date(raw.get("date_text"), raw.get("img_src")),
+        })
+    return listings
+
+def measure(label, build, feed, cycles, cache=None):
+    tracemalloc.start()
+    start = time.perf_counter()
+    listings = build(feed)
+    first = time.perf_counter() - start
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(cycles - 1):
+        listings = build(feed)
+    repeat = (time.perf_counter() - start) / max(cycles - 1, 1)
+
+    print(f"{label:<24} first cycle (traced) {first * 1000:7.1f} ms | later cycles {repeat * 1000:7.1f} ms "
+          f"({len(feed) / repeat:,.0f} items/s) | retained {retained / 1024 / 1024:6.2f} MB")
+    return listings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+
+    import scraper
+    from listing import ListingCache
+
+    feed = make_feed(args.items)
+    print(f"Fixture feed: {len(feed):,} items, {args.cycles} cycles per path\n")
+
+    measure("dict per item", dict_listings, feed, args.cycles)
+
+    scraper.listing_cache = ListingCache(0)
+    uncached = measure("Listing, no cache", scraper.build_listings, feed, args.cycles)
+
+    scraper.listing_cache = ListingCache(args.items)
+    cached = measure("Listing + LRU cache", scraper.build_listings, feed, args.cycles)
+    print(f"\nCache: {scraper.listing_cache.hit_rate():.0%} hit rate over {args.cycles} cycles")
+
+    ok = all(a.ad_id == b.ad_id and a.price == b.price and a.date == b.date for a, b in zip(uncached, cached))
+    print(f"{'PASS' if ok else 'FAIL'}  cached listings match freshly parsed ones")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Replays archived feeds through the delivery pipeline offline: no browser, no Yad2, no Telegram.
+
+Usage: python benchmarks/replay_archive.py --db production.db [--archive archive] [--city 5000]
+                                           [--hours 24] [--fresh] [--profile 25]
+
+Works on a copy of the database, so the source is never written. Every archived
+feed whose search URL the copy's users still plan is handed to the same fan-out
+and per-user processing the scraper runs after a fetch; the notifications it
+queues stay in the copy's outbox. Ad dates are shifted by the feed's age, so an
+old archive is judged as it was when fetched. --fresh empties the copy's
+notifications and outbox first, so every ad takes the full new-ad path.
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import datetime
+import tempfile
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")
+
+def copy_db(source, target):
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
+
+def search_path(url):
+    """A search URL without its origin, so an archive replays under any YAD2_ORIGIN."""
+    parsed = urlparse(url)
+    return f"{parsed.path}?{parsed.query}"
+
+def replay(args):
+    import metrics
+    from archive import archive
+    from database import get_connection, load_users, outbox_depth
+    from scraper import plan, fan_out
+
+    if args.fresh:
+        conn = get_connection()
+        with conn:
+            conn.execute("DELETE FROM notifications")
+            conn.execute("DELETE FROM outbox")
+
+    searches = {search_path(url): (url, user_ids) for url, user_ids in plan(load_users()).items()}
+    since = time.time() - args.hours * 3600 if args.hours else None
+    today = datetime.date.today()
+    feeds = replayed = records = 0
+    skipped = set()
+
+    start = time.perf_counter()
+    for seen_at, search_url, found, listings in archive.feeds(args.city, since=since):
+        feeds += 1
+        records += len(listings)
+        planned = searches.get(search_path(search_url))
+        if planned is None:
+            skipped.add(search_url)
+            continue
+        search_url, user_ids = planned
+        shift = today - datetime.date.fromtimestamp(seen_at)
+        if shift.days:
+            for listing in listings:
+                if listing.date:
+                    listing.date += shift
+        fan_out(search_url, user_ids, found, listings)
+        replayed += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{feeds} archived feeds ({records} records) | {replayed} replayed | "
+          f"{len(skipped)} search(es) no longer planned")
+    print(f"{elapsed:.2f}s | {replayed / elapsed if elapsed else 0:.0f} feeds/s | "
+          f"{records / elapsed if elapsed else 0:.0f} records/s | outbox now {outbox_depth()}")
+    if metrics.enabled():
+        snapshot = metrics.snapshot()
+        for key, value in sorted(snapshot["counters"].items()):
+            if key.startswith("yad2bot_listings_total"):
+                print(f"  {key}: {value}")
+        for key, (count, total) in sorted(snapshot["histograms"].items()):
+            if key.startswith("yad2bot_db_seconds"):
+                print(f"  {key}: {count} calls, {total * 1000 / count:.2f} ms avg")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="Source database (users and the archive index); only read")
+    parser.add_argument("--archive", default=os.getenv("ARCHIVE_DIR", "archive"), help="Archive directory")
+    parser.add_argument("--city", help="Only this city code's segments")
+    parser.add_argument("--hours", type=float, default=0, help="Only feeds fetched in the last N hours (0 = all)")
+    parser.add_argument("--fresh", action="store_true", help="Empty the copy's notifications and outbox first")
+    parser.add_argument("--profile", type=int, default=0, metavar="N", help="Run under cProfile and print the top N")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="yad2replay-")
+    db_copy = os.path.join(workdir, "replay.db")
+    copy_db(args.db, db_copy)
+    # Read by config at import time, so set before the project modules load
+    os.environ.update({
+        "DB_FILE": db_copy,
+        "ARCHIVE_DIR": os.path.abspath(args.archive),
+        "METRICS_ENABLED": "1",
+        "METRICS_PORT": "0",
+        "METRICS_TRACE_FILE": "",
+    })
+    import logging
+    logging.getLogger("yad2bot").setLevel(args.log_level)
+    import scraper  # Loads the project first, so the profile holds no import time
+
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.runcall(replay, args)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.profile)
+    else:
+        replay(args)
+    print(f"Database copy with the replay's outbox: {db_copy}")
+
+if __name__ == "__main__":
+    main()
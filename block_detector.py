@@ -0,0 +1,55 @@
+from readiness import FEED_SELECTOR
+import metrics
+
+# Outcomes of one page load
+OK = "ok"            # Feed items found
+EMPTY = "empty"      # A normal page with no feed items (e.g. a search with no results)
+BLOCKED = "blocked"  # Challenge, captcha or block page
+ERROR = "error"      # Network failure, timeout or unexpected HTTP error
+
+BLOCK_STATUSES = {401, 403, 429, 503}
+BLOCK_MARKERS = ("captcha", "perfdrive", "shieldsquare", "are you a robot", "access denied")
+MARKER_SCAN_CHARS = 20000
+
+# Everything classify() needs from a rendered page, in one round-trip
+PAGE_PROBE_JS = """
+([selector, maxChars]) => ({
+    title: document.title || "",
+    items: document.querySelectorAll(selector).length,
+    head: document.documentElement ? document.documentElement.outerHTML.slice(0, maxChars) : "",
+})
+"""
+
+class PageBlocked(Exception):
+    """Yad2 answered with a block or challenge page instead of the feed."""
+
+# --- Classification ---
+def looks_blocked(title, html):
+    text = f"{title or ''}\n{(html or '')[:MARKER_SCAN_CHARS]}".lower()
+    return any(marker in text for marker in BLOCK_MARKERS)
+
+def classify(status=None, title="", html="", items_found=0):
+    """Classifies a response as OK, EMPTY, BLOCKED or ERROR.
+
+    Markers are only checked on pages without feed items, since real feeds may
+    load captcha scripts too.
+    """
+    if status in BLOCK_STATUSES:
+        return BLOCKED
+    if status is not None and status >= 400:
+        return ERROR
+    if items_found:
+        return OK
+    return BLOCKED if looks_blocked(title, html) else EMPTY
+
+def probe_page(page, status=None):
+    """Classifies a loaded browser page without waiting for the feed."""
+    with metrics.timer("yad2bot_phase_seconds", phase="block_probe"):
+        probe = page.evaluate(PAGE_PROBE_JS, [FEED_SELECTOR, MARKER_SCAN_CHARS])
+    return classify(status, probe["title"], probe["head"], probe["items"])
+
+async def probe_page_async(page, status=None):
+    """Async counterpart of probe_page."""
+    with metrics.timer("yad2bot_phase_seconds", phase="block_probe"):
+        probe = await page.evaluate(PAGE_PROBE_JS, [FEED_SELECTOR, MARKER_SCAN_CHARS])
+    return classify(status, probe["title"], probe["head"], probe["items"])
@@ -1,6 +1,7 @@
-from config import bot, user_data, CITIES, logger
-from database import add_user, set_user_active
+from config import bot, BOT_MODE, CITIES, logger
+from database import add_user, set_user_active, request_scan, toggle_user_digest
 from utils import construct_url, get_main_menu
+from conversations import conversations
 from telebot import types
 
 # --- Telegram Bot Handlers ---
@@ -40,6 +41,7 @@ def show_city_selection(message):
 @bot.message_handler(func=lambda message: message.text == "✅ הפעל התראות")
 def enable_notifications(message):
     if set_user_active(message.chat.id, True):
+        request_scan(message.chat.id)
         bot.reply_to(message, "✅ ההתראות הופעלו! נמשיך לחפש עבורך.", reply_markup=get_main_menu())
     else:
         bot.reply_to(message, "⚠️ לא מצאתי הגדרות עבורך. אנא התחל עם /start")
@@ -51,6 +53,16 @@ def disable_notifications(message):
     else:
         bot.reply_to(message, "⚠️ לא מצאתי הגדרות עבורך. אנא התחל עם /start")
 
+@bot.message_handler(func=lambda message: message.text == "📰 מצב תקציר")
+def toggle_digest(message):
+    digest = toggle_user_digest(message.chat.id)
+    if digest is None:
+        bot.reply_to(message, "⚠️ לא מצאתי הגדרות עבורך. אנא התחל עם /start")
+    elif digest:
+        bot.reply_to(message, "📰 מצב תקציר הופעל: מודעות חדשות יישלחו יחד בהודעה אחת בכל סבב סריקה.", reply_markup=get_main_menu())
+    else:
+        bot.reply_to(message, "🔔 מצב תקציר כובה: כל מודעה חדשה תישלח בהודעה נפרדת.", reply_markup=get_main_menu())
+
 @bot.message_handler(func=lambda message: message.text == "🔍 מסנן חדש")
 def new_filter_request(message):
     show_city_selection(message)
@@ -59,92 +71,93 @@ def new_filter_request(message):
 def stop_notifications_command(message):
     disable_notifications(message)
 
+@bot.message_handler(commands=['digest'])
+def digest_command(message):
+    toggle_digest(message)
+
 @bot.callback_query_handler(func=lambda call: call.data.startswith('city_'))
 def callback_city(call):
     """Handle city selection."""
     _, city_code, city_name = call.data.split('_')
     chat_id = call.message.chat.id
-    user_data[chat_id] = {'city_code': city_code, 'city_name': city_name}
+    conversations.set(chat_id, "min_price", {'city_code': city_code, 'city_name': city_name})
     
     bot.answer_callback_query(call.id)
-    msg = bot.send_message(chat_id, f"✅ נבחרה העיר: {city_name}\n\nמה המחיר **המינימלי** בשקלים? (למשל: 3000)", parse_mode="Markdown")
-    bot.register_next_step_handler(msg, process_min_price_step)
+    bot.send_message(chat_id, f"✅ נבחרה העיר: {city_name}\n\nמה המחיר **המינימלי** בשקלים? (למשל: 3000)", parse_mode="Markdown")
 
-def process_min_price_step(message):
+# --- Filter Wizard Steps ---
+# Each step gets the user's answers so far and either moves the conversation
+# to the next state or replies with an error and stays on the same one.
+def process_min_price_step(message, data):
     chat_id = message.chat.id
     if not message.text.isdigit():
-        msg = bot.reply_to(message, "⚠️ המחיר חייב להיות מספר שלם (למשל: 3000). נסה שוב:")
-        bot.register_next_step_handler(msg, process_min_price_step)
+        bot.reply_to(message, "⚠️ המחיר חייב להיות מספר שלם (למשל: 3000). נסה שוב:")
         return
 
-    min_price = int(message.text)
-    user_data[chat_id]['min_price'] = min_price
-    
-    msg = bot.send_message(chat_id, "מה המחיר **המקסימלי** בשקלים? (למשל: 6000)", parse_mode="Markdown")
-    bot.register_next_step_handler(msg, process_max_price_step)
+    data['min_price'] = int(message.text)
+    conversations.set(chat_id, "max_price", data)
+    bot.send_message(chat_id, "מה המחיר **המקסימלי** בשקלים? (למשל: 6000)", parse_mode="Markdown")
 
-def process_max_price_step(message):
+def process_max_price_step(message, data):
     chat_id = message.chat.id
     if not message.text.isdigit():
-        msg = bot.reply_to(message, "⚠️ המחיר חייב להיות מספר שלם (למשל: 6000). נסה שוב:")
-        bot.register_next_step_handler(msg, process_max_price_step)
+        bot.reply_to(message, "⚠️ המחיר חייב להיות מספר שלם (למשל: 6000). נסה שוב:")
         return
 
     max_price = int(message.text)
-    min_price = user_data[chat_id]['min_price']
+    min_price = data['min_price']
 
     if max_price < min_price:
         max_price, min_price = min_price, max_price
-        user_data[chat_id]['min_price'] = min_price
+        data['min_price'] = min_price
         bot.send_message(chat_id, f"🔄 שמתי לב שהמקסימום נמוך מהמינימום, אז הפכתי ביניהם: {min_price} - {max_price} ₪")
 
-    user_data[chat_id]['max_price'] = max_price
-    
-    msg = bot.send_message(chat_id, "מה **מינימום** החדרים? (למשל: 2 או 2.5)", parse_mode="Markdown")
-    bot.register_next_step_handler(msg, process_min_rooms_step)
+    data['max_price'] = max_price
+    conversations.set(chat_id, "min_rooms", data)
+    bot.send_message(chat_id, "מה **מינימום** החדרים? (למשל: 2 או 2.5)", parse_mode="Markdown")
 
-def process_min_rooms_step(message):
+def process_min_rooms_step(message, data):
     chat_id = message.chat.id
     try:
-        min_rooms = float(message.text)
-        user_data[chat_id]['min_rooms'] = min_rooms
-        
-        msg = bot.send_message(chat_id, "מה **מקסימום** החדרים? (למשל: 3.5 או 4)", parse_mode="Markdown")
-        bot.register_next_step_handler(msg, process_max_rooms_step)
+        data['min_rooms'] = float(message.text)
     except ValueError:
-        msg = bot.reply_to(message, "⚠️ נא להקליד מספר (אפשר עשרוני, למשל: 2.5). נסה שוב:")
-        bot.register_next_step_handler(msg, process_min_rooms_step)
+        bot.reply_to(message, "⚠️ נא להקליד מספר (אפשר עשרוני, למשל: 2.5). נסה שוב:")
+        return
+
+    conversations.set(chat_id, "max_rooms", data)
+    bot.send_message(chat_id, "מה **מקסימום** החדרים? (למשל: 3.5 או 4)", parse_mode="Markdown")
 
-def process_max_rooms_step(message):
+def process_max_rooms_step(message, data):
     chat_id = message.chat.id
     try:
         max_rooms = float(message.text)
     except ValueError:
-        msg = bot.reply_to(message, "⚠️ נא להקליד מספר (אפשר עשרוני). נסה שוב:")
-        bot.register_next_step_handler(msg, process_max_rooms_step)
+        bot.reply_to(message, "⚠️ נא להקליד מספר (אפשר עשרוני). נסה שוב:")
         return
 
-    min_rooms = user_data[chat_id]['min_rooms']
+    min_rooms = data['min_rooms']
 
     if max_rooms < min_rooms:
         max_rooms, min_rooms = min_rooms, max_rooms
-        user_data[chat_id]['min_rooms'] = min_rooms
+        data['min_rooms'] = min_rooms
         bot.send_message(chat_id, f"🔄 הפכתי בין מינימום למקסימום חדרים: {min_rooms} - {max_rooms}")
 
-    user_data[chat_id]['max_rooms'] = max_rooms
+    data['max_rooms'] = max_rooms
     
     config = {
-        "city_code": user_data[chat_id]['city_code'],
-        "min_price": user_data[chat_id]['min_price'],
-        "max_price": user_data[chat_id]['max_price'],
-        "min_rooms": user_data[chat_id]['min_rooms'],
-        "max_rooms": user_data[chat_id]['max_rooms']
+        "city_code": data['city_code'],
+        "min_price": data['min_price'],
+        "max_price": data['max_price'],
+        "min_rooms": data['min_rooms'],
+        "max_rooms": data['max_rooms']
     }
     
     generated_url = construct_url(config)
-    add_user(chat_id, generated_url)
+    add_user(chat_id, generated_url, config)
+    conversations.clear(chat_id)
+    request_scan(chat_id)
     
-    city_name = user_data[chat_id]['city_name']
+    city_name = data['city_name']
     bot.send_message(chat_id, 
                         f"🎉 **ההגדרות עודכנו בהצלחה!**\n\n"
                         f"🏙️ עיר: {city_name}\n"
@@ -154,6 +167,31 @@ def process_max_rooms_step(message):
                         parse_mode="Markdown",
                         reply_markup=get_main_menu())
 
+WIZARD_STEPS = {
+    "min_price": process_min_price_step,
+    "max_price": process_max_price_step,
+    "min_rooms": process_min_rooms_step,
+    "max_rooms": process_max_rooms_step,
+}
+
+# Registered last, so commands and menu buttons still work in the middle of the wizard
+@bot.message_handler(func=lambda message: conversations.get(message.chat.id) is not None)
+def wizard_step(message):
+    conversation = conversations.get(message.chat.id)
+    if conversation is None:
+        return
+    state, data = conversation
+    step = WIZARD_STEPS.get(state)
+    if step is None:
+        conversations.clear(message.chat.id)
+        return
+    step(message, data)
+
 def run_bot():
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook()
+        return
     logger.info("Bot started...")
+    bot.remove_webhook()  # Polling is refused while a webhook from an earlier webhook-mode run is set
     bot.infinity_polling()
@@ -1,21 +1,36 @@
 import time
 import threading
-from config import logger
+from config import SCRAPER_MODE, logger
 from database import init_db
 from bot import run_bot
-from scraper import run_scraper
+from dispatcher import run_dispatcher
+from retention import run_compactor
+import metrics
 
 # --- Main Engine ---
 if __name__ == "__main__":
     init_db()
+    metrics.start_server()
     
     # Thread 1: Telegram Bot
     t1 = threading.Thread(target=run_bot, daemon=True)
     t1.start()
     
-    # Thread 2: Scraper Loop
-    t2 = threading.Thread(target=run_scraper, daemon=True)
-    t2.start()
+    # Thread 2: Scraper Loop (in workers mode, worker.py processes scrape instead)
+    if SCRAPER_MODE == "embedded":
+        from scraper import run_scraper  # Imported here so workers mode never loads Playwright
+        t2 = threading.Thread(target=run_scraper, daemon=True)
+        t2.start()
+    else:
+        logger.info("Scraper mode 'workers': start worker.py processes to scan searches.")
+
+    # Thread 3: Notification Dispatcher (drains the outbox the scraper fills)
+    t3 = threading.Thread(target=run_dispatcher, daemon=True)
+    t3.start()
+
+    # Thread 4: History Compactor (prunes dedup rows past the retention window)
+    t4 = threading.Thread(target=run_compactor, daemon=True)
+    t4.start()
     
     logger.info("� Bot engine started. Press Ctrl+C to stop.")
     
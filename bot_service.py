@@ -0,0 +1,24 @@
+"""Telegram side only: bot poller, notification dispatcher and history compactor.
+
+Usage: python bot_service.py
+
+Imports nothing browser-related, so it starts fast, stays small and keeps
+answering while the scraper restarts. Run scraper_service.py (or worker.py)
+next to it against the same DB_FILE; rescan requests reach the scraper
+through the scan_requests table.
+"""
+import threading
+from config import logger
+from database import init_db
+from bot import run_bot
+from dispatcher import run_dispatcher
+from retention import run_compactor
+import metrics
+
+if __name__ == "__main__":
+    init_db()
+    metrics.start_server()
+    threading.Thread(target=run_dispatcher, daemon=True).start()
+    threading.Thread(target=run_compactor, daemon=True).start()
+    logger.info("Bot service started (scraper runs as a separate process).")
+    run_bot()
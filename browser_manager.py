@@ -0,0 +1,360 @@
+import os
+import time
+import random
+import asyncio
+from contextlib import contextmanager, asynccontextmanager
+from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+from playwright_stealth import Stealth
+
+from config import (
+    BROWSER_MAX_PAGES_PER_CONTEXT, BROWSER_MAX_RSS_MB, SESSION_POOL_SIZE, SESSION_MAX_AGE, SESSION_MAX_FAILURES, logger
+)
+from network_policy import policy as network_policy
+from session_pool import SessionPool
+
+def context_options():
+    """Stealth context settings with a randomized viewport."""
+    return {
+        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+        "viewport": {"width": random.randint(1800, 1920), "height": random.randint(900, 1080)},
+        "locale": "he-IL"
+    }
+
+# Shared by the sync and async managers of a process
+session_pool = SessionPool(SESSION_POOL_SIZE, SESSION_MAX_AGE, SESSION_MAX_FAILURES, context_options)
+
+def browser_rss_mb():
+    """Total RSS (MB) of this process's descendants: the Playwright driver and Chromium.
+
+    Reads /proc, so it returns 0 where that is unavailable.
+    """
+    children = {}
+    rss_kb = {}
+    try:
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    fields = dict(line.split(":", 1) for line in f if ":" in line)
+            except OSError:
+                continue
+            children.setdefault(int(fields.get("PPid", "0").strip()), []).append(int(pid))
+            rss_kb[int(pid)] = int(fields.get("VmRSS", "0 kB").split()[0])
+    except OSError:
+        return 0
+
+    total = 0
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        total += rss_kb.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total / 1024
+
+# --- Browser Lifecycle ---
+class _BrowserStats:
+    """Lifetime counters shared by the sync and async managers."""
+
+    def __init__(self, max_pages_per_context, max_rss_mb, sessions):
+        self.max_pages_per_context = max_pages_per_context
+        self.max_rss_mb = max_rss_mb
+        self.sessions = sessions
+        self.stealth = Stealth()
+        self.started_at = None
+        self.launches = 0
+        self.crash_restarts = 0
+        self.memory_restarts = 0
+        self.contexts_created = 0
+        self.contexts_recycled = 0
+        self.pages_served = 0
+        self.last_rss_mb = 0.0
+
+    def _over_memory(self):
+        if not self.max_rss_mb:
+            return False
+        self.last_rss_mb = browser_rss_mb()
+        return self.last_rss_mb > self.max_rss_mb
+
+    def stats(self):
+        return {
+            "uptime": time.time() - self.started_at if self.started_at else 0.0,
+            "launches": self.launches,
+            "crash_restarts": self.crash_restarts,
+            "memory_restarts": self.memory_restarts,
+            "contexts_created": self.contexts_created,
+            "contexts_recycled": self.contexts_recycled,
+            "pages_served": self.pages_served,
+            "rss_mb": self.last_rss_mb,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(f"🧭 Browser: up {stats['uptime'] / 3600:.1f}h | {stats['launches']} launches "
+                    f"({stats['crash_restarts']} crash, {stats['memory_restarts']} memory restarts) | "
+                    f"{stats['contexts_created']} contexts | {stats['pages_served']} pages | "
+                    f"RSS {stats['rss_mb']:.0f} MB")
+        self.sessions.log_stats()
+
+class BrowserManager(_BrowserStats):
+    """Keeps one Chromium alive across scans for the sync engine.
+
+    A context is reused for max_pages_per_context pages, then recycled. Each new
+    context takes an identity from the session pool and starts with its saved
+    cookies; a context whose identity was retired (blocked) is dropped at once.
+    The browser is relaunched if it disconnects (crash) or its RSS exceeds
+    max_rss_mb. Sync Playwright objects belong to the thread that started them,
+    so only the scraper thread may use a manager.
+    """
+
+    def __init__(self, max_pages_per_context=BROWSER_MAX_PAGES_PER_CONTEXT, max_rss_mb=BROWSER_MAX_RSS_MB,
+                 sessions=session_pool):
+        super().__init__(max_pages_per_context, max_rss_mb, sessions)
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._context_pages = 0
+        self._session = None
+
+    def _launch(self):
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch(headless=True)
+        if self._context is not None:
+            # Went down with the old browser; its identity keeps the state saved last time
+            self.sessions.release(self._session)
+            self._context = None
+            self._session = None
+        self.launches += 1
+        if self.started_at is None:
+            self.started_at = time.time()
+
+    def _ensure_browser(self):
+        if self._browser is None:
+            self._launch()
+        elif not self._browser.is_connected():
+            logger.warning("Browser disconnected, relaunching...")
+            self.crash_restarts += 1
+            self._launch()
+
+    def _ensure_context(self):
+        if self._context is not None and self._context_pages >= self.max_pages_per_context:
+            self._close_context()
+            self.contexts_recycled += 1
+        if self._context is None:
+            self._session, options = self.sessions.checkout()
+            self._context = self._browser.new_context(**options)
+            if network_policy:
+                network_policy.install(self._context)
+            self._context_pages = 0
+            self.contexts_created += 1
+
+    def _storage_state(self):
+        if self._session is None or self._session.retired:
+            return None
+        try:
+            return self._context.storage_state()
+        except Exception as e:
+            logger.debug(f"Error reading storage state: {e}")
+            return None
+
+    def _close_context(self):
+        if self._context is not None:
+            state = self._storage_state()
+            try:
+                self._context.close()
+            except Exception as e:
+                logger.debug(f"Error closing context: {e}")
+            self.sessions.release(self._session, state)
+            self._context = None
+            self._session = None
+
+    def session_for(self, page):
+        """The session pool identity of page's context (None when the pool is off)."""
+        return self._session
+
+    def restart(self):
+        """Closes and relaunches the browser."""
+        self._close_context()
+        if self._browser is not None:
+            try:
+                self._browser.close()
+            except Exception as e:
+                logger.debug(f"Error closing browser: {e}")
+        self._launch()
+
+    @contextmanager
+    def page(self):
+        """Yields a fresh stealth page in the current context, recycling as needed afterwards."""
+        self._ensure_browser()
+        self._ensure_context()
+        page = self._context.new_page()
+        self.stealth.apply_stealth_sync(page)
+        try:
+            yield page
+        finally:
+            try:
+                page.close()
+            except Exception as e:
+                logger.debug(f"Error closing page: {e}")
+            self._context_pages += 1
+            self.pages_served += 1
+            if self._session is not None and self._session.retired:
+                self._close_context()
+                self.contexts_recycled += 1
+            elif self._context_pages == 1:
+                # Keep a new context's first-visit cookies even if it never gets recycled cleanly
+                self.sessions.save(self._session, self._storage_state())
+            if self._over_memory():
+                logger.warning(f"Browser RSS {self.last_rss_mb:.0f} MB over {self.max_rss_mb} MB, restarting...")
+                self.memory_restarts += 1
+                self.restart()
+
+    def close(self):
+        self._close_context()
+        if self._browser is not None:
+            self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+
+class AsyncBrowserManager(_BrowserStats):
+    """Async counterpart of BrowserManager with a bounded pool of contexts.
+
+    Each page gets a context to itself; idle contexts are reused up to
+    max_pages_per_context pages, each keeping the session pool identity it was
+    created with. Restarts for memory wait until no page is open. It must stay
+    on the event loop it was first used from.
+    """
+
+    def __init__(self, pool_size, max_pages_per_context=BROWSER_MAX_PAGES_PER_CONTEXT,
+                 max_rss_mb=BROWSER_MAX_RSS_MB, sessions=session_pool):
+        super().__init__(max_pages_per_context, max_rss_mb, sessions)
+        self.pool_size = pool_size
+        self._playwright = None
+        self._browser = None
+        self._idle = []  # [context, pages served, session]
+        self._page_sessions = {}  # open page -> session of its context
+        self._slots = None
+        self._lifecycle = None
+        self._open_pages = 0
+        self._restart_pending = False
+
+    async def _launch(self):
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        for _, _, session in self._idle:
+            await asyncio.to_thread(self.sessions.release, session)
+        self._idle = []
+        self.launches += 1
+        if self.started_at is None:
+            self.started_at = time.time()
+
+    async def _ensure_browser(self):
+        if self._browser is None:
+            await self._launch()
+        elif not self._browser.is_connected():
+            logger.warning("Browser disconnected, relaunching...")
+            self.crash_restarts += 1
+            await self._launch()
+
+    async def _acquire_context(self):
+        if self._idle:
+            return self._idle.pop()
+        session, options = await asyncio.to_thread(self.sessions.checkout)
+        context = await self._browser.new_context(**options)
+        if network_policy:
+            await network_policy.install_async(context)
+        self.contexts_created += 1
+        return [context, 0, session]
+
+    async def _storage_state(self, slot):
+        if slot[2] is None or slot[2].retired:
+            return None
+        try:
+            return await slot[0].storage_state()
+        except Exception as e:
+            logger.debug(f"Error reading storage state: {e}")
+            return None
+
+    async def _close_context(self, slot):
+        state = await self._storage_state(slot)
+        try:
+            await slot[0].close()
+        except Exception as e:
+            logger.debug(f"Error closing context: {e}")
+        await asyncio.to_thread(self.sessions.release, slot[2], state)
+
+    def session_for(self, page):
+        """The session pool identity of page's context (None when the pool is off)."""
+        return self._page_sessions.get(page)
+
+    async def restart(self):
+        idle, self._idle = self._idle, []
+        for slot in idle:
+            await self._close_context(slot)
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception as e:
+                logger.debug(f"Error closing browser: {e}")
+        await self._launch()
+
+    @asynccontextmanager
+    async def page(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._lifecycle = asyncio.Lock()
+        async with self._slots:
+            # Launches, restarts and context handout are serialized so no page is created mid-restart
+            async with self._lifecycle:
+                await self._ensure_browser()
+                if self._restart_pending and self._open_pages == 0:
+                    self._restart_pending = False
+                    self.memory_restarts += 1
+                    await self.restart()
+                slot = await self._acquire_context()
+                browser = self._browser
+                page = await slot[0].new_page()
+                self._page_sessions[page] = slot[2]
+                self._open_pages += 1
+            await self.stealth.apply_stealth_async(page)
+            try:
+                yield page
+            finally:
+                self._open_pages -= 1
+                self.pages_served += 1
+                self._page_sessions.pop(page, None)
+                slot[1] += 1
+                try:
+                    await page.close()
+                except Exception as e:
+                    logger.debug(f"Error closing page: {e}")
+
+                retired = slot[2] is not None and slot[2].retired
+                if browser is not self._browser:
+                    await asyncio.to_thread(self.sessions.release, slot[2])
+                    self.contexts_recycled += 1
+                elif retired or slot[1] >= self.max_pages_per_context:
+                    await self._close_context(slot)
+                    self.contexts_recycled += 1
+                else:
+                    if slot[1] == 1:
+                        state = await self._storage_state(slot)
+                        await asyncio.to_thread(self.sessions.save, slot[2], state)
+                    self._idle.append(slot)
+
+                if not self._restart_pending and await asyncio.to_thread(self._over_memory):
+                    logger.warning(f"Browser RSS {self.last_rss_mb:.0f} MB over {self.max_rss_mb} MB, restart scheduled.")
+                    self._restart_pending = True
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
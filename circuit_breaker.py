@@ -0,0 +1,106 @@
+import time
+import threading
+
+from config import logger
+from block_detector import BLOCKED, ERROR
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# --- Global Circuit Breaker ---
+class CircuitBreaker:
+    """Pauses all scraping after consecutive block pages.
+
+    After threshold consecutive BLOCKED outcomes the breaker opens for
+    base_backoff seconds. Once that has passed, acquire() grants a single probe
+    (half-open). If the probe is blocked the breaker opens again with double the
+    backoff (up to max_backoff); any other outcome closes it. Outcomes of
+    requests that started before the breaker opened do not count as the probe.
+    """
+
+    def __init__(self, threshold, base_backoff, max_backoff):
+        self.threshold = threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.backoff = base_backoff
+        self.open_until = 0.0
+        self.consecutive_blocks = 0
+        self.trips = 0
+        self.probes = 0
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def _open(self, now):
+        self.state = OPEN
+        self.open_until = now + self.backoff
+        self.trips += 1
+        logger.warning(f"🛑 Circuit breaker open: scraping paused for {self.backoff:.0f}s "
+                       f"after {self.consecutive_blocks} blocked load(s).")
+
+    def seconds_until_probe(self):
+        """0 when scraping may proceed (closed, or a probe is due), else seconds to wait."""
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            if self.state == HALF_OPEN:
+                return max(self.base_backoff, 1.0)  # A probe is in flight
+            return max(0.0, self.open_until - time.time())
+
+    def acquire(self):
+        """Returns "normal" or "probe" if a page load may start now, else None."""
+        with self._lock:
+            if self.state == CLOSED:
+                return "normal"
+            if self.state == OPEN and time.time() >= self.open_until:
+                self.state = HALF_OPEN
+                self.probes += 1
+                logger.info("Circuit breaker half-open: probing with a single request...")
+                return "probe"
+            return None
+
+    def record(self, outcome, ticket="normal"):
+        """Records the outcome of a load started with the given acquire() ticket."""
+        metrics.inc("yad2bot_scan_outcomes_total", outcome=outcome)
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            now = time.time()
+            if ticket == "probe":
+                if outcome == BLOCKED:
+                    self.consecutive_blocks += 1
+                    self.backoff = min(self.backoff * 2, self.max_backoff)
+                    self._open(now)
+                else:
+                    logger.info(f"✅ Circuit breaker closed: probe came back {outcome}.")
+                    self.state = CLOSED
+                    self.backoff = self.base_backoff
+                    self.consecutive_blocks = 0
+                return
+
+            if self.state != CLOSED:
+                return
+            if outcome == BLOCKED:
+                self.consecutive_blocks += 1
+                if self.consecutive_blocks >= self.threshold:
+                    self._open(now)
+            elif outcome != ERROR:
+                self.consecutive_blocks = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_blocks": self.consecutive_blocks,
+                "backoff": self.backoff,
+                "reopens_in": max(0.0, self.open_until - time.time()) if self.state == OPEN else 0.0,
+                "trips": self.trips,
+                "probes": self.probes,
+                "outcomes": dict(self.outcomes),
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(f"🚦 Circuit breaker: {stats['state']} | {stats['trips']} trips, {stats['probes']} probes | "
+                    f"backoff {stats['backoff']:.0f}s | outcomes {stats['outcomes']}")
@@ -3,18 +3,21 @@ import logging
 import telebot
 from dotenv import load_dotenv
 
+from log_setup import setup_logging
+
 load_dotenv()
 
 # --- Logging Setup ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Records are queued and written by a background thread (see log_setup.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")  # Empty logs to the console only
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # Size rotation (when LOG_ROTATE_WHEN is empty)
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")  # Rotate by time instead, e.g. "midnight" or "H"
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))  # Rotated files kept, gzip-compressed
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"  # JSON lines with user/ad/search/phase fields in the log file
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Records waiting for the writer; more are dropped
+
+setup_logging(LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE_WHEN, LOG_BACKUPS, LOG_JSON, LOG_QUEUE_SIZE)
 logger = logging.getLogger("yad2bot")
 
 # --- Configuration ---
@@ -23,14 +26,120 @@ if not TOKEN:
     raise ValueError("No TELEGRAM_TOKEN found in environment variables")
 
 USERS_FILE = "users.json"
-DB_FILE = "production.db"
-MIN_SLEEP = 28 * 60  # 28 minutes
-MAX_SLEEP = 32 * 60  # 32 minutes
+DB_FILE = os.getenv("DB_FILE", "production.db")
+
+# Adaptive polling: each distinct search gets its own interval, driven by its new-ad rate
+SCHED_MIN_INTERVAL = int(os.getenv("SCHED_MIN_INTERVAL", str(5 * 60)))  # 5 minutes for hot searches
+SCHED_MAX_INTERVAL = int(os.getenv("SCHED_MAX_INTERVAL", str(32 * 60)))  # 32 minutes for dead ones
+SCHED_INITIAL_INTERVAL = int(os.getenv("SCHED_INITIAL_INTERVAL", str(15 * 60)))
+SCHED_TARGET_NEW_PER_POLL = float(os.getenv("SCHED_TARGET_NEW_PER_POLL", "1"))  # Aim for ~1 new ad per poll
+PAGE_LOAD_BUDGET_PER_HOUR = int(os.getenv("PAGE_LOAD_BUDGET_PER_HOUR", "240"))  # Across all searches
+SCHED_BATCH = int(os.getenv("SCHED_BATCH", "10"))  # Max searches started per scheduler tick
+SCHED_TICK = int(os.getenv("SCHED_TICK", "30"))  # Max seconds between scheduler checks
+
+# Scraper placement: "embedded" (a thread in bot_engine) or "workers" (separate worker.py processes sharing the DB)
+SCRAPER_MODE = os.getenv("SCRAPER_MODE", "embedded")
+JOB_LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", "300"))  # Seconds a claimed search stays leased without a heartbeat
+JOB_MAX_RUNTIME = float(os.getenv("JOB_MAX_RUNTIME", "1800"))  # Heartbeats stop after this, so a hung worker's jobs expire
+WORKER_BATCH = int(os.getenv("WORKER_BATCH", "4"))  # Searches claimed per worker at a time
+SCAN_REQUEST_POLL = float(os.getenv("SCAN_REQUEST_POLL", "2"))  # Seconds between checks for rescan requests from the bot
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "300"))  # A rescan of a search fetched this recently reuses the fetch
+
+# Scraping engine: "sync" (one search at a time) or "async" (concurrent searches on one browser)
+SCRAPER_ENGINE = os.getenv("SCRAPER_ENGINE", "sync")
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "4"))  # Max open contexts in async mode
+HOST_CONCURRENCY = int(os.getenv("HOST_CONCURRENCY", "2"))  # Max parallel page loads per host
+HOST_MIN_INTERVAL = float(os.getenv("HOST_MIN_INTERVAL", "3"))  # Seconds between page loads to one host
+BROWSER_MAX_PAGES_PER_CONTEXT = int(os.getenv("BROWSER_MAX_PAGES_PER_CONTEXT", "20"))  # Then the context is recycled
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1500"))  # Browser restarts above this (0 = no limit)
+SESSION_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", "4"))  # Browser identities whose cookies are kept (0 = every context cold)
+SESSION_MAX_AGE = float(os.getenv("SESSION_MAX_AGE", str(24 * 3600)))  # Seconds before an identity is replaced
+SESSION_MAX_FAILURES = int(os.getenv("SESSION_MAX_FAILURES", "3"))  # Consecutive failed loads that retire an identity
+
+# Fetch mode: "browser" (Playwright render) or "http" (plain HTTP + HTML parsing, browser as fallback)
+FETCH_MODE = os.getenv("FETCH_MODE", "browser")
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+MAX_FEED_PAGES = int(os.getenv("MAX_FEED_PAGES", "3"))  # Deepest feed page scanned when every item is new
+
+# Crawl mode: "search" (one feed per distinct user URL) or "city" (one broad feed per city, matched in memory)
+CRAWL_MODE = os.getenv("CRAWL_MODE", "search")
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "20000"))  # Parsed ads kept in memory (0 = no cache)
+
+# Readiness waits (upper bounds, in seconds; the scraper moves on as soon as the feed is ready)
+FEED_READY_TIMEOUT = float(os.getenv("FEED_READY_TIMEOUT", "15"))  # First feed item must appear within this
+FEED_SETTLE_TIMEOUT = float(os.getenv("FEED_SETTLE_TIMEOUT", "5"))  # Max wait for the item count to settle
+FEED_STABLE_MS = int(os.getenv("FEED_STABLE_MS", "500"))  # Item count unchanged this long = settled
+FEED_WAIT_NETWORK_IDLE = os.getenv("FEED_WAIT_NETWORK_IDLE", "0") == "1"
+PAGE_LOAD_RETRIES = int(os.getenv("PAGE_LOAD_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "2"))  # Seconds before the first retry, doubled each time
+
+# Metrics: Prometheus text at http://127.0.0.1:METRICS_PORT/metrics, plus an optional JSON line per scan cycle
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 = no endpoint; give each process its own port
+METRICS_TRACE_FILE = os.getenv("METRICS_TRACE_FILE", "")
+
+# Circuit breaker: consecutive block pages pause all scraping, with doubling backoff between probes
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "2"))
+BREAKER_BASE_BACKOFF = float(os.getenv("BREAKER_BASE_BACKOFF", "300"))
+BREAKER_MAX_BACKOFF = float(os.getenv("BREAKER_MAX_BACKOFF", "7200"))
+
+# Pacing between page loads (sync engine), measured from the start of the previous load
+SEARCH_MIN_INTERVAL = float(os.getenv("SEARCH_MIN_INTERVAL", "5"))
+SEARCH_JITTER = float(os.getenv("SEARCH_JITTER", "5"))
+
+# Notification dispatcher (Telegram allows ~30 msg/s overall and ~1 msg/s per chat)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # Messages per second, all chats
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1.1"))  # Seconds between messages to one chat
+DISPATCH_BATCH = int(os.getenv("DISPATCH_BATCH", "50"))
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "8"))
+DISPATCH_RETRY_BASE = float(os.getenv("DISPATCH_RETRY_BASE", "5"))  # Seconds, doubled per failed attempt
+DISPATCH_IDLE_SLEEP = float(os.getenv("DISPATCH_IDLE_SLEEP", "1"))
+DIGEST_MEDIA_GROUP = os.getenv("DIGEST_MEDIA_GROUP", "0") == "1"  # Digest ads with thumbnails go out as photo albums
+
+# History retention: the scraper ignores ads older than 3 days, so older dedup rows are never needed
+NOTIFICATION_RETENTION_DAYS = float(os.getenv("NOTIFICATION_RETENTION_DAYS", "30"))
+COMPACT_INTERVAL = float(os.getenv("COMPACT_INTERVAL", "3600"))  # Seconds between compaction runs
+COMPACT_BATCH = int(os.getenv("COMPACT_BATCH", "5000"))  # Rows deleted per transaction
+
+# Listing archive: every parsed feed item as gzip JSONL, one segment per city and day, for backfill and replay
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")  # Empty disables the archive
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "30"))
+ARCHIVE_FLUSH_RECORDS = int(os.getenv("ARCHIVE_FLUSH_RECORDS", "2000"))  # Buffered records written out at once
+
+# Browser network policy: requests the scraper never needs are aborted before they are sent
+NETWORK_POLICY_ENABLED = os.getenv("NETWORK_POLICY_ENABLED", "1") == "1"
+BLOCK_RESOURCE_TYPES = [t for t in os.getenv("BLOCK_RESOURCE_TYPES", "image,media,font").split(",") if t]
+BLOCK_DOMAINS = [d for d in os.getenv(
+    "BLOCK_DOMAINS",
+    "google-analytics.com,googletagmanager.com,doubleclick.net,googlesyndication.com,"
+    "googleadservices.com,facebook.net,facebook.com,hotjar.com,taboola.com,outbrain.com,"
+    "criteo.com,clarity.ms,tiktok.com"
+).split(",") if d]
+ALLOW_DOMAINS = [d for d in os.getenv("ALLOW_DOMAINS", "").split(",") if d]  # Empty = any domain not denied
+
+# Endpoint overrides, for pointing the scraper and the bot at local stand-ins (see benchmarks/bench_e2e.py)
+YAD2_ORIGIN = os.getenv("YAD2_ORIGIN", "https://www.yad2.co.il").rstrip("/")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")  # e.g. http://127.0.0.1:8081/bot{0}/{1}
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL
+
+# Receiving updates: "polling" (long polling) or "webhook" (Telegram POSTs updates to a local server)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "4"))  # Threads running handlers
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public HTTPS URL Telegram posts to (TLS ends at a reverse proxy)
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Empty = a random secret per start
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Parallel deliveries Telegram may open
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))  # Updates waiting for a worker; beyond it Telegram retries
 
-bot = telebot.TeleBot(TOKEN)
+# Filter wizard state: "sqlite" (survives restarts) or "memory"
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "sqlite")
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "3600"))  # Seconds before an abandoned wizard is dropped
 
-# User data storage (in-memory for conversation steps)
-user_data = {}
+# In webhook mode handlers run on the webhook's own bounded pool
+bot = telebot.TeleBot(TOKEN, threaded=BOT_MODE != "webhook", num_threads=BOT_WORKERS)
 
 # City codes mapping
 CITIES = {
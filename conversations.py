@@ -0,0 +1,72 @@
+import time
+import threading
+from collections import OrderedDict
+
+from config import CONVERSATION_STORE, CONVERSATION_TTL, logger
+from database import load_conversation, save_conversation, delete_conversation, expire_conversations
+
+# --- Conversation State ---
+# A conversation is (state, data): the wizard step the user is on and the
+# answers so far. Both stores drop conversations untouched for ttl seconds.
+class MemoryConversations:
+    """Conversation state in process memory, bounded by ttl and max_size (lost on restart)."""
+
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()  # user_id -> (state, data, updated_at), least recently updated first
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._items.get(str(user_id))
+            if item is None or time.time() - item[2] > self.ttl:
+                return None
+            return item[0], dict(item[1])
+
+    def set(self, user_id, state, data):
+        with self._lock:
+            self._items[str(user_id)] = (state, dict(data), time.time())
+            self._items.move_to_end(str(user_id))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self, user_id):
+        with self._lock:
+            self._items.pop(str(user_id), None)
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        expired = 0
+        with self._lock:
+            while self._items and next(iter(self._items.values()))[2] < cutoff:
+                self._items.popitem(last=False)
+                expired += 1
+        return expired
+
+class SqliteConversations:
+    """Conversation state in the conversations table, so a wizard survives a bot restart."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def get(self, user_id):
+        return load_conversation(user_id, time.time() - self.ttl)
+
+    def set(self, user_id, state, data):
+        save_conversation(user_id, state, data)
+
+    def clear(self, user_id):
+        delete_conversation(user_id)
+
+    def expire(self):
+        return expire_conversations(time.time() - self.ttl)
+
+def make_store():
+    if CONVERSATION_STORE == "memory":
+        return MemoryConversations(CONVERSATION_TTL)
+    if CONVERSATION_STORE != "sqlite":
+        logger.warning(f"Unknown CONVERSATION_STORE={CONVERSATION_STORE}, using sqlite.")
+    return SqliteConversations(CONVERSATION_TTL)
+
+conversations = make_store()
@@ -1,96 +1,773 @@
 import os
 import json
+import time
 import sqlite3
+import threading
 from config import DB_FILE, USERS_FILE, logger
+from utils import parse_search_url
+import metrics
+
+# --- Connection Management ---
+# One persistent connection per thread. WAL lets the scraper read while the bot
+# thread writes, and sqlite3's statement cache keeps the fixed SQL below prepared.
+_local = threading.local()
+
+PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",  # Only takes effect on a new DB; init_db converts old ones
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
+def get_connection():
+    """Returns this thread's persistent, tuned connection to DB_FILE."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
+
+def close_connection():
+    """Closes this thread's connection, if one was opened."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
 
 # --- Database Management ---
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS notifications (ad_id TEXT, user_id TEXT, PRIMARY KEY (ad_id, user_id))")
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            url TEXT NOT NULL,
-            active INTEGER DEFAULT 1
-        )
-    """)
-    conn.commit()
-    
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS notifications "
+            "(ad_id TEXT, user_id TEXT, notified_at REAL, PRIMARY KEY (ad_id, user_id))"
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                active INTEGER DEFAULT 1,
+                digest INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_state (
+                search_key TEXT PRIMARY KEY,
+                seen_ids TEXT NOT NULL,
+                newest_date TEXT,
+                subscribers TEXT,
+                updated_at INTEGER
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ad_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                image_url TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                UNIQUE (ad_id, user_id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ads (
+                ad_id TEXT PRIMARY KEY,
+                link TEXT NOT NULL,
+                price INTEGER,
+                rooms REAL,
+                ad_date TEXT,
+                address TEXT,
+                city TEXT,
+                price_text TEXT,
+                rooms_text TEXT,
+                image_url TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ads_updated ON ads (updated_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                search_key TEXT PRIMARY KEY,
+                user_ids TEXT NOT NULL,
+                due_at REAL NOT NULL,
+                interval REAL NOT NULL,
+                rate REAL,
+                last_run REAL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                heartbeat_at REAL,
+                runs INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (due_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scan_requests (
+                user_id TEXT PRIMARY KEY,
+                requested_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                user_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive_segments (
+                path TEXT PRIMARY KEY,
+                city_code TEXT NOT NULL,
+                day TEXT NOT NULL,
+                records INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_city_day ON archive_segments (city_code, day)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS browser_sessions (
+                session_id TEXT PRIMARY KEY,
+                options TEXT NOT NULL,
+                state TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                pages INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
     # Auto-migrate from users.json if it exists
     if os.path.exists(USERS_FILE):
         try:
             with open(USERS_FILE, "r", encoding="utf-8") as f:
                 json_users = json.load(f)
-            for uid, val in json_users.items():
-                url = val if isinstance(val, str) else val.get("url", "")
-                active = True if isinstance(val, str) else val.get("active", True)
-                cursor.execute(
-                    "INSERT OR IGNORE INTO users (user_id, url, active) VALUES (?, ?, ?)",
-                    (str(uid), url, 1 if active else 0)
-                )
-            conn.commit()
+            with conn:
+                for uid, val in json_users.items():
+                    url = val if isinstance(val, str) else val.get("url", "")
+                    active = True if isinstance(val, str) else val.get("active", True)
+                    conn.execute(
+                        "INSERT OR IGNORE INTO users (user_id, url, active) VALUES (?, ?, ?)",
+                        (str(uid), url, 1 if active else 0)
+                    )
             os.rename(USERS_FILE, USERS_FILE + ".bak")
             logger.info(f"Migrated {len(json_users)} users from users.json to DB. Old file renamed to users.json.bak")
         except Exception as e:
             logger.error(f"Error migrating users.json: {e}")
-    
-    conn.close()
+
+    migrate_user_filters(conn)
+    migrate_notifications(conn)
+    migrate_columns(conn)
+    enable_incremental_vacuum(conn)
+
+def migrate_notifications(conn):
+    """Adds notified_at to notifications; rows from before it count as notified now."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(notifications)")}
+    with conn:
+        if "notified_at" not in existing:
+            conn.execute("ALTER TABLE notifications ADD COLUMN notified_at REAL")
+            updated = conn.execute("UPDATE notifications SET notified_at = ? WHERE notified_at IS NULL", (time.time(),)).rowcount
+            logger.info(f"Added notified_at to notifications ({updated} existing rows stamped now).")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_notified_at ON notifications (notified_at)")
+
+# Columns added after their tables were first created: (table, column, definition)
+ADDED_COLUMNS = (
+    ("users", "digest", "INTEGER NOT NULL DEFAULT 0"),
+    ("outbox", "image_url", "TEXT"),
+    ("ads", "image_url", "TEXT"),
+)
+
+def migrate_columns(conn):
+    with conn:
+        for table, column, definition in ADDED_COLUMNS:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                logger.info(f"Added {table}.{column}.")
+
+def enable_incremental_vacuum(conn):
+    """Switches a DB created before auto_vacuum=INCREMENTAL over; needs one full VACUUM."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    logger.info("Converting database to incremental auto-vacuum (one-time VACUUM)...")
+    start = time.time()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    logger.info(f"Database converted in {time.time() - start:.1f}s.")
+
+FILTER_COLUMNS = (
+    ("city_code", "TEXT"),
+    ("min_price", "INTEGER"),
+    ("max_price", "INTEGER"),
+    ("min_rooms", "REAL"),
+    ("max_rooms", "REAL"),
+)
+
+def migrate_user_filters(conn):
+    """Adds the structured filter columns to users and backfills them from existing URLs."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    with conn:
+        for column, column_type in FILTER_COLUMNS:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE users ADD COLUMN {column} {column_type}")
+
+    rows = conn.execute("SELECT user_id, url FROM users WHERE city_code IS NULL").fetchall()
+    backfilled = 0
+    with conn:
+        for user_id, url in rows:
+            filters = parse_search_url(url)
+            if filters:
+                _save_filters(conn, user_id, filters)
+                backfilled += 1
+    if backfilled:
+        logger.info(f"Backfilled structured filters for {backfilled} users from their search URLs.")
+
+def _save_filters(conn, user_id, filters):
+    conn.execute(
+        "UPDATE users SET city_code = ?, min_price = ?, max_price = ?, min_rooms = ?, max_rooms = ? WHERE user_id = ?",
+        (str(filters["city_code"]), filters["min_price"], filters["max_price"],
+         filters["min_rooms"], filters["max_rooms"], str(user_id))
+    )
 
 def is_ad_notified(ad_id, user_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM notifications WHERE ad_id = ? AND user_id = ?", (ad_id, str(user_id)))
-    exists = cursor.fetchone() is not None
-    conn.close()
-    return exists
+    cursor = get_connection().execute(
+        "SELECT 1 FROM notifications WHERE ad_id = ? AND user_id = ?", (ad_id, str(user_id))
+    )
+    return cursor.fetchone() is not None
 
 def mark_ad_notified(ad_id, user_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO notifications (ad_id, user_id) VALUES (?, ?)", (ad_id, str(user_id)))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass
-    conn.close()
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO notifications (ad_id, user_id, notified_at) VALUES (?, ?, ?)",
+            (ad_id, str(user_id), time.time())
+        )
+
+@metrics.timed("yad2bot_db_seconds", op="known_ad_ids")
+def known_ad_ids(user_id, ad_ids):
+    """Returns the subset of ad_ids this user was notified about or has queued (or given up on) in the outbox."""
+    ad_ids = list(ad_ids)
+    if not ad_ids:
+        return set()
+    # json_each keeps a single prepared statement regardless of how many ids are passed
+    cursor = get_connection().execute(
+        "SELECT ad_id FROM notifications WHERE user_id = ?1 AND ad_id IN (SELECT value FROM json_each(?2)) "
+        "UNION SELECT ad_id FROM outbox WHERE user_id = ?1 AND ad_id IN (SELECT value FROM json_each(?2))",
+        (str(user_id), json.dumps(ad_ids))
+    )
+    return {row[0] for row in cursor}
+
+# --- Notification Outbox ---
+# Statuses: pending -> sending -> (row deleted + notifications row) on success,
+# back to pending with a later next_attempt_at on retry, or failed for good.
+@metrics.timed("yad2bot_db_seconds", op="enqueue_notifications")
+def enqueue_notifications(entries):
+    """Queues (ad_id, user_id, message, image_url) entries for the dispatcher. Returns how many were new.
+
+    An entry whose ad the user was already notified of is skipped in the same
+    statement, so a delivery completing between a caller's check and this insert
+    cannot queue the ad a second time.
+    """
+    now = time.time()
+    rows = [(ad_id, str(user_id), message, image_url or None, now) for ad_id, user_id, message, image_url in entries]
+    if not rows:
+        return 0
+    conn = get_connection()
+    with conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO outbox (ad_id, user_id, message, image_url, created_at) "
+            "SELECT ?1, ?2, ?3, ?4, ?5 "
+            "WHERE NOT EXISTS (SELECT 1 FROM notifications WHERE ad_id = ?1 AND user_id = ?2)", rows
+        )
+        return conn.total_changes - before
+
+OUTBOX_RETURNING = (
+    "RETURNING id, ad_id, user_id, message, attempts, image_url, "
+    "(SELECT digest FROM users WHERE users.user_id = outbox.user_id)"
+)
+
+@metrics.timed("yad2bot_db_seconds", op="claim_outbox")
+def claim_outbox(limit):
+    """Atomically moves up to limit due entries to 'sending' and returns them.
+
+    For users in digest mode, every other due entry of theirs is claimed along
+    with the batch, so a cycle's ads are not split across two digests.
+    """
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        rows = conn.execute(
+            "UPDATE outbox SET status = 'sending' WHERE id IN ("
+            "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?"
+            f") {OUTBOX_RETURNING}",
+            (now, limit)
+        ).fetchall()
+        digest_users = sorted({r[2] for r in rows if r[6]})
+        if digest_users:
+            rows += conn.execute(
+                "UPDATE outbox SET status = 'sending' WHERE status = 'pending' AND next_attempt_at <= ? "
+                f"AND user_id IN (SELECT value FROM json_each(?)) {OUTBOX_RETURNING}",
+                (now, json.dumps(digest_users))
+            ).fetchall()
+    rows.sort()
+    return [
+        {"id": r[0], "ad_id": r[1], "user_id": r[2], "message": r[3], "attempts": r[4],
+         "image_url": r[5], "digest": bool(r[6])}
+        for r in rows
+    ]
+
+@metrics.timed("yad2bot_db_seconds", op="complete_outbox")
+def complete_outbox(entry_id, ad_id, user_id):
+    """Records a delivered entry: marks the ad notified and drops it from the outbox, atomically."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO notifications (ad_id, user_id, notified_at) VALUES (?, ?, ?)",
+            (ad_id, str(user_id), time.time())
+        )
+        conn.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+
+@metrics.timed("yad2bot_db_seconds", op="complete_outbox_many")
+def complete_outbox_many(entries):
+    """complete_outbox for every entry sent together in one digest, in one transaction."""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO notifications (ad_id, user_id, notified_at) VALUES (?, ?, ?)",
+            [(entry["ad_id"], str(entry["user_id"]), now) for entry in entries]
+        )
+        conn.execute(
+            "DELETE FROM outbox WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([entry["id"] for entry in entries]),)
+        )
+
+def reschedule_outbox(entry_id, delay, error=None, count_attempt=True):
+    """Returns an entry to 'pending' after delay seconds."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = COALESCE(?, last_error), "
+            "attempts = attempts + ? WHERE id = ?",
+            (time.time() + delay, error, 1 if count_attempt else 0, entry_id)
+        )
+
+def fail_outbox(entry_id, error):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+            (error, entry_id)
+        )
+
+def requeue_stale_outbox():
+    """Returns entries left in 'sending' by a crashed dispatcher to 'pending'."""
+    conn = get_connection()
+    with conn:
+        return conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'").rowcount
+
+def outbox_depth():
+    return get_connection().execute("SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+# --- Scrape Job Leases ---
+# One row per planned search. A worker claims due rows by writing itself into
+# lease_owner with an expiry, extends the lease by heartbeat while it works and
+# clears it on completion. A lease that expires (worker died or hung) makes the
+# job claimable again. Dedup stays exactly-once regardless, through the outbox's
+# UNIQUE (ad_id, user_id).
+JOB_COLUMNS = ("search_key", "user_ids", "due_at", "interval", "rate", "last_run")
+
+def sync_jobs(searches, initial_interval):
+    """Makes jobs match the planned {search_key: user_ids}: adds new searches (due now),
+    updates changed subscriber lists and drops searches nobody subscribes to anymore.
+    """
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO jobs (search_key, user_ids, due_at, interval) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (search_key) DO UPDATE SET user_ids = excluded.user_ids "
+            "WHERE user_ids != excluded.user_ids",
+            [(key, json.dumps(sorted(user_ids)), now, initial_interval) for key, user_ids in searches.items()]
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE search_key NOT IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(searches)),)
+        )
+
+@metrics.timed("yad2bot_db_seconds", op="claim_jobs")
+def claim_jobs(owner, limit, lease_ttl):
+    """Atomically leases up to limit due, unleased (or lease-expired) jobs to owner and returns them."""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        rows = conn.execute(
+            "UPDATE jobs SET lease_owner = ?1, lease_expires = ?2, heartbeat_at = ?3, runs = runs + 1 "
+            "WHERE search_key IN ("
+            "SELECT search_key FROM jobs WHERE due_at <= ?3 AND (lease_owner IS NULL OR lease_expires < ?3) "
+            "ORDER BY due_at LIMIT ?4"
+            f") RETURNING {', '.join(JOB_COLUMNS)}",
+            (owner, now + lease_ttl, now, limit)
+        ).fetchall()
+    jobs = [dict(zip(JOB_COLUMNS, row)) for row in rows]
+    for job in jobs:
+        job["user_ids"] = json.loads(job["user_ids"])
+    jobs.sort(key=lambda job: job["due_at"])
+    return jobs
+
+def heartbeat_jobs(owner, keys, lease_ttl):
+    """Extends owner's leases on keys. Returns the keys it still holds."""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        rows = conn.execute(
+            "UPDATE jobs SET lease_expires = ?, heartbeat_at = ? "
+            "WHERE lease_owner = ? AND search_key IN (SELECT value FROM json_each(?)) RETURNING search_key",
+            (now + lease_ttl, now, owner, json.dumps(list(keys)))
+        ).fetchall()
+    return {row[0] for row in rows}
+
+@metrics.timed("yad2bot_db_seconds", op="complete_job")
+def complete_job(owner, key, due_at, interval, rate, last_run):
+    """Stores a finished job's schedule and releases its lease. False if owner no longer held it."""
+    conn = get_connection()
+    with conn:
+        updated = conn.execute(
+            "UPDATE jobs SET due_at = ?, interval = ?, rate = ?, last_run = ?, "
+            "lease_owner = NULL, lease_expires = NULL WHERE search_key = ? AND lease_owner = ?",
+            (due_at, interval, rate, last_run, key, owner)
+        ).rowcount
+    return updated > 0
+
+def release_job(owner, key):
+    """Gives a job back unchanged (it was not run)."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET lease_owner = NULL, lease_expires = NULL WHERE search_key = ? AND lease_owner = ?",
+            (key, owner)
+        )
+
+def job_stats():
+    now = time.time()
+    row = get_connection().execute(
+        "SELECT COUNT(*), SUM(due_at <= ?1 AND lease_owner IS NULL), "
+        "SUM(lease_owner IS NOT NULL AND lease_expires >= ?1), SUM(lease_owner IS NOT NULL AND lease_expires < ?1), "
+        "COUNT(DISTINCT lease_owner) FROM jobs",
+        (now,)
+    ).fetchone()
+    return {"jobs": row[0], "due": row[1] or 0, "leased": row[2] or 0, "expired": row[3] or 0, "workers": row[4]}
+
+# --- Scan Requests (bot -> scraper) ---
+# The bot process asks for an immediate rescan of a user's search (filter saved,
+# alerts re-enabled) by inserting here; the scraper process takes the rows.
+def request_scan(user_id):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO scan_requests (user_id, requested_at) VALUES (?, ?)",
+            (str(user_id), time.time())
+        )
+
+def scan_requests_pending():
+    return get_connection().execute("SELECT 1 FROM scan_requests LIMIT 1").fetchone() is not None
+
+def take_scan_requests():
+    """Removes and returns {user_id: requested_at} for every pending request."""
+    conn = get_connection()
+    with conn:
+        rows = conn.execute("DELETE FROM scan_requests RETURNING user_id, requested_at").fetchall()
+    return dict(rows)
+
+def make_jobs_due(keys):
+    """Makes the given jobs due ahead of all other due work (worker mode's counterpart of scraper.scan_now)."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET due_at = 0 WHERE search_key IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(keys)),)
+        )
+
+# --- Conversations (filter wizard state) ---
+def load_conversation(user_id, min_updated_at):
+    """Returns (state, data) for a conversation updated since min_updated_at, else None."""
+    row = get_connection().execute(
+        "SELECT state, data FROM conversations WHERE user_id = ? AND updated_at >= ?", (str(user_id), min_updated_at)
+    ).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+def save_conversation(user_id, state, data):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO conversations (user_id, state, data, updated_at) VALUES (?, ?, ?, ?)",
+            (str(user_id), state, json.dumps(data, ensure_ascii=False), time.time())
+        )
+
+def delete_conversation(user_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM conversations WHERE user_id = ?", (str(user_id),))
+
+def expire_conversations(cutoff):
+    conn = get_connection()
+    with conn:
+        return conn.execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,)).rowcount
+
+# --- Browser Sessions ---
+# Identities of the scraper's browser contexts: fixed context options plus the
+# Playwright storage_state (cookies and localStorage) saved from their last use.
+def load_browser_sessions():
+    """Every stored session as a dict, options and state decoded (state None until first saved)."""
+    rows = get_connection().execute(
+        "SELECT session_id, options, state, created_at, last_used, pages, failures FROM browser_sessions"
+    ).fetchall()
+    return [
+        {"session_id": row[0], "options": json.loads(row[1]), "state": json.loads(row[2]) if row[2] else None,
+         "created_at": row[3], "last_used": row[4], "pages": row[5], "failures": row[6]}
+        for row in rows
+    ]
+
+def save_browser_session(session_id, options, state, created_at, last_used, pages, failures):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO browser_sessions (session_id, options, state, created_at, last_used, pages, failures) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, json.dumps(options), json.dumps(state) if state is not None else None,
+             created_at, last_used, pages, failures)
+        )
+
+def delete_browser_session(session_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM browser_sessions WHERE session_id = ?", (session_id,))
+
+# --- Search State (high-water marks) ---
+@metrics.timed("yad2bot_db_seconds", op="load_search_state")
+def load_search_state(search_key):
+    """Returns the last scan's top ad ids, newest date and subscriber signature, or None."""
+    row = get_connection().execute(
+        "SELECT seen_ids, newest_date, subscribers FROM search_state WHERE search_key = ?", (search_key,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"seen_ids": json.loads(row[0]), "newest_date": row[1], "subscribers": row[2]}
+
+@metrics.timed("yad2bot_db_seconds", op="save_search_state")
+def save_search_state(search_key, seen_ids, newest_date, subscribers):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO search_state (search_key, seen_ids, newest_date, subscribers, updated_at) "
+            "VALUES (?, ?, ?, ?, strftime('%s', 'now'))",
+            (search_key, json.dumps(list(seen_ids)), newest_date, subscribers)
+        )
+
+# --- Parsed Ads ---
+ADS_COLUMNS = "ad_id, link, price, rooms, ad_date, address, city, price_text, rooms_text, image_url"
+
+@metrics.timed("yad2bot_db_seconds", op="save_ads")
+def save_ads(rows):
+    """Upserts parsed ads (tuples in ADS_COLUMNS order) in a single transaction."""
+    now = time.time()
+    rows = [tuple(row) + (now,) for row in rows]
+    if not rows:
+        return
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO ads ({ADS_COLUMNS}, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+@metrics.timed("yad2bot_db_seconds", op="touch_ads")
+def touch_ads(ad_ids):
+    """Marks ads as seen in a feed now, including ones served from the listing cache without a save."""
+    ad_ids = list(ad_ids)
+    if not ad_ids:
+        return
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE ads SET updated_at = ? WHERE ad_id IN (SELECT value FROM json_each(?))",
+            (time.time(), json.dumps(ad_ids))
+        )
+
+def load_recent_ads(limit):
+    """The most recently parsed ads as tuples in ADS_COLUMNS order, oldest first."""
+    rows = get_connection().execute(
+        f"SELECT {ADS_COLUMNS} FROM ads ORDER BY updated_at DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return rows[::-1]
+
+# --- Listing Archive Index ---
+# The archive itself is gzip JSONL files on disk (see archive.py); this table
+# says which segment holds which city and day, so readers open only those.
+def record_archive_segments(segments):
+    """Adds appended records to the index. segments: (path, city_code, day, records, bytes, first_seen, last_seen)."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO archive_segments (path, city_code, day, records, bytes, first_seen, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+            "records = records + excluded.records, bytes = bytes + excluded.bytes, "
+            "first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)",
+            list(segments)
+        )
+
+def find_archive_segments(city_code=None, since=None, until=None):
+    """Paths of segments for city_code (all cities when None) holding records seen in [since, until], oldest first."""
+    rows = get_connection().execute(
+        "SELECT path FROM archive_segments WHERE (?1 IS NULL OR city_code = ?1) "
+        "AND (?2 IS NULL OR last_seen >= ?2) AND (?3 IS NULL OR first_seen <= ?3) ORDER BY day, first_seen",
+        (None if city_code is None else str(city_code), since, until)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+def drop_archive_segments(before_day):
+    """Removes segments of days before before_day ('YYYY-MM-DD') from the index. Returns their paths."""
+    conn = get_connection()
+    with conn:
+        rows = conn.execute("DELETE FROM archive_segments WHERE day < ? RETURNING path", (before_day,)).fetchall()
+    return [row[0] for row in rows]
+
+def archive_stats():
+    row = get_connection().execute(
+        "SELECT COUNT(*), SUM(records), SUM(bytes), MIN(day), MAX(day) FROM archive_segments"
+    ).fetchone()
+    return {"segments": row[0], "records": row[1] or 0, "bytes": row[2] or 0, "oldest_day": row[3], "newest_day": row[4]}
+
+# --- Retention ---
+# (table, condition on rows past the retention cutoff ?1)
+# An ad's feed date is its last update or bump, so an ad notified long ago can
+# pass the age filter again. Its dedup rows are therefore kept while the ad is
+# still showing up in feeds (ads.updated_at is refreshed on every sighting).
+COMPACTION_TARGETS = (
+    ("notifications", "notified_at < ?1 AND NOT EXISTS "
+                      "(SELECT 1 FROM ads WHERE ads.ad_id = notifications.ad_id AND ads.updated_at >= ?1)"),
+    ("outbox", "status = 'failed' AND created_at < ?"),
+    ("ads", "updated_at < ?"),
+    ("search_state", "updated_at < ?"),
+)
+
+def compact_history(cutoff, batch_size, pause=0.05):
+    """Deletes history older than cutoff (epoch seconds) in short batches. Returns {table: rows deleted}.
+
+    Each batch is its own transaction, so the scraper and dispatcher are never
+    locked out for long.
+    """
+    conn = get_connection()
+    deleted = {}
+    for table, condition in COMPACTION_TARGETS:
+        total = 0
+        while True:
+            with conn:
+                count = conn.execute(
+                    f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT ?)",
+                    (cutoff, batch_size)
+                ).rowcount
+            total += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+        deleted[table] = total
+    return deleted
+
+def incremental_vacuum(pages_per_step=1000, pause=0.05):
+    """Returns free pages to the filesystem a step at a time. Returns pages freed."""
+    conn = get_connection()
+    freed = 0
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            return freed
+        # execute() steps the pragma once, which frees a single page; executescript runs it to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages_per_step)});")
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if after >= free:
+            return freed  # Not in incremental mode, or nothing could be freed
+        freed += free - after
+        time.sleep(pause)
+
+def db_size_stats():
+    """(file size in bytes, free pages) of the database."""
+    conn = get_connection()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count, conn.execute("PRAGMA freelist_count").fetchone()[0]
 
 # --- User Management (SQLite) ---
+@metrics.timed("yad2bot_db_seconds", op="load_users")
 def load_users():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, url, active FROM users")
-    rows = cursor.fetchall()
-    conn.close()
-    return {row[0]: {"url": row[1], "active": bool(row[2])} for row in rows}
-
-def add_user(chat_id, url):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO users (user_id, url, active) VALUES (?, ?, 1)",
-        (str(chat_id), url)
-    )
-    conn.commit()
-    conn.close()
+    rows = get_connection().execute(
+        "SELECT user_id, url, active, city_code, min_price, max_price, min_rooms, max_rooms FROM users"
+    ).fetchall()
+    users = {}
+    for row in rows:
+        filters = None
+        if row[3] is not None:
+            filters = {
+                "city_code": row[3], "min_price": row[4], "max_price": row[5],
+                "min_rooms": row[6], "max_rooms": row[7],
+            }
+        users[row[0]] = {"url": row[1], "active": bool(row[2]), "filters": filters}
+    return users
+
+def add_user(chat_id, url, filters=None):
+    """Saves a user's search URL and, when given, the structured filters it was built from."""
+    filters = filters or parse_search_url(url)
+    conn = get_connection()
+    with conn:
+        # An upsert keeps the user's other settings (digest); REPLACE would reset them to defaults
+        conn.execute(
+            "INSERT INTO users (user_id, url, active) VALUES (?, ?, 1) "
+            "ON CONFLICT(user_id) DO UPDATE SET url = excluded.url, active = 1, "
+            "city_code = NULL, min_price = NULL, max_price = NULL, min_rooms = NULL, max_rooms = NULL",
+            (str(chat_id), url)
+        )
+        if filters:
+            _save_filters(conn, chat_id, filters)
 
 def set_user_active(chat_id, active):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET active = ? WHERE user_id = ?",
-        (1 if active else 0, str(chat_id))
-    )
-    changed = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return changed
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE users SET active = ? WHERE user_id = ?",
+            (1 if active else 0, str(chat_id))
+        )
+    return cursor.rowcount > 0
+
+def toggle_user_digest(chat_id):
+    """Flips the user's digest mode. Returns the new setting, or None for an unknown user."""
+    conn = get_connection()
+    with conn:
+        row = conn.execute(
+            "UPDATE users SET digest = 1 - digest WHERE user_id = ? RETURNING digest", (str(chat_id),)
+        ).fetchone()
+    return bool(row[0]) if row else None
+
+def set_user_digest(chat_id, digest):
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE users SET digest = ? WHERE user_id = ?", (1 if digest else 0, str(chat_id))
+        )
+    return cursor.rowcount > 0
 
 def remove_user(chat_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE user_id = ?", (str(chat_id),))
-    changed = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return changed
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("DELETE FROM users WHERE user_id = ?", (str(chat_id),))
+    return cursor.rowcount > 0
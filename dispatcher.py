@@ -0,0 +1,227 @@
+import time
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+from config import (
+    bot, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, DISPATCH_BATCH,
+    DISPATCH_MAX_ATTEMPTS, DISPATCH_RETRY_BASE, DISPATCH_IDLE_SLEEP, DIGEST_MEDIA_GROUP, logger
+)
+from database import (
+    claim_outbox, complete_outbox, complete_outbox_many, reschedule_outbox, fail_outbox, requeue_stale_outbox,
+    outbox_depth
+)
+from pacing import RateLimiter
+import metrics
+
+# Telegram answers these for requests that will never succeed (bad markup, bot blocked, chat gone)
+PERMANENT_ERROR_CODES = {400, 403}
+
+# Telegram's limits on one text message, one photo caption and one album
+MAX_MESSAGE_CHARS = 4096
+MAX_CAPTION_CHARS = 1024
+MAX_MEDIA_GROUP = 10
+
+# --- Digests ---
+def digest_header(count):
+    return f"🏠 *{count} מודעות חדשות!*"
+
+def take_digest_chunk(entries):
+    """The leading entries that fit one text message under a digest header (at least one)."""
+    length = len(digest_header(len(entries)))
+    chunk = []
+    for entry in entries:
+        length += 2 + len(entry["message"])
+        if chunk and length > MAX_MESSAGE_CHARS:
+            break
+        chunk.append(entry)
+    return chunk
+
+def format_digest(chunk):
+    return "\n\n".join([digest_header(len(chunk))] + [entry["message"] for entry in chunk])
+
+def take_album(entries):
+    """Up to MAX_MEDIA_GROUP entries with a thumbnail and a caption-sized message; albums need at least two."""
+    album = [entry for entry in entries if entry["image_url"] and len(entry["message"]) <= MAX_CAPTION_CHARS]
+    return album[:MAX_MEDIA_GROUP] if len(album) >= 2 else []
+
+# --- Notification Dispatcher ---
+class Dispatcher:
+    """Drains the outbox within Telegram's global and per-chat rate limits."""
+
+    def __init__(self):
+        self.global_limiter = RateLimiter(1.0 / TELEGRAM_GLOBAL_RATE)
+        self.chat_next_allowed = {}
+        self.paused_until = 0.0
+        self.send_alone = set()  # Outbox ids of a digest Telegram rejected; each goes out as its own message
+        self.sent = 0
+        self.failed = 0
+
+    def retry_delay(self, attempts):
+        return min(DISPATCH_RETRY_BASE * (2 ** attempts), 3600)
+
+    def dispatch(self, entry):
+        user_id = entry["user_id"]
+        now = time.monotonic()
+
+        # Global flood wait or per-chat spacing: put the entry back without counting an attempt
+        wait = max(self.paused_until - now, self.chat_next_allowed.get(user_id, 0) - now)
+        if wait > 0:
+            reschedule_outbox(entry["id"], wait, count_attempt=False)
+            return
+
+        self.send_alone.discard(entry["id"])
+        self.global_limiter.wait()
+        self.chat_next_allowed[user_id] = time.monotonic() + TELEGRAM_CHAT_INTERVAL
+        try:
+            with metrics.timer("yad2bot_telegram_seconds", method="send_message"):
+                bot.send_message(user_id, entry["message"], parse_mode="Markdown")
+        except ApiTelegramException as e:
+            self.handle_api_error(entry, e)
+            return
+        except Exception as e:
+            self.retry_or_fail(entry, f"{type(e).__name__}: {e}")
+            return
+
+        complete_outbox(entry["id"], entry["ad_id"], user_id)
+        self.sent += 1
+        metrics.inc("yad2bot_telegram_messages_total", outcome="sent")
+        logger.info("Ad %s sent to user %s.", entry["ad_id"], user_id,
+                    extra={"user": user_id, "ad": entry["ad_id"], "phase": "send"})
+
+    def dispatch_digest(self, user_id, entries):
+        """Sends one digest message (an album or a text digest) and leaves the rest for the chat's next slot."""
+        if len(entries) == 1:
+            self.dispatch(entries[0])
+            return
+
+        now = time.monotonic()
+        wait = max(self.paused_until - now, self.chat_next_allowed.get(user_id, 0) - now)
+        if wait > 0:
+            for entry in entries:
+                reschedule_outbox(entry["id"], wait, count_attempt=False)
+            return
+
+        chunk = take_album(entries) if DIGEST_MEDIA_GROUP else []
+        if chunk and self.send_album(user_id, chunk) is None:
+            chunk = []  # Telegram could not use a thumbnail: send these as text instead
+        if not chunk:
+            chunk = take_digest_chunk(entries)
+            self.send_digest_text(user_id, chunk)
+
+        # Sent or not, later messages to this chat wait out the per-chat spacing like any other send
+        sent_ids = {entry["id"] for entry in chunk}
+        for entry in entries:
+            if entry["id"] not in sent_ids:
+                reschedule_outbox(entry["id"], TELEGRAM_CHAT_INTERVAL, count_attempt=False)
+
+    def send_digest_text(self, user_id, chunk):
+        self.global_limiter.wait()
+        self.chat_next_allowed[user_id] = time.monotonic() + TELEGRAM_CHAT_INTERVAL
+        try:
+            with metrics.timer("yad2bot_telegram_seconds", method="send_digest"):
+                bot.send_message(user_id, format_digest(chunk), parse_mode="Markdown",
+                                 link_preview_options=types.LinkPreviewOptions(is_disabled=True))
+        except Exception as e:
+            self.handle_chunk_error(chunk, e)
+            return
+        self.complete_chunk(user_id, chunk, "digest")
+
+    def send_album(self, user_id, chunk):
+        """True if sent, False on an error already handled, None if Telegram rejected the album itself."""
+        media = [types.InputMediaPhoto(entry["image_url"], caption=entry["message"], parse_mode="Markdown")
+                 for entry in chunk]
+        self.global_limiter.wait()
+        self.chat_next_allowed[user_id] = time.monotonic() + TELEGRAM_CHAT_INTERVAL
+        try:
+            with metrics.timer("yad2bot_telegram_seconds", method="send_media_group"):
+                bot.send_media_group(user_id, media)
+        except ApiTelegramException as e:
+            if e.error_code == 400:
+                logger.warning(f"Album for {user_id} rejected ({e.description}), sending as text.")
+                return None
+            self.handle_chunk_error(chunk, e)
+            return False
+        except Exception as e:
+            self.handle_chunk_error(chunk, e)
+            return False
+        self.complete_chunk(user_id, chunk, "album")
+        return True
+
+    def complete_chunk(self, user_id, chunk, kind):
+        complete_outbox_many(chunk)
+        self.sent += len(chunk)
+        metrics.inc("yad2bot_telegram_messages_total", len(chunk), outcome="sent")
+        logger.info("%d ads sent to user %s as one %s.", len(chunk), user_id, kind,
+                    extra={"user": user_id, "phase": "send"})
+
+    def handle_chunk_error(self, chunk, e):
+        if isinstance(e, ApiTelegramException) and e.error_code == 400 and len(chunk) > 1:
+            # Usually one ad's text breaking the Markdown: send each ad on its own, so only that one fails
+            logger.warning(f"Digest for {chunk[0]['user_id']} rejected ({e.description}), sending its ads one by one.")
+            self.send_alone.update(entry["id"] for entry in chunk)
+            self.chat_next_allowed.pop(chunk[0]["user_id"], None)  # Nothing reached the chat
+            for entry in chunk:
+                self.dispatch(entry)  # The first goes now, the rest at the chat's next slots
+        elif isinstance(e, ApiTelegramException):
+            for entry in chunk:
+                self.handle_api_error(entry, e)
+        else:
+            for entry in chunk:
+                self.retry_or_fail(entry, f"{type(e).__name__}: {e}")
+
+    def handle_api_error(self, entry, e):
+        if e.error_code == 429:
+            retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 5)
+            logger.warning(f"Telegram rate limit hit, pausing dispatch for {retry_after}s.")
+            self.paused_until = time.monotonic() + retry_after
+            metrics.inc("yad2bot_telegram_messages_total", outcome="rate_limited")
+            reschedule_outbox(entry["id"], retry_after, error="429 Too Many Requests", count_attempt=False)
+        elif e.error_code in PERMANENT_ERROR_CODES:
+            logger.error(f"Giving up on ad {entry['ad_id']} for {entry['user_id']}: {e.description}")
+            fail_outbox(entry["id"], f"{e.error_code}: {e.description}")
+            self.failed += 1
+            metrics.inc("yad2bot_telegram_messages_total", outcome="failed")
+        else:
+            self.retry_or_fail(entry, f"{e.error_code}: {e.description}")
+
+    def retry_or_fail(self, entry, error):
+        attempts = entry["attempts"] + 1
+        if attempts >= DISPATCH_MAX_ATTEMPTS:
+            logger.error(f"Failed to send ad {entry['ad_id']} to {entry['user_id']} after {attempts} attempts: {error}")
+            fail_outbox(entry["id"], error)
+            self.failed += 1
+            metrics.inc("yad2bot_telegram_messages_total", outcome="failed")
+            return
+        delay = self.retry_delay(entry["attempts"])
+        logger.warning(f"Failed to send to {entry['user_id']}: {error}. Retrying in {delay:.0f}s...")
+        reschedule_outbox(entry["id"], delay, error=error)
+        metrics.inc("yad2bot_telegram_messages_total", outcome="retry")
+
+    def run_once(self):
+        """Dispatches one claimed batch. Returns how many entries were claimed."""
+        batch = claim_outbox(DISPATCH_BATCH)
+        digests = {}
+        for entry in batch:
+            if entry["digest"] and entry["id"] not in self.send_alone:
+                digests.setdefault(entry["user_id"], []).append(entry)
+            else:
+                self.dispatch(entry)
+        for user_id, entries in digests.items():
+            self.dispatch_digest(user_id, entries)
+        return len(batch)
+
+def run_dispatcher():
+    requeued = requeue_stale_outbox()
+    if requeued:
+        logger.info(f"Requeued {requeued} outbox entries left in flight by a previous run.")
+
+    dispatcher = Dispatcher()
+    metrics.gauge("yad2bot_outbox_pending", outbox_depth, "Outbox rows waiting to be sent.")
+    logger.info("Notification dispatcher started...")
+    while True:
+        try:
+            if not dispatcher.run_once():
+                time.sleep(DISPATCH_IDLE_SLEEP)
+        except Exception as e:
+            logger.critical(f"Critical Dispatcher Error: {e}")
+            time.sleep(DISPATCH_IDLE_SLEEP)
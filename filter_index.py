@@ -0,0 +1,85 @@
+from bisect import bisect_left, bisect_right
+
+from utils import construct_city_url
+
+# --- Interval Index ---
+class IntervalTree:
+    """Static centered interval tree: which [low, high] intervals contain a point, in O(log n + k)."""
+
+    __slots__ = ("center", "by_low", "lows", "by_high", "highs", "left", "right")
+
+    def __init__(self, intervals):
+        # intervals: list of (low, high, value)
+        points = sorted(p for low, high, _ in intervals for p in (low, high))
+        self.center = points[len(points) // 2]
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        self.by_low = sorted(here, key=lambda i: i[0])
+        self.lows = [i[0] for i in self.by_low]
+        self.by_high = sorted(here, key=lambda i: i[1])
+        self.highs = [i[1] for i in self.by_high]
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def stab(self, point):
+        """Returns the values of all intervals with low <= point <= high."""
+        found = []
+        node = self
+        while node is not None:
+            if point < node.center:
+                # Intervals here end at or after center > point; keep those starting at or before point
+                found.extend(i[2] for i in node.by_low[:bisect_right(node.lows, point)])
+                node = node.left
+            elif point > node.center:
+                found.extend(i[2] for i in node.by_high[bisect_left(node.highs, point):])
+                node = node.right
+            else:
+                found.extend(i[2] for i in node.by_low)
+                break
+        return found
+
+class FilterIndex:
+    """Matches listings from a broad per-city crawl against every user's structured filters.
+
+    Users are bucketed by city; within a city an interval tree over price ranges
+    yields the candidates, whose room ranges are then checked.
+    """
+
+    def __init__(self, users):
+        self.user_ids = set()
+        self.subscribers = {}  # city_code -> [user_id]
+        intervals = {}
+        for user_id, user_data in users.items():
+            filters = user_data.get("filters")
+            if not user_data.get("active", True) or not filters:
+                continue
+            city_code = str(filters["city_code"])
+            low, high = sorted((filters["min_price"], filters["max_price"]))
+            rooms = tuple(sorted((filters["min_rooms"], filters["max_rooms"])))
+            intervals.setdefault(city_code, []).append((low, high, (user_id, rooms)))
+            self.subscribers.setdefault(city_code, []).append(user_id)
+            self.user_ids.add(user_id)
+
+        self.trees = {city_code: IntervalTree(items) for city_code, items in intervals.items()}
+        self.city_urls = {construct_city_url(city_code): city_code for city_code in self.trees}
+
+    def city_searches(self):
+        """One broad crawl per city: {city feed URL: [subscribed user_ids]}."""
+        return {url: self.subscribers[city_code] for url, city_code in self.city_urls.items()}
+
+    def city_for(self, url):
+        """The city code if url is one of this index's city crawls, else None."""
+        return self.city_urls.get(url)
+
+    def match(self, city_code, price, rooms):
+        """User ids whose price and rooms ranges contain this listing's values."""
+        tree = self.trees.get(city_code)
+        if tree is None or price is None or rooms is None:
+            return []
+        return [user_id for user_id, (min_rooms, max_rooms) in tree.stab(price) if min_rooms <= rooms <= max_rooms]
@@ -0,0 +1,232 @@
+import re
+import json
+import threading
+from html.parser import HTMLParser
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_TIMEOUT, HTTP_POOL_SIZE, logger
+from block_detector import BLOCKED, ERROR, classify
+import metrics
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "he-IL,he;q=0.9,en-US;q=0.8,en;q=0.7",
+}
+TEXT_FIELDS = {
+    "price": "price",
+    "street-name": "address",
+    "item-info-line-1st": "city",
+    "item-info-line-2nd": "rooms",
+}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+NEXT_DATA_RE = re.compile(r'<script[^>]*id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.S)
+FEED_ITEM_MARKER = re.compile(r"<li[^>]*data-nagish=[\"']feed-item-list-box[\"']")
+
+class FetchError(Exception):
+    """The HTTP path could not produce listings; the caller should fall back to the browser."""
+
+class FetchBlocked(FetchError):
+    pass
+
+class FetchUnparseable(FetchError):
+    pass
+
+# --- HTML Parsing ---
+class FeedHTMLParser(HTMLParser):
+    """Collects the same raw fields as scraper.FEED_EXTRACT_JS from server-rendered feed HTML."""
+
+    def __init__(self, fallback=False):
+        super().__init__(convert_charrefs=True)
+        self.fallback = fallback
+        self.items = []
+        self._item = None
+        self._stack = []  # (tag, field being captured or None)
+        self._texts = {}
+
+    def _is_item(self, tag, attrs):
+        if self.fallback:
+            return "feed-item" in (attrs.get("class") or "").split()
+        return tag == "li" and attrs.get("data-nagish") == "feed-item-list-box"
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._item is None:
+            if self._is_item(tag, attrs):
+                self._item = {"href": None, "date_text": None, "img_src": None}
+                self._texts = {}
+                self._stack = [(tag, None)]
+            return
+
+        if tag == "a" and self._item["href"] is None:
+            self._item["href"] = attrs.get("href")
+        if tag == "img" and self._item["img_src"] is None:
+            self._item["img_src"] = attrs.get("src")
+        if tag in VOID_TAGS:
+            return
+
+        field = TEXT_FIELDS.get(attrs.get("data-testid"))
+        if field is None and tag == "span" and "report-ad_createdAt" in (attrs.get("class") or ""):
+            field = "date_text"
+        if field is not None and field in self._texts:
+            field = None  # First match wins, like querySelector
+        if field is not None:
+            self._texts[field] = []
+        self._stack.append((tag, field))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if self._item is not None and tag not in VOID_TAGS and self._stack and self._stack[-1][0] == tag:
+            self._stack.pop()
+
+    def handle_endtag(self, tag):
+        if self._item is None:
+            return
+        # Tolerate unclosed tags by popping down to the matching one
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if self._stack[depth][0] == tag:
+                del self._stack[depth:]
+                break
+        if not self._stack:
+            self._finish_item()
+
+    def handle_data(self, data):
+        if self._item is None:
+            return
+        for _, field in self._stack:
+            if field is not None:
+                self._texts[field].append(data)
+
+    def _finish_item(self):
+        for field, parts in self._texts.items():
+            self._item[field] = " ".join("".join(parts).split())
+        for field in TEXT_FIELDS.values():
+            self._item.setdefault(field, "")
+        self.items.append(self._item)
+        self._item = None
+
+def parse_feed_html(html):
+    """Extracts raw feed records from the HTML feed, with the .feed-item fallback selector."""
+    # Skip straight to the feed: most of the page is head, scripts and chrome
+    match = FEED_ITEM_MARKER.search(html)
+    parser = FeedHTMLParser(fallback=match is None)
+    parser.feed(html[match.start():] if match else html)
+    parser.close()
+    return parser.items
+
+def _walk_json_items(node, found):
+    if isinstance(node, dict):
+        if "token" in node and ("price" in node or "address" in node):
+            found.append(node)
+            return
+        for value in node.values():
+            _walk_json_items(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _walk_json_items(value, found)
+
+def _json_text(value):
+    if isinstance(value, dict):
+        return str(value.get("text") or value.get("name") or "")
+    return "" if value is None else str(value)
+
+def parse_next_data(html):
+    """Extracts raw feed records from the embedded __NEXT_DATA__ page JSON, if present."""
+    match = NEXT_DATA_RE.search(html)
+    if not match:
+        return []
+    try:
+        data = json.loads(match.group(1))
+    except ValueError:
+        return []
+
+    nodes = []
+    _walk_json_items(data, nodes)
+    items = []
+    seen = set()
+    for node in nodes:
+        token = str(node["token"])
+        if token in seen:
+            continue
+        seen.add(token)
+        address = node.get("address") or {}
+        details = node.get("additionalDetails") or {}
+        images = (node.get("metaData") or {}).get("images") or []
+        price = node.get("price")
+        street = " ".join(p for p in (_json_text(address.get("street")), _json_text((address.get("house") or {}).get("number"))) if p)
+        items.append({
+            "href": node.get("link") or f"/realestate/item/{token}",
+            "date_text": None,
+            "img_src": images[0] if images and isinstance(images[0], str) else None,
+            "price": f"₪ {price:,}" if isinstance(price, (int, float)) else _json_text(price),
+            "address": street,
+            "city": _json_text(address.get("city")),
+            "rooms": f"{details['roomsCount']} חדרים" if details.get("roomsCount") else "",
+        })
+    return items
+
+# --- HTTP Fetching ---
+_local = threading.local()
+
+def get_session():
+    """Returns this thread's keep-alive session with a pooled adapter."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(HEADERS)
+        _local.session = session
+    return session
+
+def fetch_raw_items(url):
+    """Fetches a feed page over HTTP. Returns (items found, raw records) or raises FetchError."""
+    try:
+        response = get_session().get(url, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        raise FetchError(f"request failed: {e}") from e
+
+    outcome = classify(response.status_code)
+    if outcome == BLOCKED:
+        raise FetchBlocked(f"blocked (HTTP {response.status_code})")
+    if outcome == ERROR or response.status_code != 200:
+        raise FetchError(f"HTTP {response.status_code}")
+
+    if "charset" not in response.headers.get("Content-Type", "").lower():
+        response.encoding = "utf-8"  # Yad2 pages are UTF-8; requests would otherwise assume Latin-1
+    html = response.text
+    items = parse_feed_html(html) or parse_next_data(html)
+    if items:
+        return len(items), items
+    if classify(response.status_code, html=html) == BLOCKED:
+        raise FetchBlocked("challenge page")
+    raise FetchUnparseable("no feed items in HTML or page JSON")
+
+# --- Per-Mode Stats ---
+class FetchStats:
+    """Outcome counters per fetch mode ("http", "browser")."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, mode, outcome):
+        with self._lock:
+            outcomes = self.counts.setdefault(mode, {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        metrics.inc("yad2bot_fetch_total", mode=mode, outcome=outcome)
+
+    def success_rate(self, mode):
+        with self._lock:
+            outcomes = self.counts.get(mode, {})
+            total = sum(outcomes.values())
+            return outcomes.get("ok", 0) / total if total else None
+
+    def log_stats(self):
+        for mode in sorted(self.counts):
+            rate = self.success_rate(mode)
+            logger.info(f"🌐 Fetch mode {mode}: {rate:.0%} success | {self.counts[mode]}")
+
+fetch_stats = FetchStats()
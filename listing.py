@@ -0,0 +1,136 @@
+import time
+import threading
+import datetime
+from dataclasses import dataclass
+from collections import OrderedDict
+
+from config import logger
+
+# --- Listing Record ---
+@dataclass(slots=True)
+class Listing:
+    """One parsed feed item. price and rooms are numeric (None when the ad shows none);
+    price_text and rooms_text keep the feed's own wording for messages.
+
+    A Listing with ad_id None stands for a feed item without a usable link, and
+    error marks an item whose fields could not be parsed.
+    """
+    ad_id: str | None = None
+    link: str = ""
+    price: int | None = None
+    rooms: float | None = None
+    date: datetime.date | None = None
+    address: str = ""
+    city: str = ""
+    price_text: str = "N/A"
+    rooms_text: str = ""
+    image: str = ""
+    error: bool = False
+
+    def to_row(self):
+        """Column values for the ads table, in ADS_COLUMNS order."""
+        return (self.ad_id, self.link, self.price, self.rooms, self.date.isoformat() if self.date else None,
+                self.address, self.city, self.price_text, self.rooms_text, self.image or None)
+
+    @classmethod
+    def from_row(cls, row):
+        ad_id, link, price, rooms, ad_date, address, city, price_text, rooms_text, image = row
+        return cls(ad_id, link, price, rooms, datetime.date.fromisoformat(ad_date) if ad_date else None,
+                   address, city, price_text, rooms_text, image or "")
+
+# --- Parsed-Ad Cache ---
+class ListingCache:
+    """Bounded LRU of parsed listings keyed by ad_id, shared across users and cycles.
+
+    A hit only counts while the ad's price and rooms text are unchanged, so an
+    edited ad is parsed again; the date and image of a hit are re-read by the
+    scraper. Freshly parsed or changed listings are kept aside until take_dirty()
+    hands them over for saving to the ads table, also with max_size 0 (no cache).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, ad_id, price_text, rooms_text):
+        with self._lock:
+            listing = self._items.get(ad_id)
+            if listing is None or listing.price_text != price_text or listing.rooms_text != rooms_text:
+                self.misses += 1
+                return None
+            self._items.move_to_end(ad_id)
+            self.hits += 1
+            return listing
+
+    def store(self, listing, dirty=True):
+        with self._lock:
+            if dirty:
+                # Saved even with no cache: compaction keeps the dedup rows of ads in the ads table
+                self._dirty[listing.ad_id] = listing
+            if not self.max_size:
+                return
+            self._items[listing.ad_id] = listing
+            self._items.move_to_end(listing.ad_id)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def warm(self, listings):
+        """Preloads listings already saved in the ads table, oldest first."""
+        for listing in listings:
+            self.store(listing, dirty=False)
+
+    def take_dirty(self):
+        with self._lock:
+            dirty = list(self._dirty.values())
+            self._dirty.clear()
+        return dirty
+
+    def __len__(self):
+        return len(self._items)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def log_stats(self):
+        rate = self.hit_rate()
+        logger.info(f"🗂️ Listing cache: {len(self)}/{self.max_size} ads | "
+                    f"{rate or 0:.0%} hit rate ({self.hits} hits, {self.misses} parsed)")
+
+# --- Recent Feed Cache ---
+class FeedCache:
+    """The first page of each recently fetched search, for serving a "scan now" request without a page load.
+
+    Entries older than ttl are ignored and dropped on the next store().
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._feeds = {}  # search_url -> (fetched_at, items found, first page listings)
+        self._lock = threading.Lock()
+        self.served = 0
+
+    def store(self, search_url, found, first_page):
+        if not self.ttl:
+            return
+        now = time.time()
+        with self._lock:
+            self._feeds[search_url] = (now, found, first_page)
+            for key in [key for key, feed in self._feeds.items() if now - feed[0] > self.ttl]:
+                del self._feeds[key]
+
+    def get(self, search_url):
+        """Returns (seconds old, items found, first page listings) or None."""
+        with self._lock:
+            feed = self._feeds.get(search_url)
+            if feed is None:
+                return None
+            age = time.time() - feed[0]
+            if age > self.ttl:
+                return None
+            self.served += 1
+            return age, feed[1], feed[2]
@@ -0,0 +1,112 @@
+"""Background logging pipeline.
+
+Every logger call only puts the record on a bounded queue; one listener thread
+formats it and writes the console and the log file. The file rotates by size
+(or by time), and rotated files are gzip-compressed by the listener thread, off
+the scraper and bot threads.
+"""
+import os
+import gzip
+import json
+import queue
+import atexit
+import shutil
+import logging
+import logging.handlers
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Context that hot-path log calls pass as extra={...}; JSON records carry them as fields
+CONTEXT_FIELDS = ("user", "ad", "search", "phase")
+
+queue_handler = None
+
+# --- Formatting ---
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the context fields the call passed."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# --- Rotation ---
+def gzip_namer(name):
+    return name + ".gz"
+
+def gzip_rotator(source, dest):
+    """Compresses the file being rotated out into dest."""
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def file_handler(path, max_bytes, rotate_when, backups):
+    """A size-rotating handler, or a time-rotating one when rotate_when is set ("midnight", "H", ...)."""
+    if rotate_when:
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=rotate_when, backupCount=backups, encoding="utf-8")
+    else:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.namer = gzip_namer
+    handler.rotator = gzip_rotator
+    return handler
+
+# --- Queue ---
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener without blocking; a full queue drops the record and counts it."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The queue stays in-process, so only the message is merged here; formatting is the listener's job
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(level="INFO", log_file="bot.log", max_bytes=0, rotate_when="", backups=5,
+                  json_records=False, queue_size=10000):
+    """Routes all logging through a queue to a listener thread writing the console and log_file."""
+    global queue_handler
+    text = logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(text)
+    handlers = [console]
+    if log_file:
+        handler = file_handler(log_file, max_bytes, rotate_when, backups)
+        handler.setFormatter(JsonFormatter() if json_records else text)
+        handlers.append(handler)
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.setLevel(level)
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Drains what is still queued on a normal exit
+    return listener
+
+def dropped_records():
+    """Records dropped because the queue was full."""
+    return queue_handler.dropped if queue_handler is not None else 0
@@ -0,0 +1,220 @@
+import json
+import time
+import bisect
+import threading
+import functools
+from contextlib import nullcontext
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from config import METRICS_ENABLED, METRICS_PORT, METRICS_TRACE_FILE, logger
+from log_setup import dropped_records
+
+# Latency buckets in seconds, from a cached DB lookup up to a page load timeout
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TRACE_MAX_SAMPLES = 100000  # A process that never flushes (the bot side) stops collecting here
+
+HELP = {
+    "yad2bot_phase_seconds": "Time spent per scrape phase (goto, block_probe, feed_wait, extract, http_fetch, scan, deliver).",
+    "yad2bot_page_load_seconds": "Browser feed loads from goto until ready, by session state (warm: context had cookies).",
+    "yad2bot_db_seconds": "SQLite call latency by operation.",
+    "yad2bot_telegram_seconds": "Telegram Bot API call latency.",
+    "yad2bot_fetch_total": "Feed fetches by mode and outcome.",
+    "yad2bot_scan_outcomes_total": "Search scans by block-detector outcome.",
+    "yad2bot_listings_total": "Listings processed per user by outcome (new, already_notified, too_old, ...).",
+    "yad2bot_telegram_messages_total": "Outbox sends by outcome.",
+    "yad2bot_scan_requests_total": "Scan-now requests served from a recent fetch (cached) or by loading the feed (fetched).",
+    "yad2bot_webhook_updates_total": "Webhook updates queued for a handler or refused while the queues were full.",
+}
+
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_counters = {}    # name -> {label items: value}
+_histograms = {}  # name -> {label items: [bucket counts..., +Inf count, sum]}
+_gauges = {}      # name -> (callback returning a number or {label items: number}, help)
+_trace = [] if _enabled and METRICS_TRACE_FILE else None
+
+def enabled():
+    return _enabled
+
+# --- Recording ---
+def inc(name, amount=1, **labels):
+    if not _enabled:
+        return
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    if not _enabled:
+        return
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        counts = series.get(key)
+        if counts is None:
+            counts = series[key] = [0] * (len(BUCKETS) + 2)
+        counts[bisect.bisect_left(BUCKETS, value)] += 1
+        counts[-1] += value
+        if _trace is not None and len(_trace) < TRACE_MAX_SAMPLES:
+            _trace.append((name, key, value))
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+_NULL_TIMER = nullcontext()
+
+def timer(name, **labels):
+    """Context manager observing its body's duration; a shared no-op when metrics are off."""
+    return _Timer(name, labels) if _enabled else _NULL_TIMER
+
+def timed(name, **labels):
+    """Decorator form of timer(). Returns the function untouched when metrics are off."""
+    def decorate(fn):
+        if not _enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(name, labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def gauge(name, callback, help_text=""):
+    """Registers a gauge read at scrape time. callback returns a number or {label dict items: number}."""
+    if _enabled:
+        with _lock:
+            _gauges[name] = (callback, help_text)
+
+def stats_gauge(name, stats_fn, help_text=""):
+    """Registers a component's stats() dict as one gauge, labeled by stat (numeric entries only)."""
+    def read():
+        return {(("stat", key),): value for key, value in stats_fn().items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)}
+    gauge(name, read, help_text)
+
+def snapshot():
+    """Current counters and histogram (count, sum) per series name, for in-process readers like benchmarks."""
+    with _lock:
+        counters = {name + _labels(k): v for name, series in _counters.items() for k, v in series.items()}
+        histograms = {name + _labels(k): (sum(v[:-1]), v[-1]) for name, series in _histograms.items() for k, v in series.items()}
+    return {"counters": counters, "histograms": histograms}
+
+# --- Exposition ---
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(items, extra=()):
+    items = tuple(items) + tuple(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = {name: dict(series) for name, series in _counters.items()}
+        histograms = {name: {k: list(v) for k, v in series.items()} for name, series in _histograms.items()}
+        gauges = dict(_gauges)
+
+    for name in sorted(counters):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(counters[name].items()):
+            lines.append(f"{name}{_labels(key)} {value}")
+
+    for name in sorted(histograms):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, counts in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(key, (('le', bound),))} {cumulative}")
+            cumulative += counts[len(BUCKETS)]
+            lines.append(f"{name}_bucket{_labels(key, (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(key)} {counts[-1]:.6f}")
+            lines.append(f"{name}_count{_labels(key)} {cumulative}")
+
+    for name in sorted(gauges):
+        callback, help_text = gauges[name]
+        try:
+            value = callback()
+        except Exception as e:
+            logger.debug(f"Gauge {name} failed: {e}")
+            continue
+        lines.append(f"# HELP {name} {help_text or name}")
+        lines.append(f"# TYPE {name} gauge")
+        series = value if isinstance(value, dict) else {(): value}
+        for key, number in sorted(series.items()):
+            if number is not None:
+                lines.append(f"{name}{_labels(key)} {float(number)}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port=METRICS_PORT):
+    """Serves /metrics on localhost in a daemon thread (no-op when metrics are off)."""
+    if not _enabled or not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    gauge("yad2bot_log_records_dropped", dropped_records, "Log records dropped while the logging queue was full.")
+    logger.info(f"📈 Metrics at http://127.0.0.1:{port}/metrics")
+    return server
+
+# --- Per-Cycle Trace ---
+def flush_trace(**info):
+    """Appends this cycle's timings (total, count and max per metric and labels) as one JSON line."""
+    if _trace is None:
+        return
+    with _lock:
+        samples = list(_trace)
+        _trace.clear()
+    phases = {}
+    for name, key, value in samples:
+        label = name + _labels(key)
+        phase = phases.setdefault(label, {"count": 0, "total": 0.0, "max": 0.0})
+        phase["count"] += 1
+        phase["total"] += value
+        phase["max"] = max(phase["max"], value)
+    record = {"ts": time.time(), **info, "phases": phases}
+    with _lock:
+        counters = {name + _labels(k): v for name, series in _counters.items() for k, v in series.items()}
+    record["counters"] = counters
+    try:
+        with open(METRICS_TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        logger.error(f"Error writing metrics trace: {e}")
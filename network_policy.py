@@ -0,0 +1,100 @@
+import threading
+from urllib.parse import urlparse
+
+from config import (
+    NETWORK_POLICY_ENABLED, BLOCK_RESOURCE_TYPES, BLOCK_DOMAINS, ALLOW_DOMAINS, logger
+)
+
+# Typical transfer sizes, used to estimate the bytes a blocked request would have cost
+ESTIMATED_BYTES = {
+    "image": 60_000,
+    "media": 500_000,
+    "font": 40_000,
+    "stylesheet": 30_000,
+    "script": 50_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+DEFAULT_ESTIMATE = 5_000
+
+def _host_matches(host, domains):
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+class NetworkPolicy:
+    """Aborts browser requests by resource type and domain, and counts what was saved.
+
+    Deny domains always win, then blocked resource types. If allow_domains is set,
+    requests to any other domain are blocked as well.
+    """
+
+    def __init__(self, block_types=(), block_domains=(), allow_domains=()):
+        self.block_types = frozenset(block_types)
+        self.block_domains = tuple(block_domains)
+        self.allow_domains = tuple(allow_domains)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.allowed = 0
+            self.blocked = 0
+            self.blocked_by_type = {}
+            self.bytes_saved = 0
+
+    def should_block(self, resource_type, url):
+        host = urlparse(url).hostname or ""
+        if self.block_domains and _host_matches(host, self.block_domains):
+            return True
+        if resource_type in self.block_types:
+            return True
+        if self.allow_domains and not _host_matches(host, self.allow_domains):
+            return True
+        return False
+
+    def _decide(self, request):
+        resource_type = request.resource_type
+        block = self.should_block(resource_type, request.url)
+        with self._lock:
+            if block:
+                self.blocked += 1
+                self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+                self.bytes_saved += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATE)
+            else:
+                self.allowed += 1
+        return block
+
+    def install(self, context):
+        """Routes every request of a sync Playwright context through the policy."""
+        def handle(route):
+            if self._decide(route.request):
+                route.abort()
+            else:
+                route.continue_()
+        context.route("**/*", handle)
+
+    async def install_async(self, context):
+        """Routes every request of an async Playwright context through the policy."""
+        async def handle(route):
+            if self._decide(route.request):
+                await route.abort()
+            else:
+                await route.continue_()
+        await context.route("**/*", handle)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "allowed": self.allowed,
+                "blocked": self.blocked,
+                "blocked_by_type": dict(self.blocked_by_type),
+                "estimated_bytes_saved": self.bytes_saved,
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        total = stats["allowed"] + stats["blocked"]
+        logger.info(f"🛡️ Network policy (since start): blocked {stats['blocked']}/{total} requests "
+                    f"(~{stats['estimated_bytes_saved'] / 1_000_000:.1f} MB saved) | "
+                    f"by type: {stats['blocked_by_type']}")
+
+policy = NetworkPolicy(BLOCK_RESOURCE_TYPES, BLOCK_DOMAINS, ALLOW_DOMAINS) if NETWORK_POLICY_ENABLED else None
@@ -0,0 +1,60 @@
+import time
+import random
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+# --- Rate Limiting ---
+class RateLimiter:
+    """Spaces out events by a minimum interval plus random jitter.
+
+    Unlike a fixed sleep, time already spent since the previous event counts
+    towards the interval, so a slow page load is not followed by a full pause.
+    """
+
+    def __init__(self, min_interval, jitter=0.0):
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Claims the next slot and returns how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_allowed)
+            self._next_allowed = start + self.min_interval + random.uniform(0, self.jitter)
+            return start - now
+
+    def wait(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+class HostLimiter:
+    """Caps concurrent page loads per host and spaces out their start times (async)."""
+
+    def __init__(self, max_concurrent, min_interval, jitter=0.0):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self._semaphores = {}
+        self._pacers = {}
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrent))
+        pacer = self._pacers.setdefault(host, RateLimiter(self.min_interval, self.jitter))
+
+        async with semaphore:
+            await pacer.wait_async()
+            yield
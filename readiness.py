@@ -0,0 +1,70 @@
+from config import FEED_READY_TIMEOUT, FEED_SETTLE_TIMEOUT, FEED_STABLE_MS, FEED_WAIT_NETWORK_IDLE, logger
+
+FEED_SELECTOR = "li[data-nagish='feed-item-list-box'], .feed-item"
+
+# Resolves once the feed item count has stopped changing for quiet_ms
+FEED_STABLE_JS = """
+([selector, quietMs]) => {
+    const count = document.querySelectorAll(selector).length;
+    const state = window.__feedStable || (window.__feedStable = {count: -1, since: 0});
+    const now = performance.now();
+    if (count !== state.count) {
+        state.count = count;
+        state.since = now;
+        return false;
+    }
+    return count > 0 && now - state.since >= quietMs;
+}
+"""
+
+# --- Readiness Waits ---
+def wait_for_feed(page):
+    """Waits until feed items are rendered and their count is stable, each step bounded.
+
+    Returns False if no feed item appeared in time (empty, blocked or changed page).
+    """
+    try:
+        page.wait_for_selector(FEED_SELECTOR, timeout=FEED_READY_TIMEOUT * 1000)
+    except Exception:
+        logger.warning(f"No feed items appeared within {FEED_READY_TIMEOUT}s.")
+        return False
+
+    page.mouse.wheel(0, 1000) # Trigger lazy load
+    try:
+        page.wait_for_function(
+            FEED_STABLE_JS, arg=[FEED_SELECTOR, FEED_STABLE_MS],
+            timeout=FEED_SETTLE_TIMEOUT * 1000, polling=100
+        )
+    except Exception:
+        logger.debug(f"Feed item count still changing after {FEED_SETTLE_TIMEOUT}s, extracting anyway.")
+
+    if FEED_WAIT_NETWORK_IDLE:
+        try:
+            page.wait_for_load_state("networkidle", timeout=FEED_SETTLE_TIMEOUT * 1000)
+        except Exception:
+            logger.debug("Network did not go idle in time, extracting anyway.")
+    return True
+
+async def wait_for_feed_async(page):
+    """Async counterpart of wait_for_feed."""
+    try:
+        await page.wait_for_selector(FEED_SELECTOR, timeout=FEED_READY_TIMEOUT * 1000)
+    except Exception:
+        logger.warning(f"No feed items appeared within {FEED_READY_TIMEOUT}s.")
+        return False
+
+    await page.mouse.wheel(0, 1000) # Trigger lazy load
+    try:
+        await page.wait_for_function(
+            FEED_STABLE_JS, arg=[FEED_SELECTOR, FEED_STABLE_MS],
+            timeout=FEED_SETTLE_TIMEOUT * 1000, polling=100
+        )
+    except Exception:
+        logger.debug(f"Feed item count still changing after {FEED_SETTLE_TIMEOUT}s, extracting anyway.")
+
+    if FEED_WAIT_NETWORK_IDLE:
+        try:
+            await page.wait_for_load_state("networkidle", timeout=FEED_SETTLE_TIMEOUT * 1000)
+        except Exception:
+            logger.debug("Network did not go idle in time, extracting anyway.")
+    return True
@@ -0,0 +1,43 @@
+import time
+
+from config import NOTIFICATION_RETENTION_DAYS, ARCHIVE_RETENTION_DAYS, COMPACT_INTERVAL, COMPACT_BATCH, logger
+from database import compact_history, incremental_vacuum, db_size_stats
+from conversations import conversations
+from archive import archive
+
+# Dedup rows of ads no longer seen in any feed are dropped after the retention window
+# (rows of ads still showing up are kept, see database.COMPACTION_TARGETS). The window
+# must at least outlast the age filter (scraper.MAX_AD_AGE_DAYS + 1).
+MIN_RETENTION_DAYS = 4
+
+# --- History Compaction ---
+def retention_days():
+    if NOTIFICATION_RETENTION_DAYS < MIN_RETENTION_DAYS:
+        logger.warning(f"NOTIFICATION_RETENTION_DAYS={NOTIFICATION_RETENTION_DAYS} would re-notify old ads, "
+                       f"using {MIN_RETENTION_DAYS}.")
+        return MIN_RETENTION_DAYS
+    return NOTIFICATION_RETENTION_DAYS
+
+def compact_once():
+    """Drops history past the retention window and hands the freed pages back to the filesystem."""
+    days = retention_days()
+    start = time.time()
+    size_before, _ = db_size_stats()
+    deleted = compact_history(start - days * 86400, COMPACT_BATCH)
+    expired = conversations.expire()
+    pruned = archive.prune(ARCHIVE_RETENTION_DAYS)
+    freed = incremental_vacuum()
+    size_after, free_pages = db_size_stats()
+    logger.info(f"🧹 Compaction ({days:g}-day window): deleted {deleted} | {expired} abandoned wizards | {pruned} archive segments | {freed} pages freed | "
+                f"DB {size_before / 1024 / 1024:.1f} -> {size_after / 1024 / 1024:.1f} MB "
+                f"({free_pages} free pages) in {time.time() - start:.1f}s")
+    return deleted
+
+def run_compactor():
+    logger.info("History compactor started...")
+    while True:
+        try:
+            compact_once()
+        except Exception as e:
+            logger.error(f"Compaction error: {e}")
+        time.sleep(COMPACT_INTERVAL)
@@ -0,0 +1,167 @@
+import time
+import heapq
+import random
+import threading
+
+from config import logger
+
+# --- Adaptive Polling Scheduler ---
+class PageLoadBudget:
+    """Token bucket limiting page loads per hour across all searches."""
+
+    def __init__(self, per_hour):
+        self.capacity = max(1.0, per_hour / 6)  # Allow bursts of up to 10 minutes' worth
+        self.rate = per_hour / 3600.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def consume(self, count=1):
+        self._refill()
+        self.tokens -= count
+
+    def seconds_until_available(self):
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class SearchScheduler:
+    """Keeps a next-due time per distinct search in a priority queue.
+
+    Each search's interval follows its observed new-ad rate (an exponentially
+    weighted average of new ads per hour), aiming for about target_per_poll new
+    ads per poll, clamped to [min_interval, max_interval]. A global page-load
+    budget caps how many searches may start per hour.
+    """
+
+    def __init__(self, min_interval, max_interval, initial_interval, budget_per_hour,
+                 target_per_poll=1.0, smoothing=0.3):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.target_per_poll = target_per_poll
+        self.smoothing = smoothing
+        self.budget = PageLoadBudget(budget_per_hour)
+        self._heap = []  # (due, key); stale items are skipped on pop
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _push(self, key, due):
+        self._entries[key]["due"] = due
+        heapq.heappush(self._heap, (due, key))
+
+    def sync(self, keys):
+        """Adds newly planned searches (due now) and drops ones nobody subscribes to anymore."""
+        with self._lock:
+            now = time.time()
+            for key in keys:
+                if key not in self._entries:
+                    self._entries[key] = {"interval": self.initial_interval, "rate": None, "last_run": None}
+                    self._push(key, now)
+            for key in set(self._entries) - set(keys):
+                del self._entries[key]
+
+    def reschedule(self, key, due=None):
+        """Moves a known search's next run (default: now)."""
+        with self._lock:
+            if key in self._entries:
+                self._push(key, time.time() if due is None else due)
+
+    def pop_due(self, limit=None):
+        """Returns the keys that are due, oldest first, as far as the page-load budget allows."""
+        with self._lock:
+            now = time.time()
+            keys = []
+            while self._heap and self._heap[0][0] <= now:
+                if limit is not None and len(keys) >= limit:
+                    break
+                due, key = self._heap[0]
+                entry = self._entries.get(key)
+                if entry is None or entry["due"] != due:
+                    heapq.heappop(self._heap)  # Stale: removed or rescheduled
+                    continue
+                if self.budget.available() < 1:
+                    break
+                heapq.heappop(self._heap)
+                entry["due"] = None  # In flight until complete()
+                self.budget.consume()
+                keys.append(key)
+            return keys
+
+    def complete(self, key, new_ads=None, page_loads=1, ok=True):
+        """Records a finished scan and schedules the search's next run.
+
+        new_ads is the number of ads above the high-water mark, or None when the
+        scan gives no rate observation (a cold scan). A failed scan (ok=False) is
+        retried after the search's current interval.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if page_loads > 1:
+                self.budget.consume(page_loads - 1)
+            self._push(key, self.next_run(entry, new_ads, ok))
+
+    def next_run(self, entry, new_ads=None, ok=True, now=None):
+        """Updates an entry's rate, interval and last_run from a finished scan; returns its next due time.
+
+        entry is a dict with "interval", "rate" and "last_run", as kept here or in the jobs table.
+        """
+        now = time.time() if now is None else now
+        if ok and new_ads is not None and entry["last_run"] is not None:
+            hours = max((now - entry["last_run"]) / 3600.0, 1e-6)
+            observed = new_ads / hours
+            rate = entry["rate"]
+            entry["rate"] = observed if rate is None else self.smoothing * observed + (1 - self.smoothing) * rate
+            if entry["rate"] > 0:
+                interval = self.target_per_poll / entry["rate"] * 3600.0
+            else:
+                interval = self.max_interval
+            entry["interval"] = min(self.max_interval, max(self.min_interval, interval))
+        if ok:
+            entry["last_run"] = now
+
+        # Jitter keeps searches from synchronizing into bursts
+        return now + entry["interval"] * random.uniform(0.9, 1.1)
+
+    def seconds_until_next(self):
+        with self._lock:
+            due_times = [entry["due"] for entry in self._entries.values() if entry["due"] is not None]
+            if not due_times:
+                return None
+            wait = max(0.0, min(due_times) - time.time())
+            return max(wait, self.budget.seconds_until_available())
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            due_times = [entry["due"] for entry in self._entries.values() if entry["due"] is not None]
+            lags = [now - due for due in due_times if due <= now]
+            intervals = [entry["interval"] for entry in self._entries.values()]
+            return {
+                "queue_depth": len(due_times),
+                "in_flight": len(self._entries) - len(due_times),
+                "due": len(lags),
+                "max_lag": max(lags) if lags else 0.0,
+                "min_interval": min(intervals) if intervals else None,
+                "max_interval": max(intervals) if intervals else None,
+                "budget_tokens": self.budget.available(),
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        interval_range = (
+            f"{stats['min_interval'] / 60:.0f}-{stats['max_interval'] / 60:.0f} min"
+            if stats["min_interval"] is not None else "n/a"
+        )
+        logger.info(f"⏱️ Scheduler: {stats['queue_depth']} queued | {stats['due']} due | "
+                    f"max lag {stats['max_lag']:.0f}s | intervals {interval_range} | "
+                    f"budget {stats['budget_tokens']:.1f} loads")
@@ -1,237 +1,802 @@
 import re
 import time
 import random
+import hashlib
 from datetime import datetime
-from urllib.parse import urlparse
-from playwright.sync_api import sync_playwright
-from playwright_stealth import Stealth
 
-from config import bot, MIN_SLEEP, MAX_SLEEP, logger
-from database import load_users, is_ad_notified, mark_ad_notified
-from utils import parse_hebrew_date
+from config import (
+    SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL, SCHED_INITIAL_INTERVAL, SCHED_TARGET_NEW_PER_POLL,
+    PAGE_LOAD_BUDGET_PER_HOUR, SCHED_BATCH, SCHED_TICK, SCRAPER_ENGINE, FETCH_MODE, CRAWL_MODE, LISTING_CACHE_SIZE, MAX_FEED_PAGES, PAGE_LOAD_RETRIES, RETRY_BACKOFF,
+    SEARCH_MIN_INTERVAL, SEARCH_JITTER, BREAKER_THRESHOLD, BREAKER_BASE_BACKOFF, BREAKER_MAX_BACKOFF,
+    SCAN_REQUEST_POLL, FEED_CACHE_TTL, YAD2_ORIGIN, logger
+)
+from database import (
+    load_users, known_ad_ids, enqueue_notifications, load_search_state, save_search_state,
+    save_ads, touch_ads, load_recent_ads, take_scan_requests, scan_requests_pending
+)
+from utils import parse_hebrew_date, normalize_search_url, feed_page_url, parse_price, parse_rooms, search_city
+from filter_index import FilterIndex
+from listing import Listing, ListingCache, FeedCache
+from archive import archive, NO_CITY
+from network_policy import policy as network_policy
+from browser_manager import BrowserManager
+from http_fetcher import FetchError, fetch_raw_items, fetch_stats
+from pacing import RateLimiter
+from block_detector import OK, EMPTY, BLOCKED, ERROR, PageBlocked, classify, probe_page
+from circuit_breaker import CircuitBreaker, CLOSED
+import metrics
+from readiness import wait_for_feed
+from scheduler import SearchScheduler
+
+MAX_FEED_ITEMS = 15
+MAX_AD_AGE_DAYS = 3
+HWM_STOP_RUN = 3  # Consecutive already-seen ads that mark the end of new items
+HWM_MAX_IDS = 60
+
+search_pacer = RateLimiter(SEARCH_MIN_INTERVAL, SEARCH_JITTER)
+browser_manager = BrowserManager()
+crawl_index = None  # FilterIndex of the current plan in city crawl mode
+listing_cache = ListingCache(LISTING_CACHE_SIZE)
+feed_cache = FeedCache(FEED_CACHE_TTL)
+breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_BASE_BACKOFF, BREAKER_MAX_BACKOFF)
+SKIPPED = "skipped"  # scrape_search result when the breaker did not allow a load
 
 # --- Scraper Logic ---
 def extract_ad_id(link):
     try:
-        path = urlparse(link).path
+        # Plain splitting: urlparse was most of the cost of a cached listing
+        path = link.split("?", 1)[0].split("#", 1)[0]
         if "/item/" in path:
             return path.split("/item/")[-1]
         return None
     except:
         return None
 
+def plan_searches(users):
+    """Groups active users by normalized search URL so each distinct feed is loaded once per cycle."""
+    searches = {}
+    for user_id, user_data in users.items():
+        if not user_data.get("active", True):
+            logger.info(f"User {user_id} notifications disabled. Skipping.")
+            continue
+
+        search_url = user_data.get("url")
+        if not search_url:
+            logger.warning(f"User {user_id} has no search URL. Skipping.")
+            continue
+
+        searches.setdefault(normalize_search_url(search_url), []).append(user_id)
+    return searches
+
+def plan(users):
+    """Plans this cycle's {search_url: user_ids} for the configured crawl mode.
+
+    In city mode users with structured filters share one broad feed per city and are
+    matched in memory; users without filters keep their own search URL.
+    """
+    global crawl_index
+    if CRAWL_MODE != "city":
+        crawl_index = None
+        return plan_searches(users)
+
+    crawl_index = FilterIndex(users)
+    searches = crawl_index.city_searches()
+    searches.update(plan_searches({
+        user_id: user_data for user_id, user_data in users.items() if user_id not in crawl_index.user_ids
+    }))
+    return searches
+
+def searches_for_users(searches, user_ids):
+    """The planned search keys that serve any of user_ids."""
+    user_ids = set(user_ids)
+    return [key for key, subscribers in searches.items() if user_ids.intersection(subscribers)]
+
+def take_rescans(searches):
+    """Takes pending scan requests from the bot. Returns {search key to run now: requesting user_ids}."""
+    requested = take_scan_requests()
+    if not requested:
+        return {}
+    rescans = {}
+    for key, subscribers in searches.items():
+        requesters = [user_id for user_id in subscribers if user_id in requested]
+        if requesters:
+            rescans[key] = requesters
+    logger.info(f"Rescan requested by {len(requested)} user(s): {len(rescans)} search(es) due now.")
+    return rescans
+
+def sleep_until_requested(seconds):
+    """Sleeps up to seconds, waking early when the bot asks for a rescan."""
+    deadline = time.time() + seconds
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, SCAN_REQUEST_POLL))
+        try:
+            if scan_requests_pending():
+                return
+        except Exception as e:
+            logger.error(f"Error checking scan requests: {e}")
+
+def cold_limit_for(search_url):
+    """Items kept on a cold scan: the top-15 window, or the whole page for a shared city crawl."""
+    if crawl_index is not None and crawl_index.city_for(search_url):
+        return None
+    return MAX_FEED_ITEMS
+
+def parse_item_date(date_text, img_src):
+    """Parses the ad date from the createdAt label, falling back to the image URL."""
+    if date_text:
+        match = re.search(r"(\d{1,2})/(\d{1,2})/(\d{2})", date_text)
+        if match:
+            day = int(match.group(1))
+            month = int(match.group(2))
+            year_full = 2000 + int(match.group(3))
+            return datetime(year_full, month, day).date()
+        return parse_hebrew_date(date_text)
+
+    # Fallback: Try extracting date from Image URL
+    if img_src:
+        img_match = re.search(r"/Pic/(\d{4})(\d{2})/(\d{2})/", img_src)
+        if img_match:
+            y = int(img_match.group(1))
+            m = int(img_match.group(2))
+            d = int(img_match.group(3))
+            return datetime(y, m, d).date()
+    return None
+
+# Pulls every field of the top feed items in a single round-trip.
+FEED_EXTRACT_JS = """
+(limit) => {
+    let items = Array.from(document.querySelectorAll("li[data-nagish='feed-item-list-box']"));
+    if (!items.length) {
+        items = Array.from(document.querySelectorAll(".feed-item")); // Fallback selector
+    }
+    const text = (item, selector) => {
+        const el = item.querySelector(selector);
+        return el ? el.innerText.trim() : "";
+    };
+    return {
+        found: items.length,
+        items: items.slice(0, limit || items.length).map((item) => {
+            const link = item.querySelector("a");
+            const date = item.querySelector('span[class*="report-ad_createdAt"]');
+            const img = item.querySelector("img");
+            return {
+                href: link ? link.getAttribute("href") : null,
+                date_text: date ? date.innerText : null,
+                img_src: img ? img.getAttribute("src") : null,
+                price: text(item, "[data-testid='price']"),
+                address: text(item, "[data-testid='street-name']"),
+                city: text(item, "[data-testid='item-info-line-1st']"),
+                rooms: text(item, "[data-testid='item-info-line-2nd']"),
+            };
+        }),
+    };
+}
+"""
+
+def parse_listing(ad_id, link, raw, index=0):
+    """Parses one feed record into a Listing: numeric price and rooms, and the ad date."""
+    price_text = raw.get("price") or "N/A"
+    rooms_text = raw.get("rooms") or ""
+    img_src = raw.get("img_src") or ""
+    listing = Listing(
+        ad_id, link, parse_price(price_text), parse_rooms(rooms_text), None,
+        raw.get("address") or "", raw.get("city") or "", price_text, rooms_text,
+        img_src if img_src.startswith("http") else ""  # Lazy-loaded images may still be a placeholder
+    )
+
+    date_text = raw.get("date_text")
+    try:
+        listing.date = parse_item_date(date_text, raw.get("img_src"))
+        logger.debug("Item %d: Ad %s parsed date %s from '%s'.", index, ad_id, listing.date,
+                     date_text or raw.get("img_src"), extra={"ad": ad_id, "phase": "parse"})
+    except Exception as e:
+        logger.error(f"Error checking date for {ad_id}: {e}")
+        listing.error = True
+    return listing
+
+def refresh_listing(listing, raw, dates):
+    """Re-reads a cached listing's date and image, which a bump or an edit changes without touching price or rooms.
+
+    Relative labels ("עודכן היום") mean another date on another day, so the date
+    is parsed again rather than compared by its text. dates memoizes the labels
+    parsed in one build, since most ads of a feed share a handful of them.
+    """
+    date_text = raw.get("date_text")
+    img_src = raw.get("img_src") or ""
+    label = date_text or img_src
+    if label in dates:
+        ad_date = dates[label]
+    else:
+        ad_date = dates[label] = parse_item_date(date_text, img_src)
+    image = img_src if img_src.startswith("http") else listing.image
+    if ad_date != listing.date or image != listing.image:
+        listing.date = ad_date
+        listing.image = image
+        listing_cache.store(listing)  # Dirty again, so the ads row gets the new date
+
+def build_listings(raw_items):
+    """Turns raw feed records into Listings in pure Python, reusing ads parsed before."""
+    listings = []
+    dates = {}  # date label -> parsed date, for cache hits
+    for i, raw in enumerate(raw_items):
+        try:
+            href = raw.get("href")
+            if not href:
+                logger.debug("Item %d: No link/href found.", i, extra={"phase": "parse"})
+                listings.append(Listing())
+                continue
+
+            full_link = f"{YAD2_ORIGIN}{href}" if href.startswith("/") else href
+            ad_id = extract_ad_id(full_link)
+            if not ad_id:
+                logger.debug("Item %d: Could not extract Ad ID from %s.", i, full_link, extra={"phase": "parse"})
+                listings.append(Listing())
+                continue
+
+            listing = listing_cache.lookup(ad_id, raw.get("price") or "N/A", raw.get("rooms") or "")
+            if listing is None:
+                listing = parse_listing(ad_id, full_link, raw, i)
+                if not listing.error:
+                    listing_cache.store(listing)
+            else:
+                refresh_listing(listing, raw, dates)
+            listings.append(listing)
+        except Exception as e:
+            logger.error(f"Error parsing item {i}: {e}")
+            listings.append(Listing(error=True))
+
+    return listings
+
+def extract_listings(page, limit=MAX_FEED_ITEMS):
+    """Extracts feed items in one page.evaluate call and returns (items found, listings).
+
+    A limit of None extracts the whole page.
+    """
+    with metrics.timer("yad2bot_phase_seconds", phase="extract"):
+        return feed_listings(page.evaluate(FEED_EXTRACT_JS, limit))
+
+def feed_listings(result):
+    """(items found, listings) from a FEED_EXTRACT_JS result, for either engine."""
+    logger.info(f"Found {result['found']} items in feed.")
+    return result["found"], build_listings(result["items"])
+
+# --- High-Water Mark ---
+def subscriber_signature(user_ids):
+    """Identifies a search's subscriber set; a change forces a cold (full first page) scan."""
+    return hashlib.sha1(",".join(sorted(user_ids)).encode()).hexdigest()[:16]
+
+def seen_ids_for(state, user_ids):
+    """Returns the previous scan's ad ids if they apply to these subscribers, else None (cold scan)."""
+    if state and state["subscribers"] == subscriber_signature(user_ids):
+        return set(state["seen_ids"])
+    return None
+
+def scan_page(listings, seen_ids):
+    """Cuts a newest-first page at the high-water mark. Returns (listings to process, items examined, page deeper).
+
+    The mark is reached after HWM_STOP_RUN consecutive already-seen ads, so pinned
+    or promoted items that keep reappearing at the top do not end the scan early.
+    For the same reason an ad older than MAX_AD_AGE_DAYS only ends the scan once
+    HWM_STOP_RUN of them come in a row.
+    """
+    if seen_ids is None:
+        return listings, len(listings), False
+
+    today = datetime.now().date()
+    kept = []
+    seen_run = 0
+    old_run = 0
+    for examined, listing in enumerate(listings, 1):
+        ad_id = listing.ad_id
+        if ad_id and ad_id in seen_ids:
+            seen_run += 1
+            if seen_run >= HWM_STOP_RUN:
+                logger.debug("Reached high-water mark at ad %s.", ad_id, extra={"ad": ad_id, "phase": "scan"})
+                return kept, examined, False
+            continue
+
+        seen_run = 0
+        kept.append(listing)
+        parsed_date = listing.date
+        if parsed_date and (today - parsed_date).days > MAX_AD_AGE_DAYS:
+            old_run += 1
+            if old_run >= HWM_STOP_RUN:
+                # Newest-first: everything below this run is older still
+                return kept, examined, False
+        else:
+            old_run = 0
+
+    return kept, len(listings), seen_run == 0 and old_run == 0 and bool(listings)
+
+def next_search_state(examined):
+    """Top ad ids and newest date of the first page's examined items, stored as the next scan's mark."""
+    top_ids = [l.ad_id for l in examined if l.ad_id][:HWM_MAX_IDS]
+    dates = [l.date for l in examined if l.date]
+    return top_ids, (max(dates).isoformat() if dates else None)
+
+# --- Page Loads (shared by both engines) ---
+def retry_delay(attempt):
+    """Exponential backoff with jitter before retry number attempt+1."""
+    return RETRY_BACKOFF * (2 ** attempt) * random.uniform(1, 1.5)
+
+def checked_status(response):
+    """The response's HTTP status; raises on an error status so the load is retried."""
+    status = response.status if response else None
+    if classify(status) == ERROR:
+        raise RuntimeError(f"HTTP {status}")
+    return status
+
+def failed_attempt(sessions, session, url, attempt, error):
+    """Counts a failed page load. Returns the delay before the next attempt, or None when out of retries."""
+    sessions.record_failure(session)
+    if attempt >= PAGE_LOAD_RETRIES - 1:
+        return None
+    delay = retry_delay(attempt)
+    logger.warning(f"Page load attempt {attempt+1} failed for {url}: {error}. Retrying in {delay:.0f}s...")
+    return delay
+
+def blocked(sessions, session, message):
+    """Retires the identity that got blocked and returns the PageBlocked to raise."""
+    sessions.record_failure(session, blocked=True)
+    return PageBlocked(message)
+
+def http_listings(found, raw_items, limit):
+    """(items found, listings) from an HTTP fetch, for either engine."""
+    logger.info(f"Found {found} items in feed (HTTP).")
+    with metrics.timer("yad2bot_phase_seconds", phase="extract"):
+        return found, build_listings(raw_items[:limit] if limit else raw_items)
+
+def load_page(page, url):
+    """Navigates to a feed page with retries and waits until the feed is ready.
+
+    Raises PageBlocked as soon as a block or challenge page is recognized, without
+    retrying or waiting for a feed that will not come.
+    """
+    sessions = browser_manager.sessions
+    session = browser_manager.session_for(page)
+    status = None
+    for attempt in range(PAGE_LOAD_RETRIES):
+        search_pacer.wait()
+        start = time.perf_counter()
+        try:
+            with metrics.timer("yad2bot_phase_seconds", phase="goto"):
+                response = page.goto(url, timeout=30000, wait_until="domcontentloaded")
+            status = checked_status(response)
+            break
+        except Exception as e:
+            delay = failed_attempt(sessions, session, url, attempt, e)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+    if probe_page(page, status) == BLOCKED:
+        raise blocked(sessions, session, f"block page at {url} (HTTP {status})")
+    with metrics.timer("yad2bot_phase_seconds", phase="feed_wait"):
+        ready = wait_for_feed(page)
+    # A challenge may also be rendered by script after the initial HTML
+    if not ready and probe_page(page) == BLOCKED:
+        raise blocked(sessions, session, f"challenge rendered at {url}")
+    sessions.record_load(session, time.perf_counter() - start)
+    return ready
+
+# --- Feed Scans (shared by both engines) ---
+class FeedScan:
+    """Pages through one newest-first feed while every item is new.
+
+    Iterating yields (url, limit) for the next page to load; the engine loads it
+    however it loads pages and hands the result to add(), which decides whether
+    the page after it is needed.
+    """
+
+    def __init__(self, search_url, seen_ids):
+        self.search_url = search_url
+        self.seen_ids = seen_ids
+        self.found = 0
+        self.listings = []  # Listings to process, from every page loaded
+        self.first_page = []
+        self.examined = []  # The first page's items above where the scan stopped: what the mark may cover
+        self.pages = 0
+        self.done = False
+
+    def __iter__(self):
+        while not self.done and self.pages < MAX_FEED_PAGES:
+            # A cold scan keeps the original top-15 window; warm scans read whole pages
+            yield (feed_page_url(self.search_url, self.pages + 1),
+                   cold_limit_for(self.search_url) if self.seen_ids is None else None)
+
+    def add(self, found, page_listings):
+        self.pages += 1
+        self.found += found
+        kept, examined, deeper = scan_page(page_listings, self.seen_ids)
+        if self.pages == 1:
+            self.first_page = page_listings
+            self.examined = page_listings[:examined]
+        self.listings.extend(kept)
+        if deeper:
+            logger.info(f"Every item on page {self.pages} is new, scanning page {self.pages + 1}...")
+        else:
+            self.done = True
+
+def load_http(url, limit):
+    search_pacer.wait()
+    with metrics.timer("yad2bot_phase_seconds", phase="http_fetch"):
+        found, raw_items = fetch_raw_items(url)
+    return http_listings(found, raw_items, limit)
+
+def scan_feed(search_url, seen_ids, load):
+    """Runs a FeedScan with load(url, limit) returning (items found, listings)."""
+    scan = FeedScan(search_url, seen_ids)
+    for url, limit in scan:
+        scan.add(*load(url, limit))
+    return scan
+
+def fetch_feed(search_url, seen_ids=None):
+    """Loads a search feed over HTTP when enabled, otherwise (or on failure) in the browser. Returns the FeedScan."""
+    if FETCH_MODE == "http":
+        try:
+            result = scan_feed(search_url, seen_ids, load_http)
+            fetch_stats.record("http", "ok")
+            return result
+        except FetchError as e:
+            fetch_stats.record("http", type(e).__name__)
+            logger.info(f"HTTP fetch failed for {search_url} ({e}), falling back to browser.")
+
+    with browser_manager.page() as page:
+        def load_browser(url, limit):
+            load_page(page, url)
+            return extract_listings(page, limit)
+
+        try:
+            result = scan_feed(search_url, seen_ids, load_browser)
+        except Exception:
+            fetch_stats.record("browser", "error")
+            raise
+        fetch_stats.record("browser", "ok")
+        return result
+
+def format_ad_message(listing):
+    return (
+        f"🏠 *מציאה חדשה!*\n"
+        f"📍 {listing.address}, {listing.city}\n"
+        f"💰 {listing.price_text}\n"
+        f"🛏️ {listing.rooms_text}\n"
+        f"🔗 [לצפייה במודעה]({listing.link})"
+    )
+
+def process_listings(user_id, found, listings):
+    """Applies per-user dedup and date filtering to a fetched feed and queues new ads for sending."""
+    new_ads_count = 0
+    already_notified_count = 0
+    too_old_count = 0
+    no_date_count = 0
+    no_link_count = 0
+    error_count = 0
+    today = datetime.now().date()
+
+    # Deduplication (Check EARLY, one query for the whole feed, including ads still in the outbox)
+    known = known_ad_ids(user_id, [l.ad_id for l in listings if l.ad_id])
+    queued = []
+
+    for listing in listings:
+        if listing.error:
+            error_count += 1
+            continue
+
+        ad_id = listing.ad_id
+        if not ad_id:
+            no_link_count += 1
+            continue
+
+        if ad_id in known:
+            logger.debug("Ad %s: Already notified for %s. Skipping.", ad_id, user_id,
+                         extra={"user": user_id, "ad": ad_id, "phase": "dedup"})
+            already_notified_count += 1
+            continue
+
+        parsed_date = listing.date
+        if not parsed_date:
+            logger.debug("Ad %s: No valid date found. Skipping.", ad_id,
+                         extra={"user": user_id, "ad": ad_id, "phase": "filter"})
+            no_date_count += 1
+            continue
+
+        # 3-Day Filter
+        delta = (today - parsed_date).days
+        logger.debug("Ad %s | Price: %s | Date: %s | Age: %d days", ad_id, listing.price_text, parsed_date, delta,
+                     extra={"user": user_id, "ad": ad_id, "phase": "filter"})
+        if delta > MAX_AD_AGE_DAYS:
+            too_old_count += 1
+            continue
+
+        queued.append((ad_id, user_id, format_ad_message(listing), listing.image))
+        known.add(ad_id)
+
+    # The dispatcher sends these and marks them notified on success
+    new_ads_count = enqueue_notifications(queued)
+    if new_ads_count:
+        logger.info("Queued %d notification(s) for user %s.", new_ads_count, user_id,
+                    extra={"user": user_id, "phase": "queue"})
+
+    if metrics.enabled():
+        for outcome, count in (("new", new_ads_count), ("already_notified", already_notified_count),
+                               ("too_old", too_old_count), ("no_date", no_date_count),
+                               ("no_link", no_link_count), ("error", error_count)):
+            if count:
+                metrics.inc("yad2bot_listings_total", count, outcome=outcome)
+
+    logger.info("📊 Scan Summary for user %s: "
+                "Found %s items | "
+                "Processed %d | "
+                "%d already notified | "
+                "%d too old | "
+                "%d no date | "
+                "%d no link | "
+                "%d errors | "
+                "%d NEW queued",
+                user_id, found, len(listings), already_notified_count, too_old_count, no_date_count,
+                no_link_count, error_count, new_ads_count, extra={"user": user_id, "phase": "process"})
+    return new_ads_count
+
+def fan_out(search_url, user_ids, found, listings):
+    """Queues each user's new ads from a fetched feed. Returns False if any user's processing failed."""
+    city_code = crawl_index.city_for(search_url) if crawl_index is not None else None
+    if city_code:
+        # City crawl: each subscriber only gets the listings inside their price and rooms ranges
+        per_user = {user_id: [] for user_id in user_ids}
+        for listing in listings:
+            if not listing.ad_id:
+                continue
+            for user_id in crawl_index.match(city_code, listing.price, listing.rooms):
+                if user_id in per_user:
+                    per_user[user_id].append(listing)
+    else:
+        per_user = {user_id: listings for user_id in user_ids}
+
+    delivered = True
+    for user_id in user_ids:
+        try:
+            process_listings(user_id, found, per_user[user_id])
+        except Exception as e:
+            logger.error(f"Error processing feed for user {user_id}: {e}")
+            delivered = False
+    return delivered
+
+def deliver_feed(search_url, user_ids, scan):
+    """Fans a finished FeedScan out to every subscriber, then advances the search's high-water mark."""
+    try:
+        save_ads(listing.to_row() for listing in listing_cache.take_dirty())
+        # Keeps the dedup rows of ads still in the feed from being compacted away
+        touch_ads({listing.ad_id for listing in scan.first_page + scan.listings if listing.ad_id})
+    except Exception as e:
+        logger.error(f"Error saving parsed ads: {e}")
+    archive.append(search_url, scan.found, scan.listings)
+
+    delivered = fan_out(search_url, user_ids, scan.found, scan.listings)
+
+    # Only move the mark once every subscriber has seen everything above it, and only over what was examined
+    if delivered and scan.examined:
+        top_ids, newest_date = next_search_state(scan.examined)
+        save_search_state(search_url, top_ids, newest_date, subscriber_signature(user_ids))
+
+def scrape_search(search_url, user_ids):
+    """Scans one search for all its subscribers. Returns (ads above the mark or None if cold, pages loaded),
+    or SKIPPED while the circuit breaker holds scraping back.
+    """
+    ticket = breaker.acquire()
+    if ticket is None:
+        return SKIPPED
+    logger.info(f"Checking search for {len(user_ids)} user(s): {', '.join(user_ids)}...")
+    try:
+        # Inside the try so a failing state load still settles the ticket (a held probe would stall the breaker)
+        seen_ids = seen_ids_for(load_search_state(search_url), user_ids)
+        with metrics.timer("yad2bot_phase_seconds", phase="scan"):
+            scan = fetch_feed(search_url, seen_ids)
+    except PageBlocked:
+        breaker.record(BLOCKED, ticket)
+        raise
+    except Exception:
+        breaker.record(ERROR, ticket)
+        raise
+    breaker.record(OK if scan.found else EMPTY, ticket)
+    feed_cache.store(search_url, scan.found, scan.first_page)
+    with metrics.timer("yad2bot_phase_seconds", phase="deliver"):
+        deliver_feed(search_url, user_ids, scan)
+    return (len(scan.listings) if seen_ids is not None else None), scan.pages
+
+def scrape_searches(searches, yield_to_requests=False):
+    """Scans the given {search_url: user_ids} on the shared browser. Returns {search_url: result, None on error or SKIPPED}.
+
+    With yield_to_requests, a scan request from the bot stops the batch: the
+    searches not started yet come back SKIPPED so the request is served first.
+    """
+    results = {}
+    for search_url, user_ids in searches.items():
+        if yield_to_requests and results and scan_requests_pending():
+            logger.info(f"Scan requested, deferring {len(searches) - len(results)} search(es) of this batch.")
+            results.update((key, SKIPPED) for key in searches if key not in results)
+            break
+        try:
+            results[search_url] = scrape_search(search_url, user_ids)
+        except Exception as e:
+            logger.error(f"Error scraping {search_url}: {e}")
+            results[search_url] = None
+
+    browser_manager.log_stats()
+    fetch_stats.log_stats()
+    listing_cache.log_stats()
+    breaker.log_stats()
+    if network_policy:
+        network_policy.log_stats()
+    metrics.flush_trace(engine="sync", searches=len(searches))
+    return results
+
+def run_searches(searches, yield_to_requests=False):
+    """Scans searches on the configured engine (the async engine runs a batch concurrently and does not yield)."""
+    if SCRAPER_ENGINE == "async":
+        from async_scraper import run_searches_async
+        results = run_searches_async(searches)
+    else:
+        results = scrape_searches(searches, yield_to_requests)
+    archive.flush()
+    return results
+
+# --- Priority Lane ---
+def serve_cached(search_url, user_ids, cached):
+    """Delivers a search fetched moments ago to the users who asked for a scan, without loading it again."""
+    age, found, first_page = cached
+    limit = cold_limit_for(search_url)
+    logger.info(f"⚡ Serving scan request of {', '.join(user_ids)} from a fetch {age:.0f}s old.")
+    metrics.inc("yad2bot_scan_requests_total", outcome="cached")
+    with metrics.timer("yad2bot_phase_seconds", phase="deliver"):
+        fan_out(search_url, user_ids, found, first_page[:limit] if limit else first_page)
+
+def scan_now(scheduler, searches, rescans):
+    """Runs the searches users asked for right away, ahead of due work and regardless of the page-load budget.
+
+    A search fetched within FEED_CACHE_TTL is served from that fetch, to the
+    requesting users only; the others are scanned for all their subscribers.
+    """
+    to_fetch = {}
+    for key, requesters in rescans.items():
+        cached = feed_cache.get(key)
+        if cached is not None:
+            try:
+                serve_cached(key, requesters, cached)
+            except Exception as e:
+                logger.error(f"Error serving cached feed for {key}: {e}")
+            continue
+        to_fetch[key] = searches[key]
+    if not to_fetch:
+        return
+
+    logger.info(f"⚡ Scanning {len(to_fetch)} requested search(es) now.")
+    metrics.inc("yad2bot_scan_requests_total", len(to_fetch), outcome="fetched")
+    scheduler.budget.consume(len(to_fetch))
+    finish_scans(scheduler, run_searches(to_fetch))
+
+def backfill(users, user_ids):
+    """Queues archived ads from the last MAX_AD_AGE_DAYS that match the users' current filters, with no page load.
+
+    Users with structured filters are matched by city, price and rooms against
+    every archived feed of their city; the others get what was archived for
+    their own search URL. Like a cold scan, each user gets at most the newest
+    MAX_FEED_ITEMS, so a new or widened filter does not flood the chat.
+    """
+    if not archive.enabled or not user_ids:
+        return
+    archive.flush()
+    start = time.time()
+    wanted = {user_id: users[user_id] for user_id in user_ids if user_id in users}
+    index = FilterIndex(wanted)
+    by_url = {}  # normalized search URL -> user_ids without structured filters
+    for user_id, user_data in wanted.items():
+        if user_id not in index.user_ids and user_data.get("url"):
+            by_url.setdefault(normalize_search_url(user_data["url"]), []).append(user_id)
+
+    cities = set(index.subscribers) | {search_city(url) or NO_CITY for url in by_url}
+    per_user = {user_id: {} for user_id in wanted}  # user_id -> {ad_id: (seen_at, newest archived listing)}
+    records = 0
+    for city_code in cities:
+        for seen_at, search_url, _, listing in archive.read(city_code, since=start - (MAX_AD_AGE_DAYS + 1) * 86400):
+            records += 1
+            for user_id in index.match(city_code, listing.price, listing.rooms):
+                per_user[user_id][listing.ad_id] = (seen_at, listing)
+            for user_id in by_url.get(search_url, ()):
+                per_user[user_id][listing.ad_id] = (seen_at, listing)
+
+    queued = 0
+    for user_id, ads in per_user.items():
+        if not ads:
+            continue
+        # Newest first by ad date, then by when the archive last saw the ad
+        newest = sorted(ads.values(), key=lambda item: (item[1].date.toordinal() if item[1].date else 0, item[0]),
+                        reverse=True)
+        listings = [listing for _, listing in newest[:MAX_FEED_ITEMS]]
+        try:
+            queued += process_listings(user_id, len(listings), listings)
+        except Exception as e:
+            logger.error(f"Error backfilling user {user_id}: {e}")
+    logger.info(f"📦 Backfilled {len(wanted)} user(s) from {records} archived records: "
+                f"{queued} ad(s) queued in {time.time() - start:.2f}s.")
+
+def finish_scans(scheduler, results):
+    for key, result in results.items():
+        if result is SKIPPED:
+            scheduler.reschedule(key)
+        elif result is None:
+            scheduler.complete(key, ok=False)
+        else:
+            new_ads, pages = result
+            scheduler.complete(key, new_ads, pages)
+
 def scrape_cycle():
+    """Scans every active search once (one-off full cycle)."""
     logger.info("--- Starting Scraper Cycle ---")
     users = load_users()
     
     if not users:
         logger.info("No users configured.")
-        return
+        return {}
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        
-        for user_id, user_data in users.items():
-            search_url = user_data.get("url")
-            active = user_data.get("active", True)
-            
-            if not active:
-                logger.info(f"User {user_id} notifications disabled. Skipping.")
-                continue
+    searches = plan(users)
+    subscribers = sum(len(user_ids) for user_ids in searches.values())
+    logger.info(f"Planned {len(searches)} distinct searches for {subscribers} active users.")
+    return run_searches(searches)
 
-            logger.info(f"Checking for user {user_id}...")
-            
-            # Stealth Context
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-                viewport={"width": random.randint(1800, 1920), "height": random.randint(900, 1080)},
-                locale="he-IL"
-            )
-            page = context.new_page()
-            stealth = Stealth()
-            stealth.apply_stealth_sync(page)
-            
-            try:
-                # Retry logic for page loading
-                for attempt in range(3):
-                    try:
-                        page.goto(search_url, timeout=30000)
-                        break
-                    except Exception as e:
-                        if attempt < 2:
-                            logger.warning(f"Page load attempt {attempt+1} failed for user {user_id}: {e}. Retrying in 10s...")
-                            time.sleep(10)
-                        else:
-                            raise
-                
-                time.sleep(5) # Initial load
-                page.mouse.wheel(0, 1000) # Trigger lazy load
-                time.sleep(3)
-                
-                # Check for feed items
-                items = page.locator("li[data-nagish='feed-item-list-box']").all()
-                if not items:
-                    items = page.locator(".feed-item").all() # Fallback selector
-                
-                logger.info(f"Found {len(items)} items in feed.")
-                
-                new_ads_count = 0
-                already_notified_count = 0
-                too_old_count = 0
-                no_date_count = 0
-                no_link_count = 0
-                error_count = 0
-                # Process top 15 items (sorted by newest first via order=1)
-                for i, item in enumerate(items[:15]):
-                    logger.debug(f"--- Processing Item {i+1}/{min(len(items), 15)} ---")
-                    try:
-                        # Extract Link
-                        link_el = item.locator("a").first
-                        if link_el.count() == 0:
-                            logger.debug(f"Item {i}: No link element found. Skipping.")
-                            no_link_count += 1
-                            continue
-                            
-                        href = link_el.get_attribute("href")
-                        if not href: 
-                            logger.debug(f"Item {i}: No href attribute. Skipping.")
-                            no_link_count += 1
-                            continue
-                        
-                        full_link = f"https://www.yad2.co.il{href}" if href.startswith("/") else href
-                        ad_id = extract_ad_id(full_link)
-                         
-                        if not ad_id: 
-                            logger.debug(f"Item {i}: Could not extract Ad ID from {full_link}. Skipping.")
-                            no_link_count += 1
-                            continue
-                        
-                        
-                        logger.debug(f"Item {i}: Ad ID {ad_id} found.")
-                        
-                        # Deduplication (Check EARLY)
-                        if is_ad_notified(ad_id, user_id):
-                            logger.debug(f"Ad {ad_id}: Already notified. Skipping.")
-                            already_notified_count += 1
-                            continue
-
-                        # Extract Price early for logging
-                        price = item.locator("[data-testid='price']").inner_text().strip() if item.locator("[data-testid='price']").count() else "N/A"
-
-                        # --- Date Filtering (Strict Class Match) ---
-                        try:
-                            date_el = item.locator('span[class*="report-ad_createdAt"]').first
-                            
-                            parsed_date = None
-                            date_text_log = "N/A"
-
-                            if date_el.count() > 0:
-                                raw_text = date_el.inner_text()
-                                date_text_log = raw_text
-                                
-                                match = re.search(r"(\d{1,2})/(\d{1,2})/(\d{2})", raw_text)
-                                if match:
-                                    day = int(match.group(1))
-                                    month = int(match.group(2))
-                                    year_short = int(match.group(3))
-                                    year_full = 2000 + year_short
-                                    
-                                    parsed_date = datetime(year_full, month, day).date()
-                                    logger.debug(f"Item {i}: Parsed date {parsed_date} from '{raw_text}' (Regex).")
-                                else:
-                                    parsed_date = parse_hebrew_date(raw_text)
-                                    logger.debug(f"Item {i}: Parsed date {parsed_date} from '{raw_text}' (Fallback).")
-                            else:
-                                # Fallback: Try extracting date from Image URL
-                                img_el = item.locator("img").first
-                                if img_el.count() > 0:
-                                    src = img_el.get_attribute("src")
-                                    if src:
-                                        img_match = re.search(r"/Pic/(\d{4})(\d{2})/(\d{2})/", src)
-                                        if img_match:
-                                            y = int(img_match.group(1))
-                                            m = int(img_match.group(2))
-                                            d = int(img_match.group(3))
-                                            parsed_date = datetime(y, m, d).date()
-                                            logger.debug(f"Item {i}: Parsed date {parsed_date} from Image URL.")
-                                
-                                if not parsed_date:
-                                    logger.debug(f"Item {i}: Date selector NOT found & Image URL failed.")
-                                    pass
-                            
-                            if not parsed_date:
-                                logger.debug(f"Ad {ad_id}: No valid date found. Skipping.")
-                                no_date_count += 1
-                                continue
-                            
-                            # 3-Day Filter
-                            today = datetime.now().date()
-                            delta = (today - parsed_date).days
-                            
-                            logger.debug(f"Ad {ad_id} | Price: {price} | Date: {parsed_date} | Age: {delta} days")
-
-                            if delta > 3:
-                                too_old_count += 1
-                                continue
-                            
-                        except Exception as e:
-                            logger.error(f"Error checking date for {ad_id}: {e}")
-                            error_count += 1
-                            continue
-
-                        # New Ad Found! Extract Details
-                        address = item.locator("[data-testid='street-name']").inner_text().strip() if item.locator("[data-testid='street-name']").count() else ""
-                        city = item.locator("[data-testid='item-info-line-1st']").inner_text().strip() if item.locator("[data-testid='item-info-line-1st']").count() else ""
-                        rooms = item.locator("[data-testid='item-info-line-2nd']").inner_text().strip() if item.locator("[data-testid='item-info-line-2nd']").count() else ""
-
-                        msg = (
-                            f"🏠 *מציאה חדשה!*\n"
-                            f"📍 {address}, {city}\n"
-                            f"💰 {price}\n"
-                            f"🛏️ {rooms}\n"
-                            f"🔗 [לצפייה במודעה]({full_link})"
-                        )
-                        
-                        # Send Notification
-                        logger.info(f"Sending notification to {user_id} for ad {ad_id}")
-                        try:
-                            bot.send_message(user_id, msg, parse_mode="Markdown")
-                            mark_ad_notified(ad_id, user_id)
-                            logger.info(f"Ad {ad_id} sent to user {user_id}.")
-                            new_ads_count += 1
-                        except Exception as e:
-                            logger.error(f"Failed to send to {user_id}: {e}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error parsing item {i}: {e}")
-                        error_count += 1
-                
-                processed = min(len(items), 15)
-                logger.info(f"📊 Scan Summary for user {user_id}: "
-                      f"Found {len(items)} items | "
-                      f"Processed {processed} | "
-                      f"{already_notified_count} already notified | "
-                      f"{too_old_count} too old | "
-                      f"{no_date_count} no date | "
-                      f"{no_link_count} no link | "
-                      f"{error_count} errors | "
-                      f"{new_ads_count} NEW sent")
-                
-            except Exception as e:
-                logger.error(f"Error scraping for user {user_id}: {e}")
-            finally:
-                context.close()
-                time.sleep(random.randint(5, 10)) # Pause between users
-        
-        browser.close()
+def warm_listing_cache():
+    """Loads recently parsed ads so a restart does not parse every ad again."""
+    try:
+        listing_cache.warm(Listing.from_row(row) for row in load_recent_ads(LISTING_CACHE_SIZE))
+        logger.info(f"Loaded {len(listing_cache)} parsed ads into the listing cache.")
+    except Exception as e:
+        logger.error(f"Error loading parsed ads: {e}")
+
+def register_gauges():
+    """Browser, breaker and cache state for the metrics endpoint."""
+    metrics.stats_gauge("yad2bot_browser", browser_manager.stats, "Shared browser lifecycle stats.")
+    metrics.stats_gauge("yad2bot_breaker", breaker.stats, "Circuit breaker counters.")
+    metrics.gauge("yad2bot_breaker_open", lambda: {"closed": 0, "half_open": 0.5, "open": 1}[breaker.state],
+                  "1 while the circuit breaker is open, 0.5 while probing.")
+    metrics.gauge("yad2bot_listing_cache_size", lambda: len(listing_cache), "Parsed ads in the listing cache.")
+    metrics.gauge("yad2bot_listing_cache_hit_rate", listing_cache.hit_rate, "Listing cache hit rate since start.")
+    if archive.enabled:
+        metrics.stats_gauge("yad2bot_archive", archive.stats, "Listing archive segments, records and bytes.")
 
 def run_scraper():
+    """Polls each distinct search when the adaptive scheduler says it is due."""
+    warm_listing_cache()
+    scheduler = SearchScheduler(
+        SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL, SCHED_INITIAL_INTERVAL, PAGE_LOAD_BUDGET_PER_HOUR,
+        target_per_poll=SCHED_TARGET_NEW_PER_POLL
+    )
+    register_gauges()
+    metrics.stats_gauge("yad2bot_scheduler", scheduler.stats, "Adaptive scheduler queue and budget.")
     while True:
         try:
-            scrape_cycle()
+            users = load_users()
+            searches = plan(users)
+            scheduler.sync(searches)
+            rescans = take_rescans(searches)
+            if rescans:
+                backfill(users, {user_id for requesters in rescans.values() for user_id in requesters})
+                scan_now(scheduler, searches, rescans)
+
+            # While the breaker is open nothing is popped; a half-open breaker gets one probe search
+            due = []
+            if not breaker.seconds_until_probe():
+                due = scheduler.pop_due(SCHED_BATCH if breaker.state == CLOSED else 1)
+            if due:
+                scheduler.log_stats()
+                results = run_searches({key: searches[key] for key in due}, yield_to_requests=True)
+                finish_scans(scheduler, {key: results.get(key) for key in due})
         except Exception as e:
             logger.critical(f"Critical Scraper Error: {e}")
-        
-        sleep_time = random.randint(MIN_SLEEP, MAX_SLEEP)
-        logger.info(f"Sleeping for {sleep_time // 60} minutes ({sleep_time}s)...")
-        time.sleep(sleep_time)
+
+        wait = scheduler.seconds_until_next()
+        pause = breaker.seconds_until_probe()
+        if pause:
+            wait = pause if wait is None else max(wait, pause)
+        sleep_until_requested(SCHED_TICK if wait is None else min(max(wait, 1), SCHED_TICK))
@@ -0,0 +1,15 @@
+"""Scraper side only: the adaptive scheduler loop with the shared browser.
+
+Usage: python scraper_service.py
+
+The counterpart of bot_service.py. For several scraper processes, run
+worker.py instead.
+"""
+from database import init_db
+from scraper import run_scraper
+import metrics
+
+if __name__ == "__main__":
+    init_db()
+    metrics.start_server()
+    run_scraper()
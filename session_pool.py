@@ -0,0 +1,209 @@
+import time
+import uuid
+import threading
+
+from config import logger
+from database import load_browser_sessions, save_browser_session, delete_browser_session
+import metrics
+
+# --- Browser Identities ---
+class Session:
+    """One browser identity: fixed context options plus the cookies and localStorage of its last context."""
+
+    __slots__ = ("session_id", "options", "state", "created_at", "last_used", "pages", "failures",
+                 "warm", "in_use", "retired")
+
+    def __init__(self, session_id, options, state=None, created_at=None, last_used=0.0, pages=0, failures=0):
+        self.session_id = session_id
+        self.options = options
+        self.state = state
+        self.created_at = time.time() if created_at is None else created_at
+        self.last_used = last_used
+        self.pages = pages
+        self.failures = failures
+        self.warm = False  # Set once a context of this identity has cookies (restored or from a load)
+        self.in_use = 0
+        self.retired = None  # Reason, once retired
+
+def usable_state(state, now):
+    """A saved storage_state without its expired cookies, or None if it is unusable."""
+    if not isinstance(state, dict) or not isinstance(state.get("cookies"), list):
+        return None
+    cookies = [cookie for cookie in state["cookies"]
+               if isinstance(cookie, dict) and not 0 < cookie.get("expires", -1) < now]
+    return {"cookies": cookies, "origins": state.get("origins") or []}
+
+class SessionPool:
+    """Rotates browser contexts over a fixed set of identities whose state survives contexts and restarts.
+
+    checkout() hands out the least recently used healthy identity with its saved
+    storage_state, so a new context starts with the cookies and localStorage the
+    last one earned; release() saves the closing context's state back. An
+    identity is retired (its row deleted, a fresh one created in its place) when
+    a load with it is blocked, after max_failures failed loads in a row, or once
+    it is max_age old. With size 0 every context starts cold, as before the pool.
+
+    checkout(), save() and release() touch the database; record_load() and
+    record_failure() do not, so the async engine can call them on the event loop.
+    """
+
+    def __init__(self, size, max_age, max_failures, make_options):
+        self.size = size
+        self.max_age = max_age
+        self.max_failures = max_failures
+        self.make_options = make_options
+        self._sessions = None  # session_id -> Session, loaded from the database on first use
+        self._lock = threading.Lock()
+        self.created = 0
+        self.retired = 0
+        self.loads = {"warm": [0, 0.0], "cold": [0, 0.0]}  # label -> [page loads, total seconds]
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def _load(self):
+        if self._sessions is not None:
+            return
+        self._sessions = {}
+        try:
+            rows = load_browser_sessions()
+        except Exception as e:
+            logger.error(f"Error loading browser sessions: {e}")
+            rows = []
+        for row in rows:
+            self._sessions[row["session_id"]] = Session(**row)
+
+    def health_problem(self, session, now):
+        """Why a session should not be handed out again, or None if it is healthy."""
+        if session.retired:
+            return session.retired
+        if session.failures >= self.max_failures:
+            return f"{session.failures} failed loads in a row"
+        if now - session.created_at > self.max_age:
+            return "max age reached"
+        return None
+
+    def _retire(self, session, reason):
+        session.retired = reason
+        if self._sessions.pop(session.session_id, None) is not None:
+            self.retired += 1
+            logger.info(f"🍪 Retiring browser session {session.session_id} ({reason}) after {session.pages} pages.")
+
+    # --- Context Lifecycle ---
+    def checkout(self):
+        """Returns (session, new_context options). session is None when the pool is off."""
+        if not self.enabled:
+            return None, self.make_options()
+        now = time.time()
+        retired = []
+        with self._lock:
+            self._load()
+            for session in list(self._sessions.values()):
+                reason = self.health_problem(session, now)
+                if reason and not session.in_use:
+                    self._retire(session, reason)
+                    retired.append(session.session_id)
+
+            free = [session for session in self._sessions.values()
+                    if not session.in_use and not self.health_problem(session, now)]
+            if len(self._sessions) < self.size:
+                # Fill the pool first, so contexts rotate over size identities
+                session = Session(uuid.uuid4().hex[:12], self.make_options())
+                self._sessions[session.session_id] = session
+                self.created += 1
+            elif free:
+                session = min(free, key=lambda s: s.last_used)
+            else:
+                # Every identity is busy: share the least recently used one
+                session = min(self._sessions.values(), key=lambda s: s.last_used)
+            session.in_use += 1
+            session.last_used = now
+            state = usable_state(session.state, now)
+            session.warm = bool(state and state["cookies"])
+
+        for session_id in retired:
+            self._delete(session_id)
+        options = dict(session.options)
+        if state is not None:
+            options["storage_state"] = state
+        return session, options
+
+    def save(self, session, state):
+        """Stores a context's storage_state as its identity's state."""
+        if session is None or session.retired or state is None:
+            return
+        session.state = state
+        try:
+            save_browser_session(session.session_id, session.options, state, session.created_at,
+                                 session.last_used, session.pages, session.failures)
+        except Exception as e:
+            logger.error(f"Error saving browser session {session.session_id}: {e}")
+
+    def release(self, session, state=None):
+        """Hands a session back once its context is closed, saving the context's final state when given."""
+        if session is None:
+            return
+        with self._lock:
+            session.in_use = max(0, session.in_use - 1)
+        if session.retired:
+            self._delete(session.session_id)
+        elif state is not None:
+            self.save(session, state)
+
+    def _delete(self, session_id):
+        try:
+            delete_browser_session(session_id)
+        except Exception as e:
+            logger.error(f"Error deleting browser session {session_id}: {e}")
+
+    # --- Health ---
+    def record_load(self, session, seconds):
+        """Records a page that loaded and showed no block, timed from goto until the feed was ready."""
+        if session is None:
+            return
+        label = "warm" if session.warm else "cold"
+        metrics.observe("yad2bot_page_load_seconds", seconds, session=label)
+        with self._lock:
+            self.loads[label][0] += 1
+            self.loads[label][1] += seconds
+            session.pages += 1
+            session.failures = 0
+            session.warm = True
+
+    def record_failure(self, session, blocked=False):
+        """Counts a failed load; a block retires the identity at once, so its context is not reused."""
+        if session is None:
+            return
+        with self._lock:
+            if blocked:
+                if self._sessions is not None:
+                    self._retire(session, "blocked")
+            else:
+                session.failures += 1
+
+    # --- Stats ---
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values()) if self._sessions else []
+            loads = {label: list(values) for label, values in self.loads.items()}
+        stats = {
+            "sessions": len(sessions),
+            "with_cookies": sum(1 for session in sessions if session.state and session.state.get("cookies")),
+            "created": self.created,
+            "retired": self.retired,
+        }
+        for label, (count, total) in loads.items():
+            stats[f"{label}_loads"] = count
+            stats[f"{label}_avg_seconds"] = total / count if count else None
+        return stats
+
+    def log_stats(self):
+        if not self.enabled:
+            return
+        stats = self.stats()
+        averages = {label: f"{stats[f'{label}_avg_seconds']:.2f}s" if stats[f"{label}_loads"] else "n/a"
+                    for label in self.loads}
+        logger.info(f"🍪 Sessions: {stats['sessions']} identities ({stats['with_cookies']} with cookies), "
+                    f"{stats['created']} created, {stats['retired']} retired | page load "
+                    f"warm {averages['warm']} ({stats['warm_loads']}) vs cold {averages['cold']} ({stats['cold_loads']})")
@@ -0,0 +1,25 @@
+"""Test setup: config reads the environment at import time, so it is set before any project module loads."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update({
+    "TELEGRAM_TOKEN": "0:test",
+    "LOG_FILE": "",
+    "ARCHIVE_DIR": "",
+    "METRICS_ENABLED": "0",
+    "DB_FILE": os.path.join(tempfile.mkdtemp(prefix="yad2test-"), "test.db"),
+})
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """The database module on a fresh, initialized database file."""
+    import database
+    database.close_connection()
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "test.db"))
+    database.init_db()
+    yield database
+    database.close_connection()
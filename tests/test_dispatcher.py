@@ -0,0 +1,33 @@
+from telebot.apihelper import ApiTelegramException
+
+import dispatcher
+
+class FakeBot:
+    """Rejects any message containing BAD the way Telegram rejects broken Markdown."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        if "BAD" in text:
+            raise ApiTelegramException("sendMessage", None,
+                                       {"error_code": 400, "description": "Bad Request: can't parse entities"})
+        self.sent.append(text)
+
+def test_bad_ad_in_a_digest_only_fails_itself(db, monkeypatch):
+    bot = FakeBot()
+    monkeypatch.setattr(dispatcher, "bot", bot)
+    monkeypatch.setattr(dispatcher, "TELEGRAM_CHAT_INTERVAL", 0)
+    db.add_user(1, "https://www.yad2.co.il/realestate/rent?city=5000")
+    db.set_user_digest(1, True)
+    db.enqueue_notifications([("a1", 1, "ad one", None), ("a2", 1, "ad BAD", None), ("a3", 1, "ad three", None)])
+
+    sender = dispatcher.Dispatcher()
+    while sender.run_once():
+        pass
+
+    assert sorted(bot.sent) == ["ad one", "ad three"]
+    assert sender.failed == 1
+    conn = db.get_connection()
+    assert conn.execute("SELECT ad_id, status FROM outbox").fetchall() == [("a2", "failed")]
+    assert sorted(row[0] for row in conn.execute("SELECT ad_id FROM notifications")) == ["a1", "a3"]
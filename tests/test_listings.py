@@ -0,0 +1,22 @@
+import datetime
+
+import scraper
+from listing import ListingCache
+
+def raw_item(ad_id, date_text):
+    return {"href": f"/realestate/item/{ad_id}", "date_text": date_text, "img_src": None,
+            "price": "5,000 ₪", "address": "הרצל 1", "city": "תל אביב", "rooms": "3 חדרים"}
+
+def test_bumped_ad_gets_its_new_date_on_a_cache_hit(monkeypatch):
+    monkeypatch.setattr(scraper, "listing_cache", ListingCache(100))
+    old = datetime.date.today() - datetime.timedelta(days=20)
+
+    first, = scraper.build_listings([raw_item("a1", old.strftime("%d/%m/%y"))])
+    assert first.date == old
+    scraper.listing_cache.take_dirty()
+
+    bumped, = scraper.build_listings([raw_item("a1", "עודכן היום")])
+    assert bumped.date == datetime.date.today()
+    assert scraper.listing_cache.hits == 1
+    # The new date is saved over the old one in the ads table
+    assert [listing.ad_id for listing in scraper.listing_cache.take_dirty()] == ["a1"]
@@ -0,0 +1,24 @@
+import time
+
+import scraper
+from listing import ListingCache
+
+DAY = 86400
+
+def test_dedup_row_of_an_ad_still_in_the_feed_survives_compaction_without_a_cache(db, monkeypatch):
+    monkeypatch.setattr(scraper, "listing_cache", ListingCache(0))  # LISTING_CACHE_SIZE=0
+    monkeypatch.setattr(scraper, "crawl_index", None)
+    now = time.time()
+    conn = db.get_connection()
+    with conn:
+        conn.executemany("INSERT INTO notifications (ad_id, user_id, notified_at) VALUES (?, '1', ?)",
+                         [("in_feed", now - 60 * DAY), ("gone", now - 60 * DAY)])
+
+    raw = {"href": "/realestate/item/in_feed", "date_text": "עודכן היום", "img_src": None,
+           "price": "5,000 ₪", "address": "הרצל 1", "city": "תל אביב", "rooms": "3 חדרים"}
+    scan = scraper.FeedScan("https://www.yad2.co.il/realestate/rent?city=5000", None)
+    scan.add(1, scraper.build_listings([raw]))
+    scraper.deliver_feed(scan.search_url, ["1"], scan)
+
+    db.compact_history(now - 30 * DAY, 100, pause=0)
+    assert [row[0] for row in conn.execute("SELECT ad_id FROM notifications")] == ["in_feed"]
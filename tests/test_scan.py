@@ -0,0 +1,40 @@
+import datetime
+
+import scraper
+from listing import Listing
+
+TODAY = datetime.date.today()
+OLD = TODAY - datetime.timedelta(days=scraper.MAX_AD_AGE_DAYS + 10)
+
+def ad(ad_id, date=TODAY):
+    return Listing(ad_id, f"https://www.yad2.co.il/item/{ad_id}", 5000, 3.0, date)
+
+def ids(listings):
+    return [listing.ad_id for listing in listings]
+
+def test_old_promoted_item_at_top_keeps_the_new_ads_below_it():
+    page = [ad("promo", OLD)] + [ad(f"new{i}") for i in range(5)] + [ad("seen")]
+    kept, examined, deeper = scraper.scan_page(page, {"seen"})
+    assert ids(kept) == ["promo", "new0", "new1", "new2", "new3", "new4"]
+    assert examined == len(page)
+    assert not deeper
+
+def test_run_of_old_items_ends_the_scan():
+    page = [ad("new")] + [ad(f"old{i}", OLD) for i in range(scraper.HWM_STOP_RUN)] + [ad("below")]
+    kept, examined, deeper = scraper.scan_page(page, set())
+    assert "below" not in ids(kept)
+    assert examined == 1 + scraper.HWM_STOP_RUN
+    assert not deeper
+
+def test_mark_only_covers_examined_items(db, monkeypatch):
+    monkeypatch.setattr(scraper, "crawl_index", None)
+    seen = [f"seen{i}" for i in range(scraper.HWM_STOP_RUN)]
+    page = [ad("promo", OLD), ad("new")] + [ad(ad_id) for ad_id in seen] + [ad("unexamined")]
+    scan = scraper.FeedScan("https://www.yad2.co.il/realestate/rent?city=5000", set(seen))
+    for url, limit in scan:
+        scan.add(len(page), page)
+
+    assert ids(scan.listings) == ["promo", "new"]
+    scraper.deliver_feed(scan.search_url, ["1"], scan)
+    state = db.load_search_state(scan.search_url)
+    assert state["seen_ids"] == ["promo", "new"] + seen
@@ -1,7 +1,8 @@
 import re
 from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 from telebot import types
-from config import logger
+from config import YAD2_ORIGIN, logger
 
 # --- Helper Functions ---
 def parse_hebrew_date(date_text):
@@ -41,9 +42,11 @@ def parse_hebrew_date(date_text):
         
     return None
 
+BASE_URL = f"{YAD2_ORIGIN}/realestate/rent"
+
 def construct_url(config):
     """Constructs the Yad2 URL based on configuration dictionary."""
-    base_url = "https://www.yad2.co.il/realestate/rent"
+    base_url = BASE_URL
     params = (
         f"city={config.get('city_code', '5000')}&"
         f"rooms={config.get('min_rooms', 1.5)}-{config.get('max_rooms', 3)}&"
@@ -52,11 +55,91 @@ def construct_url(config):
     )
     return f"{base_url}?{params}"
 
+def construct_city_url(city_code):
+    """Constructs the broad newest-first feed URL for a whole city (no price/rooms filter)."""
+    return f"{BASE_URL}?city={city_code}&order=1"
+
+def _parse_range(value, cast):
+    low, _, high = (value or "").partition("-")
+    try:
+        return cast(float(low)), cast(float(high))
+    except ValueError:
+        return None, None
+
+def parse_search_url(url):
+    """Recovers the structured filters (as built by construct_url) from a search URL, or None."""
+    params = dict(parse_qsl(urlparse(url).query))
+    if "city" not in params:
+        return None
+    min_price, max_price = _parse_range(params.get("price"), int)
+    min_rooms, max_rooms = _parse_range(params.get("rooms"), float)
+    if min_price is None or min_rooms is None:
+        return None
+    return {
+        "city_code": params["city"],
+        "min_price": min_price,
+        "max_price": max_price,
+        "min_rooms": min_rooms,
+        "max_rooms": max_rooms,
+    }
+
+def search_city(url):
+    """The city code of a search URL, or None."""
+    return dict(parse_qsl(urlparse(url).query)).get("city")
+
+def parse_price(price_text):
+    """'5,500 ₪' -> 5500; None when the ad has no numeric price."""
+    digits = re.sub(r"[^\d]", "", price_text or "")
+    return int(digits) if digits else None
+
+def parse_rooms(rooms_text):
+    """'3.5 חדרים • קומה 2' -> 3.5; None when no room count is shown."""
+    match = re.search(r"(\d+(?:\.\d+)?)\s*חדר", rooms_text or "")
+    return float(match.group(1)) if match else None
+
+def _normalize_param_value(value):
+    """Normalizes numeric values and ranges so '2.0-3' and '2-3.0' compare equal."""
+    parts = value.strip().split("-")
+    normalized = []
+    for part in parts:
+        try:
+            number = float(part)
+        except ValueError:
+            return value.strip()
+        normalized.append(str(int(number)) if number.is_integer() else str(number))
+    return "-".join(normalized)
+
+def normalize_search_url(url):
+    """Returns a canonical form of a Yad2 search URL, used to group identical searches."""
+    parsed = urlparse(url.strip())
+    params = sorted(
+        (key, _normalize_param_value(value))
+        for key, value in parse_qsl(parsed.query, keep_blank_values=False)
+    )
+    return urlunparse((
+        parsed.scheme.lower() or "https",
+        parsed.netloc.lower(),
+        parsed.path.rstrip("/"),
+        "",
+        urlencode(params, safe=",-"),
+        ""
+    ))
+
+def feed_page_url(search_url, page_number):
+    """Returns the URL of the given feed page (1-based) for a search URL."""
+    if page_number <= 1:
+        return search_url
+    parsed = urlparse(search_url)
+    params = [(k, v) for k, v in parse_qsl(parsed.query) if k != "page"]
+    params.append(("page", str(page_number)))
+    return urlunparse(parsed._replace(query=urlencode(params, safe=",-")))
+
 def get_main_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     btn_start = types.KeyboardButton("✅ הפעל התראות")
     btn_stop = types.KeyboardButton("🛑 עצור התראות")
     btn_new_filter = types.KeyboardButton("🔍 מסנן חדש")
+    btn_digest = types.KeyboardButton("📰 מצב תקציר")
     markup.add(btn_start, btn_stop)
-    markup.add(btn_new_filter)
+    markup.add(btn_new_filter, btn_digest)
     return markup
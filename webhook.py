@@ -0,0 +1,114 @@
+"""Webhook mode: Telegram POSTs updates to a local HTTP server instead of being long-polled.
+
+Run the bot with BOT_MODE=webhook and WEBHOOK_URL set to the public HTTPS URL
+that a reverse proxy forwards to WEBHOOK_LISTEN:WEBHOOK_PORT.
+"""
+import queue
+import secrets
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from telebot import types
+
+from config import (
+    bot, BOT_WORKERS, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_QUEUE_SIZE, logger
+)
+import metrics
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_UPDATE_BYTES = 1024 * 1024
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+# --- Handler Pool ---
+def chat_key(update):
+    """The chat an update belongs to, so one chat's updates are handled in order."""
+    if update.message is not None:
+        return update.message.chat.id
+    if update.callback_query is not None and update.callback_query.message is not None:
+        return update.callback_query.message.chat.id
+    return update.update_id
+
+class UpdatePool:
+    """Runs handlers on a fixed set of threads, each with its own bounded queue.
+
+    Updates are sharded by chat, so a chat's wizard steps run in order while
+    other chats proceed in parallel. put() never blocks: a full queue refuses
+    the update and the webhook answers 503, so Telegram redelivers it later
+    instead of the process piling up work.
+    """
+
+    def __init__(self, workers, max_queued):
+        self.queues = [queue.Queue(max(1, max_queued // workers)) for _ in range(workers)]
+
+    def start(self):
+        for i, updates in enumerate(self.queues):
+            threading.Thread(target=self._run, args=(updates,), name=f"bot-worker-{i}", daemon=True).start()
+
+    def put(self, update):
+        try:
+            self.queues[hash(chat_key(update)) % len(self.queues)].put_nowait(update)
+            return True
+        except queue.Full:
+            return False
+
+    def depth(self):
+        return sum(updates.qsize() for updates in self.queues)
+
+    def _run(self, updates):
+        while True:
+            update = updates.get()
+            try:
+                bot.process_new_updates([update])
+            except Exception as e:
+                logger.error(f"Error handling update {update.update_id}: {e}")
+
+# --- HTTP Endpoint ---
+class WebhookHandler(BaseHTTPRequestHandler):
+    def _respond(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        if not secrets.compare_digest(self.headers.get(SECRET_HEADER, ""), self.server.secret):
+            self._respond(403)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if not 0 < length <= MAX_UPDATE_BYTES:
+            self._respond(400)
+            return
+        try:
+            update = types.Update.de_json(self.rfile.read(length).decode("utf-8"))
+        except Exception as e:
+            logger.warning(f"Unreadable webhook update: {e}")
+            self._respond(400)
+            return
+
+        if self.server.pool.put(update):
+            metrics.inc("yad2bot_webhook_updates_total", outcome="queued")
+            self._respond(200)
+        else:
+            metrics.inc("yad2bot_webhook_updates_total", outcome="refused")
+            logger.warning(f"Handler queues full, refusing update {update.update_id} (Telegram will retry).")
+            self._respond(503)
+
+    def log_message(self, format, *args):
+        pass
+
+def run_webhook():
+    if not WEBHOOK_URL:
+        raise ValueError("BOT_MODE=webhook needs WEBHOOK_URL")
+
+    pool = UpdatePool(BOT_WORKERS, WEBHOOK_QUEUE_SIZE)
+    pool.start()
+    server = ThreadingHTTPServer((WEBHOOK_LISTEN, WEBHOOK_PORT), WebhookHandler)
+    server.daemon_threads = True
+    server.pool = pool
+    server.secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    metrics.gauge("yad2bot_webhook_queued", pool.depth, "Updates waiting for a handler thread.")
+
+    bot.set_webhook(url=WEBHOOK_URL, secret_token=server.secret, max_connections=WEBHOOK_MAX_CONNECTIONS,
+                    allowed_updates=ALLOWED_UPDATES)
+    logger.info(f"Bot started (webhook {WEBHOOK_URL} -> {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, {BOT_WORKERS} handler threads)...")
+    server.serve_forever()
@@ -0,0 +1,141 @@
+"""Scraper worker: claims due searches from the shared jobs table and scans them.
+
+Usage: python worker.py [--id NAME]
+
+Run any number of these, on one host or several sharing DB_FILE, next to
+bot_engine.py started with SCRAPER_MODE=workers.
+"""
+import os
+import time
+import socket
+import argparse
+import threading
+
+from config import (
+    SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL, SCHED_INITIAL_INTERVAL, SCHED_TARGET_NEW_PER_POLL,
+    PAGE_LOAD_BUDGET_PER_HOUR, SCHED_TICK, JOB_LEASE_TTL, JOB_MAX_RUNTIME, WORKER_BATCH, logger
+)
+from database import (
+    init_db, load_users, sync_jobs, claim_jobs, heartbeat_jobs, complete_job, release_job, job_stats,
+    scan_requests_pending, make_jobs_due
+)
+from scheduler import SearchScheduler
+from circuit_breaker import CLOSED
+from scraper import (
+    plan, run_searches, warm_listing_cache, take_rescans, backfill, sleep_until_requested, register_gauges, breaker, SKIPPED
+)
+import metrics
+
+# --- Lease Heartbeats ---
+class LeaseKeeper:
+    """Extends this worker's leases in the background while a batch runs.
+
+    Heartbeats stop once a batch has run for max_runtime, so a worker that hangs
+    mid-scan lets its jobs expire and other workers pick them up.
+    """
+
+    def __init__(self, owner, lease_ttl, max_runtime):
+        self.owner = owner
+        self.lease_ttl = lease_ttl
+        self.max_runtime = max_runtime
+        self._keys = set()
+        self._started = None
+        self._lock = threading.Lock()
+
+    def hold(self, keys):
+        with self._lock:
+            self._keys = set(keys)
+            self._started = time.time()
+
+    def clear(self):
+        with self._lock:
+            self._keys = set()
+            self._started = None
+
+    def run(self):
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                keys = set(self._keys)
+                started = self._started
+            if not keys:
+                continue
+            if time.time() - started > self.max_runtime:
+                logger.warning(f"Batch running for over {self.max_runtime:.0f}s, letting its leases expire.")
+                continue
+            try:
+                lost = keys - heartbeat_jobs(self.owner, keys, self.lease_ttl)
+                if lost:
+                    logger.warning(f"Lost leases on {len(lost)} job(s) to other workers: {', '.join(sorted(lost))}")
+            except Exception as e:
+                logger.error(f"Heartbeat error: {e}")
+
+# --- Worker Loop ---
+def finish_job(owner, scheduler, job, result):
+    """Stores a scanned job's next run, from the same adaptive interval rules as the embedded scheduler."""
+    if result is SKIPPED:
+        release_job(owner, job["search_key"])
+        return
+    if result is None:
+        due = scheduler.next_run(job, ok=False)
+    else:
+        new_ads, pages = result
+        if pages > 1:
+            scheduler.budget.consume(pages - 1)
+        due = scheduler.next_run(job, new_ads)
+    if not complete_job(owner, job["search_key"], due, job["interval"], job["rate"], job["last_run"]):
+        logger.warning(f"Lease on {job['search_key']} expired mid-scan; another worker may rescan it "
+                       f"(the outbox still sends each ad once).")
+
+def run_worker(owner):
+    # Only the interval rules and this worker's page-load budget are used; the queue lives in the jobs table
+    scheduler = SearchScheduler(
+        SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL, SCHED_INITIAL_INTERVAL, PAGE_LOAD_BUDGET_PER_HOUR,
+        target_per_poll=SCHED_TARGET_NEW_PER_POLL
+    )
+    keeper = LeaseKeeper(owner, JOB_LEASE_TTL, JOB_MAX_RUNTIME)
+    threading.Thread(target=keeper.run, daemon=True).start()
+    warm_listing_cache()
+    register_gauges()
+    metrics.stats_gauge("yad2bot_jobs", job_stats, "Shared jobs table: total, due, leased, expired, workers.")
+    logger.info(f"Scraper worker {owner} started...")
+
+    last_sync = 0.0
+    while True:
+        jobs = []
+        try:
+            if time.time() - last_sync >= SCHED_TICK or scan_requests_pending():
+                users = load_users()
+                searches = plan(users)
+                sync_jobs(searches, SCHED_INITIAL_INTERVAL)
+                last_sync = time.time()
+                rescans = take_rescans(searches)
+                if rescans:
+                    backfill(users, {user_id for requesters in rescans.values() for user_id in requesters})
+                    make_jobs_due(rescans)
+
+            limit = min(WORKER_BATCH if breaker.state == CLOSED else 1, int(scheduler.budget.available()))
+            if limit > 0 and not breaker.seconds_until_probe():
+                jobs = claim_jobs(owner, limit, JOB_LEASE_TTL)
+            if jobs:
+                logger.info(f"Claimed {len(jobs)} job(s) | queue {job_stats()}")
+                scheduler.budget.consume(len(jobs))
+                keeper.hold(job["search_key"] for job in jobs)
+                results = run_searches({job["search_key"]: job["user_ids"] for job in jobs}, yield_to_requests=True)
+                keeper.clear()
+                for job in jobs:
+                    finish_job(owner, scheduler, job, results.get(job["search_key"]))
+        except Exception as e:
+            keeper.clear()
+            logger.critical(f"Critical Worker Error: {e}")
+
+        if not jobs:
+            sleep_until_requested(max(1.0, min(SCHED_TICK / 6, breaker.seconds_until_probe() or SCHED_TICK)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scraper worker")
+    parser.add_argument("--id", default=f"{socket.gethostname()}:{os.getpid()}", help="Lease owner name (unique per worker)")
+    args = parser.parse_args()
+    init_db()
+    metrics.start_server()
+    run_worker(args.id)